@@ -1,20 +1,25 @@
 # app.py
 
+import functools
+import hmac
 import json
 import os
 import re
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, send_from_directory
 from flask_cors import CORS
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-from sklearn.decomposition import TruncatedSVD
-from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
 import random
-# Import NLTK for sentiment analysis
-import nltk
-import ssl
-import sys
+import threading
+import time
+from helpers import metrics, model_store
+from helpers.card_store import hard_filters, open_store
+from helpers.catalog import Catalog, CatalogSnapshot
+from helpers.image_pipeline import DEFAULT_VARIANT_DIR, MANIFEST_NAME, ImageManifest
+from helpers.ranking_config import RankingConfig
+from helpers.result_cache import ResultCache, canonical_filters, normalize_query
+from helpers.retrieval import build_retriever
+from helpers.sparse_index import fuse, normalize_scores
+from helpers.sentiment import analyze_sentiments, sentiment_store
 
 # Create Flask app
 app = Flask(__name__)
@@ -23,503 +28,550 @@ CORS(app)
 # Get current directory for file operations
 current_directory = os.path.dirname(os.path.abspath(__file__))
 
-# Fix SSL issues for NLTK download (common issue)
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
-
-# Download VADER lexicon directly
-print("Downloading VADER lexicon...")
-nltk.download('vader_lexicon')
-print("Download complete.")
-
-# Import the sentiment analyzer after downloading
-try:
-    from nltk.sentiment.vader import SentimentIntensityAnalyzer
-    sentiment_analyzer = SentimentIntensityAnalyzer()
-    print("Sentiment analyzer initialized successfully.")
-    
-    # Function to analyze sentiment of a text with improved credit card context
-    def analyze_sentiment(text):
-        if not text or text.strip() == "":
-            return {
-                "compound": 0,
-                "pos": 0.5,
-                "neu": 0.5,
-                "neg": 0,
-                "sentiment": "neutral",
-                "emoji": "😐"
-            }
-        
-        # First, get the base sentiment scores from VADER
-        scores = sentiment_analyzer.polarity_scores(text)
-        compound = scores['compound']
-        
-        # Credit card review specific analysis
-        text_lower = text.lower()
-        
-        # Define keyword patterns for credit card reviews
-        negative_keywords = [
-            'annual fee', 'expensive', 'high fee', 'too high', 'drawback', 
-            'downside', 'catch', 'problem', 'disappoint', 'not worth', 
-            'not happy', 'limited', 'fee', 'fees', 'cost', 'costly',
-            'not good', 'not great', 'beware', 'warn', 'caution', 
-            'better options', 'better card', 'could be better'
-        ]
-        
-        positive_keywords = [
-            'great', 'excellent', 'awesome', 'worth', 'best', 'love', 
-            'recommend', 'perfect', 'fantastic', 'amazing', 'valuable',
-            'benefits', 'reward', 'cash back', 'points', 'perks', 'no annual fee',
-            'free', 'bonus', 'satisfied', 'happy with'
-        ]
-        
-        # Check for mixed sentiment (both positive and negative aspects)
-        has_negative = any(keyword in text_lower for keyword in negative_keywords)
-        has_positive = any(keyword in text_lower for keyword in positive_keywords)
-        
-        # Special case for credit card reviews:
-        # If the review mentions positive aspects but also mentions fees/drawbacks,
-        # it should be considered mixed rather than purely positive
-        if has_positive and has_negative:
-            # Override the VADER compound score for mixed reviews
-            compound = 0  # Neutral compound score for mixed reviews
-            sentiment_type = "neutral"
-            emoji = "😐"
-        elif compound >= 0.05:
-            sentiment_type = "positive"
-            # Gradation of positive emojis
-            if compound >= 0.75:
-                emoji = "😍"  # Extremely positive
-            elif compound >= 0.5:
-                emoji = "😁"  # Very positive
-            else:
-                emoji = "🙂"  # Moderately positive
-        elif compound <= -0.05:
-            sentiment_type = "negative"
-            # Gradation of negative emojis
-            if compound <= -0.75:
-                emoji = "😡"  # Extremely negative
-            elif compound <= -0.5:
-                emoji = "😞"  # Very negative
-            else:
-                emoji = "😕"  # Moderately negative
-        else:
-            sentiment_type = "neutral"
-            emoji = "😐"  # Neutral
-
-        # Look for specific phrases that indicate conditional positivity
-        conditional_phrases = [
-            "if you", "for those who", "as long as", "assuming", 
-            "provided that", "only if", "when you", "depending on"
-        ]
-        
-        if any(phrase in text_lower for phrase in conditional_phrases) and compound > 0:
-            # Reviews with conditional statements are more nuanced
-            if compound > 0.5:  # If it was very positive, tone it down
-                compound = 0.3  # Make it only slightly positive
-                emoji = "🙂"
-                sentiment_type = "positive"
-            else:
-                compound = 0  # Otherwise make it neutral
-                emoji = "😐"
-                sentiment_type = "neutral"
-        
-        # Check for specific fee-related phrases that indicate mixed sentiment
-        fee_offset_phrases = ["annual fee", "worth the fee", "fee is worth", "justified", "offset"]
-        if "fee" in text_lower and any(phrase in text_lower for phrase in fee_offset_phrases):
-            # Reviews discussing fee-value tradeoffs are generally mixed
-            compound = 0
-            emoji = "😐"
-            sentiment_type = "neutral"
-        
-        return {
-            "compound": compound,
-            "pos": scores["pos"],
-            "neu": scores["neu"],
-            "neg": scores["neg"],
-            "sentiment": sentiment_type,
-            "emoji": emoji
-        }
-        
-except Exception as e:
-    print(f"Error setting up sentiment analysis: {str(e)}", file=sys.stderr)
-    # Fallback function for sentiment analysis if NLTK fails
-    def analyze_sentiment(text):
-        print("Using fallback sentiment analysis function.")
-        # Return a default neutral sentiment
-        return {
-            "compound": 0,
-            "pos": 0.5,
-            "neu": 0.5,
-            "neg": 0,
-            "sentiment": "neutral",
-            "emoji": "😐"
-        }
-
 # Load the dataset
-json_file_path = os.path.join(current_directory, 'dataset', 'dataset.json')
-with open(json_file_path, 'r') as file:
-    data = json.load(file)
-
-# Pre-extract fields for recommendation math
-card_names = [entry["name"] for entry in data]
-reviews = [entry.get("our_take_value", "") for entry in data]
-categories = [entry.get("category", "") for entry in data]
-annual_fees = [entry.get("annual_fee_value", "N/A") for entry in data]
-foreign_transaction_fees = [entry.get("foreign_transaction_fee_value", "N/A") for entry in data]
-min_credit_scores = [entry.get("credit_score_low", "N/A") for entry in data]
-issuers = [entry.get("issuer", "") for entry in data]
-user_reviews = ["     ".join(entry.get("user_reviews", [])) for entry in data]
-bonus_offers = [entry.get("bonus_offer_value", "") for entry in data]
-short_card_names = [entry.get("short_card_name", "") for entry in data]
-pros_value = [entry.get("pros_value", "") for entry in data]
-
-# Extract enhanced fields
-associated_airlines = [entry.get("associated_airlines", []) for entry in data]
-income_tiers = [entry.get("income_tier", "any") for entry in data]
-travel_value_scores = [entry.get("travel_value_score", 5.0) for entry in data]
+json_file_path = os.environ.get("CARD_MATCH_DATASET", model_store.DEFAULT_DATASET_PATH)
+# (a JSON file, or a columnar dataset directory read lazily column by column),
+# or a SQLAlchemy URL of a database loaded with helpers/sql_card_store.py
+card_store = open_store(os.environ.get("CARD_MATCH_CARD_STORE", json_file_path))
+data, dataset_sha = card_store.load()
+artifact_dir = os.environ.get("CARD_MATCH_ARTIFACTS", model_store.DEFAULT_ARTIFACT_DIR)
+
+# Similarity weights, SVD size, boosts, cutoff and keyword fusion for this
+# deployment (a JSON file in CARD_MATCH_RANKING_CONFIG; see helpers/ranking_config.py)
+ranking = RankingConfig.from_env()
+
+# Candidate retrieval for the similarity stage: "exact" scores every card,
+# "ivf" is an approximate index for large catalogues (tune with NLIST/NPROBE)
+def make_retriever(desc_matrix, review_matrix, previous=None):
+    return build_retriever(
+        os.environ.get("CARD_MATCH_RETRIEVAL", "exact"),
+        desc_matrix,
+        review_matrix,
+        weights=ranking.weights,
+        nlist=int(os.environ.get("CARD_MATCH_IVF_NLIST", 0)) or None,
+        nprobe=int(os.environ.get("CARD_MATCH_IVF_NPROBE", 8)),
+        previous=previous,
+    )
+
+# Load the fitted TF-IDF + SVD models, refitting only if no artifacts match the dataset
+def load_models(data, dataset_path, dataset_sha=None):
+    return model_store.load_or_fit(data, dataset_path, analyze_sentiments, artifact_dir,
+                                   ranking.n_components, dataset_sha=dataset_sha)
+
+models = load_models(data, json_file_path, dataset_sha)
+
+# The catalogue and everything derived from it. Requests read catalog.current
+# once and use that snapshot throughout; admin edits swap in a new one.
+catalog = Catalog(
+    CatalogSnapshot(data, models, make_retriever, dataset_sha=dataset_sha),
+    make_retriever,
+    # Only runs when the catalogue is refitted, never inside a request
+    metrics.timed("refit_sentiment", analyze_sentiments),
+    drift_threshold=float(os.environ.get("CARD_MATCH_REFIT_DRIFT", 0.2)),
+    n_components=ranking.n_components,
+)
+
+# Resized card image variants (python -m helpers.image_pipeline build), served
+# from /images/ unless a CDN base URL is given; cards without one keep image_url
+image_variant_dir = os.environ.get("CARD_MATCH_IMAGE_VARIANTS", DEFAULT_VARIANT_DIR)
+image_manifest = ImageManifest.load(image_variant_dir, os.environ.get("CARD_MATCH_IMAGE_BASE_URL", "/images/"))
 
 # Print some diagnostics
-print(f"Loaded {len(data)} cards.")
-print(f"Sample card: {card_names[0]}/{short_card_names[0]} category: {categories[0]} category: {categories[0]}")
-print(f"Enhanced fields sample: Airlines: {associated_airlines[0] if associated_airlines[0] else 'None'}, Income tier: {income_tiers[0]}, Travel value: {travel_value_scores[0]}")
-
-# Build TF-IDF + SVD matrices
-informed_description = [
-    f"{rev} {pros_value[i]} issuer: {issuers[i]} card name: {card_names[i]}/{short_card_names[i]} card name: {card_names[i]}/{short_card_names[i]} card name: {card_names[i]}/{short_card_names[i]} category: {categories[i]} category: {categories[i]}"
-    for i, rev in enumerate(reviews)
-]
-
-custom_stop_words = set(ENGLISH_STOP_WORDS)
-custom_stop_words.update(["card", "want", "credit"])
-
-vectorizer = TfidfVectorizer(stop_words=list(custom_stop_words))
-tfidf_matrix_raw = vectorizer.fit_transform(informed_description)
-svd = TruncatedSVD(n_components=130, random_state=42)
-tfidf_matrix = svd.fit_transform(tfidf_matrix_raw)
-
-user_review_vectorizer = TfidfVectorizer(stop_words=list(custom_stop_words))
-user_review_matrix_raw = user_review_vectorizer.fit_transform(user_reviews)
-user_svd = TruncatedSVD(n_components=130, random_state=42)
-user_review_matrix = user_svd.fit_transform(user_review_matrix_raw)
-
-def filter_by_credit_score(recommendations, credit_score):
-    if not credit_score or credit_score == "all" or credit_score == "not_relevant":
-        return recommendations
-
-    credit_score_minimums = {
-        "excellent": 750,
-        "good": 700,
-        "fair": 650,
-        "poor": 300
+snapshot = catalog.current
+print(f"Loaded {snapshot.size} cards from the {card_store.kind} card store.")
+print(f"Sample card: {snapshot.card_names[0]}/{snapshot.short_card_names[0]} category: {snapshot.categories[0]} category: {snapshot.categories[0]}")
+print(f"Enhanced fields sample: Airlines: {snapshot.associated_airlines[0] if snapshot.associated_airlines[0] else 'None'}, Income tier: {snapshot.income_tiers[0]}, Travel value: {snapshot.travel_value_scores[0]}")
+print(f"Indexed {len(snapshot.review_index)} user reviews.")
+print(f"Retrieval: {snapshot.retriever.stats()}")
+print(f"Image variants for {len(image_manifest)} cards.")
+del snapshot
+
+# Reload the catalogue in the background whenever dataset.json changes. Off unless
+# configured: every worker process would poll and reload the file on its own.
+# The development server (python app.py) watches every DEV_WATCH_INTERVAL seconds.
+WATCH_INTERVAL = float(os.environ.get("CARD_MATCH_WATCH_INTERVAL", 0))
+DEV_WATCH_INTERVAL = 2.0
+
+def start_watching(interval):
+    if interval > 0 and card_store.kind == "memory":
+        catalog.watch(json_file_path, load_models, interval)
+
+start_watching(WATCH_INTERVAL)
+
+# Shared secret for the /admin API; the API is disabled when unset
+ADMIN_TOKEN = os.environ.get("CARD_MATCH_ADMIN_TOKEN")
+
+# Correct misspelled and expand aliased query words the vectorizers don't know (0 disables)
+QUERY_REWRITE = os.environ.get("CARD_MATCH_QUERY_REWRITE", "1") != "0"
+
+# Largest number of queries accepted by /recommend/batch
+MAX_BATCH_SIZE = int(os.environ.get("CARD_MATCH_MAX_BATCH", 1000))
+
+# Ranked results of recent queries, so pagination doesn't re-run the pipeline
+result_cache = ResultCache(
+    max_entries=int(os.environ.get("CARD_MATCH_CACHE_SIZE", 256)),
+    ttl=float(os.environ.get("CARD_MATCH_CACHE_TTL", 300)),
+    max_bytes=int(os.environ.get("CARD_MATCH_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+)
+# Results ranked against an older snapshot are never served again
+catalog.on_swap = lambda snapshot: result_cache.clear()
+
+def warm_snapshot(snapshot):
+    """Build the spelling rewriter and keyword index this deployment uses, so no request waits for them"""
+    if QUERY_REWRITE:
+        snapshot.query_rewriter
+    if ranking.fusion != "dense":
+        snapshot.keyword_index(ranking.weights)
+
+# Every reload, refit and edit is warmed before it is swapped in; the startup snapshot right away
+catalog.warm = warm_snapshot
+catalog.warm_in_background()
+
+def airline_preference_boost(snapshot, airline_preference):
+    """Per-card score multipliers for the preferred airline.
+
+    Returns (factors, codes, reasons): codes[i] indexes the (reason, impact)
+    explanation in reasons for boosted cards and is -1 everywhere else.
+    """
+    factors = np.ones(snapshot.card_table.size)
+    codes = np.full(snapshot.card_table.size, -1, dtype=np.int8)
+    if not airline_preference or airline_preference == "none" or airline_preference == "not_relevant":
+        return factors, codes, []
+
+    boosts = ranking.airline_boost
+    reasons = [
+        # Direct match with card's airline association
+        (f"Card is associated with {airline_preference} airline", f"+{(boosts['direct']-1)*100:.0f}%"),
+        # Partial match
+        (f"Card has some benefits for {airline_preference} airline", f"+{(boosts['partial']-1)*100:.0f}%"),
+    ]
+    preference = airline_preference.lower()
+
+    direct = snapshot.card_table.has_airline(lambda airline: airline == preference)
+    partial = snapshot.card_table.has_airline(lambda airline: preference in airline) & ~direct
+
+    factors[direct] = boosts["direct"]
+    codes[direct] = 0
+    factors[partial] = boosts["partial"]
+    codes[partial] = 1
+    return factors, codes, reasons
+
+# Explanations of the travelFrequency boosts for travel cards, cash back cards and the rest
+TRAVEL_FREQUENCY_REASONS = {
+    # Strong boost for travel cards if user travels frequently
+    "frequent": ["Travel card is ideal for frequent travelers",
+                 "Card compatibility with frequent travel habits",
+                 "Card compatibility with frequent travel habits"],
+    # Moderate boost for travel cards if user travels occasionally
+    "occasional": ["Travel card benefits occasional travelers",
+                   "Card compatibility with occasional travel",
+                   "Card compatibility with occasional travel"],
+    # Cash back rewards suit rare travelers better than travel perks
+    "rare": ["Limited travel benefits for rare travelers",
+             "Cash back rewards better for those who rarely travel",
+             "Card compatibility with limited travel needs"],
+}
+
+def travel_frequency_boost(snapshot, travel_frequency):
+    """Per-card score multipliers for the user's travel frequency.
+
+    Returns (factors, codes, reasons) like airline_preference_boost.
+    """
+    factors = np.ones(snapshot.card_table.size)
+    codes = np.full(snapshot.card_table.size, -1, dtype=np.int8)
+    if not travel_frequency or travel_frequency == "dont-consider" or travel_frequency == "not_relevant":
+        return factors, codes, []
+
+    # (boost, explanation) for travel cards, cash back cards and the rest
+    boosts = ranking.travel_boosts(travel_frequency)
+    if boosts is None:
+        return factors, codes, []
+    options = list(zip(boosts, TRAVEL_FREQUENCY_REASONS[travel_frequency]))
+
+    reasons = [(reason, f"+{(boost_factor-1)*100:.0f}%") for boost_factor, reason in options]
+
+    is_travel_card = (snapshot.card_table.travel_score >= 7.0) | snapshot.card_table.has_category(
+        lambda category: "travel" in category or "miles" in category)
+    is_cash_back = snapshot.card_table.has_category(lambda category: "cash_back" in category)
+
+    codes[:] = np.where(is_travel_card, 0, np.where(is_cash_back, 1, 2))
+    factors[:] = np.array([boost_factor for boost_factor, _ in options])[codes]
+    return factors, codes, reasons
+
+def top_k_indices(scores, candidates, k):
+    """The k best-scoring candidate indices, best first (ties keep catalogue order)"""
+    if k <= 0 or len(candidates) == 0:
+        return candidates[:0]
+    if k < len(candidates):
+        # argpartition narrows the candidates down to the top k (plus any ties
+        # with the k-th score) before the small final sort
+        cand_scores = scores[candidates]
+        kth = np.argpartition(-cand_scores, k - 1)[k - 1]
+        candidates = candidates[cand_scores >= cand_scores[kth]]
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
+
+# Optional sections of a result payload included (and computed) per response profile
+RESPONSE_PROFILES = {
+    # Card fields and scores only
+    "minimal": frozenset(),
+    # Everything the results page renders
+    "standard": frozenset({"reviews", "match_factors", "metrics"}),
+    # Plus review scores repeated in the metrics and model constants; only on request
+    "debug": frozenset({"reviews", "match_factors", "metrics", "debug_metrics"}),
+}
+DEFAULT_PROFILE = "standard"
+
+def build_match(snapshot, i, user_input, sims, stage_scores, boosts, review_scores, ranked_reviews,
+                sections=RESPONSE_PROFILES[DEFAULT_PROFILE]):
+    """Result payload for card i, with the optional sections listed in sections"""
+    desc_sim, review_sim, final_sim = sims[:3]
+    sim = float(stage_scores[-1][i])
+    pct = int(min(sim * 100, 99))
+
+    match = {
+        "title":                     snapshot.card_names[i],
+        "category":                  snapshot.categories[i],
+        "annual_fee":                snapshot.annual_fees[i],
+        "foreign_transaction_fee_value": snapshot.foreign_transaction_fees[i],
+        "reward_rate_string_2018":   snapshot.data[i].get("reward_rate_string_2018", ""),
+        "intro_apr_check_value":     snapshot.data[i].get("intro_apr_check_value", ""),
+        "similarity_score":          sim,
+        "base_score":                float(final_sim[i]),  
+        "match_percentage":          pct,
+        "bonus_offer_value":         snapshot.bonus_offers[i],
+        "image_url":                 snapshot.data[i].get("image_url", ""),
+        "associated_airlines":       snapshot.associated_airlines[i],
+        "income_tier":               snapshot.income_tiers[i],
+        "travel_value_score":        snapshot.travel_value_scores[i],
     }
-    user_min_score = credit_score_minimums.get(credit_score, 0)
-    filtered = []
-
-    for rec in recommendations:
-        title = rec["title"]
-        idx = next((i for i,n in enumerate(card_names) if n == title), -1)
-        if idx == -1:
-            filtered.append(rec)
-            continue
 
-        card_req = min_credit_scores[idx]
-        try:
-            if card_req in (None, "N/A"):
-                filtered.append(rec)
-                continue
-            if isinstance(card_req, str) and card_req.isdigit():
-                card_req = int(card_req)
-            if user_min_score >= card_req:
-                filtered.append(rec)
-        except:
-            filtered.append(rec)
-
-    return filtered
-
-def filter_by_annual_fee(recommendations, annual_fee_preference):
-    try:
-        max_fee = int(annual_fee_preference)
-    except (TypeError, ValueError):
-        max_fee = 500  
-
-    # Don't filter if user says "Don't care"
-    if max_fee == 500:
-        return recommendations
-
-    filtered = []
-
-    for rec in recommendations:
-        title = rec.get("title", "")
-        idx = next((i for i, n in enumerate(card_names) if n == title), -1)
-        if idx == -1:
-            filtered.append(rec)
-            continue
-
-        fee_raw = annual_fees[idx]
-        try:
-            if fee_raw in (None, "N/A"):
-                continue 
-
-            fee_str = str(fee_raw).replace('$', '').strip().lower()
-            if "none" in fee_str or fee_str == "0":
-                fee_value = 0
-            else:
-                m = re.search(r'\d+', fee_str)
-                fee_value = int(m.group()) if m else float('inf')
-
-            if max_fee == 0:
-                if fee_value == 0:
-                    filtered.append(rec)
-            elif fee_value <= max_fee:
-                filtered.append(rec)
-
-        except Exception:
-            continue  
-    return filtered
-
-def apply_airline_preference(recommendations, airline_preference):
-    """Apply a weighted adjustment based on the preferred airline"""
-    if not airline_preference or airline_preference == "none" or airline_preference == "not_relevant":
-        return recommendations
-    
-    for rec in recommendations:
-        title = rec["title"]
-        idx = next((i for i, n in enumerate(card_names) if n == title), -1)
-        if idx == -1:
-            continue
-        
-        airline_match = False
-        card_airlines = associated_airlines[idx] if idx < len(associated_airlines) else []
-        
-        if airline_preference.lower() in [airline.lower() for airline in card_airlines]:
-            # Direct match with card's airline association
-            airline_match = True
-            boost_factor = 1.15  # 15% boost
-            reason = f"Card is associated with {airline_preference} airline" 
-            impact = "+15%"
-        elif any(airline_preference.lower() in airline.lower() for airline in card_airlines):
-            # Partial match
-            airline_match = True
-            boost_factor = 1.10  # 10% boost
-            reason = f"Card has some benefits for {airline_preference} airline"
-            impact = "+10%"
-        
-        # Apply boost if there's a match
-        if airline_match:
-            # Store original score for explanation
-            original_score = rec["similarity_score"]
-            rec["similarity_score"] *= boost_factor
-            rec["match_percentage"] = min(int(rec["similarity_score"] * 100), 99)
-            
-            # Add explanation factor
-            if "match_factors" not in rec:
-                rec["match_factors"] = []
-            
-            rec["match_factors"].append({
-                "factor": reason,
-                "impact": impact,
-                "original_score": original_score,
-                "new_score": rec["similarity_score"]
+    variants = image_manifest.variants(snapshot.data[i])
+    if variants:
+        match["image_url"], match["image_srcset"] = variants
+
+    if "reviews" in sections or "debug_metrics" in sections:
+        top_raw_reviews = snapshot.review_index.top_reviews(i, review_scores, ranked_reviews)
+    if "reviews" in sections:
+        match["reviews"] = [{"text": r, "score": s, "sentiment": sent} for r, s, sent in top_raw_reviews[:3]]
+    if "match_factors" in sections:
+        match["match_factors"] = build_match_factors(snapshot, i, user_input, stage_scores, boosts)
+    if "metrics" in sections:
+        match["detailed_metrics"] = {
+            "description_similarity": float(desc_sim[i]),
+            "review_similarity": float(review_sim[i]),
+            "combined_similarity": float(final_sim[i]),
+            "description_weight": ranking.description_weight,
+            "review_weight": ranking.review_weight,
+        }
+        if len(sims) > 3:
+            # Hybrid ranking: the dense and keyword components of combined_similarity
+            dense_sim, keyword_sim = sims[3:]
+            match["detailed_metrics"].update({
+                "dense_similarity": float(dense_sim[i]),
+                "keyword_score": float(keyword_sim[i]),
+                "fusion": ranking.fusion,
             })
-    
-    return recommendations
-
-def apply_travel_frequency(recommendations, travel_frequency):
-    """Apply weighted adjustment based on travel frequency preference"""
-    if not travel_frequency or travel_frequency == "dont-consider" or travel_frequency == "not_relevant":
-        return recommendations
-    
-    for rec in recommendations:
-        title = rec["title"]
-        idx = next((i for i, n in enumerate(card_names) if n == title), -1)
-        if idx == -1:
-            continue
-        
-        # Get travel value score and category
-        travel_score = travel_value_scores[idx] if idx < len(travel_value_scores) else 5.0
-        category = categories[idx].lower() if idx < len(categories) else ""
-        
-        # Store original score for explanation
-        original_score = rec["similarity_score"]
-        boost_factor = 1.0
-        reason = ""
-        
-        # Apply different weights based on travel frequency
-        is_travel_card = travel_score >= 7.0 or "travel" in category or "miles" in category
-        is_cash_back = "cash_back" in category
-        
-        # Always apply a travel frequency multiplier when selected
-        if travel_frequency == "frequent":
-            if is_travel_card:
-                # Strong boost for travel cards if user travels frequently
-                boost_factor = 1.10
-                reason = "Travel card is ideal for frequent travelers"
-            else:
-                # Small boost for non-travel cards
-                boost_factor = 1.01
-                reason = "Card compatibility with frequent travel habits"
-        elif travel_frequency == "occasional":
-            if is_travel_card:
-                # Moderate boost for travel cards if user travels occasionally
-                boost_factor = 1.05
-                reason = "Travel card benefits occasional travelers"
-            else:
-                # Very small boost for non-travel cards
-                boost_factor = 1.01
-                reason = "Card compatibility with occasional travel"
-        elif travel_frequency == "rare":
-            if is_travel_card:
-                # Very small boost for travel cards with rare travelers
-                boost_factor = 1.01
-                reason = "Limited travel benefits for rare travelers"
-            elif is_cash_back:
-                # Small boost for cash back cards for rare travelers
-                boost_factor = 1.05
-                reason = "Cash back rewards better for those who rarely travel"
-            else:
-                boost_factor = 1.01
-                reason = "Card compatibility with limited travel needs"
-        
-        # Only apply and explain if there's a meaningful adjustment
-        if boost_factor != 1.0:
-            rec["similarity_score"] *= boost_factor
-            rec["match_percentage"] = min(int(rec["similarity_score"] * 100), 99)
-            
-            # Add explanation factor
-            if "match_factors" not in rec:
-                rec["match_factors"] = []
-            
-            impact = f"+{(boost_factor-1)*100:.0f}%"
-            
-            rec["match_factors"].append({
-                "factor": reason,
-                "impact": impact,
-                "original_score": original_score,
-                "new_score": rec["similarity_score"]
+            match["detailed_metrics"].update(
+                {"keyword_weight": ranking.keyword_weight} if ranking.fusion == "weighted" else {"rrf_k": ranking.rrf_k})
+        if "debug_metrics" in sections:
+            match["detailed_metrics"].update({
+                "svd_dimensions": ranking.n_components,
+                "top_review_scores": [{"score": float(s), "text": r, "sentiment": sent} 
+                                     for r, s, sent in top_raw_reviews[:3]]
             })
-    
-    return recommendations
+    return match
+
+def build_match_factors(snapshot, i, user_input, stage_scores, boosts):
+    """Explanations of why card i matched: keywords, categories, airlines and boosts"""
+    match_factors = []
+    query = snapshot.match_features.for_query(user_input)
+
+    tokens_in_common = [token for token, cards in query.keywords if cards[i]]
+    if tokens_in_common:
+        match_factors.append({
+            "factor": "Keyword match: " + ", ".join(tokens_in_common[:3]),
+            "impact": "Primary match factor"
+        })
 
-def get_recommendations(user_input, filters=None, offset=0, limit=3):
-    if filters is None:
-        filters = {}
+    matching_cats = [cat for cat, cards in query.categories if cards[i]]
+    if matching_cats:
+        match_factors.append({
+            "factor": "Category match: " + ", ".join(matching_cats),
+            "impact": "Category alignment"
+        })
 
-    # similarity on description
-    desc_vec = svd.transform(vectorizer.transform([user_input]))
-    review_vec = user_svd.transform(user_review_vectorizer.transform([user_input]))
-    desc_sim = cosine_similarity(desc_vec, tfidf_matrix).flatten()
-    review_sim = cosine_similarity(review_vec, user_review_matrix).flatten()
-    final_sim = 0.7 * desc_sim + 0.3 * review_sim
-
-    sorted_idx = np.argsort(-final_sim)
-    matches = []
-    for i in sorted_idx:
-        sim = float(final_sim[i])
-        pct = int(min(sim * 100, 99))
-        top_raw_reviews = []
-        for rev in data[i].get("user_reviews", []):
-            try:
-                rv = user_review_vectorizer.transform([rev])
-                rv_svd = user_svd.transform(rv)
-                score = float(cosine_similarity(review_vec, rv_svd).flatten()[0])
-                
-                # Apply improved sentiment analysis to each review
-                sentiment_data = analyze_sentiment(rev)
-                
-                top_raw_reviews.append((rev, score, sentiment_data))
-            except:
-                continue
-        top_raw_reviews.sort(key=lambda x: x[1], reverse=True)
-        reviews_out = [{"text": r, "score": s, "sentiment": sent} for r, s, sent in top_raw_reviews[:3]]
-
-        match_factors = []
-        
-        if len(user_input.split()) > 0:
-            user_tokens = set(user_input.lower().split())
-            card_desc = data[i].get("offer_details_value", "") + " " + data[i].get("rewards_rate_value", "")
-            tokens_in_common = []
-            words_to_exclude = ["credit", "card", "want"]
-            for token in user_tokens:
-                if token in card_desc.lower() and len(token) > 3 and token not in words_to_exclude:
-                    tokens_in_common.append(token)
-            
-            if tokens_in_common:
+    if query.airlines:
+        for airline, name in snapshot.match_features.airlines[i]:
+            if name in query.airlines:
                 match_factors.append({
-                    "factor": "Keyword match: " + ", ".join(tokens_in_common[:3]),
-                    "impact": "Primary match factor"
+                    "factor": f"Airline match: {airline}",
+                    "impact": "Airline affiliation"
                 })
-        
-        user_categories = [cat.strip() for cat in user_input.lower().split() if cat.strip() in ["travel", "cash back", "rewards", "miles", "hotel", "dining"]]
-        card_cats = categories[i].lower().split(", ")
-        matching_cats = [cat for cat in user_categories if any(cat in c for c in card_cats)]
-        
-        if matching_cats:
-            match_factors.append({
-                "factor": "Category match: " + ", ".join(matching_cats),
-                "impact": "Category alignment"
-            })
-            
-        if associated_airlines[i]:
-            for airline in associated_airlines[i]:
-                if airline.lower() in user_input.lower():
-                    match_factors.append({
-                        "factor": f"Airline match: {airline}",
-                        "impact": "Airline affiliation"
-                    })
-                    break
-
-        matches.append({
-            "title":                     card_names[i],
-            "category":                  categories[i],
-            "annual_fee":                annual_fees[i],
-            "foreign_transaction_fee_value": foreign_transaction_fees[i],
-            "reward_rate_string_2018":   data[i].get("reward_rate_string_2018", ""),
-            "intro_apr_check_value":     data[i].get("intro_apr_check_value", ""),
-            "similarity_score":          sim,
-            "base_score":                sim,  
-            "match_percentage":          pct,
-            "reviews":                   reviews_out,
-            "bonus_offer_value":         bonus_offers[i],
-            "image_url":                 data[i].get("image_url", ""),
-            "associated_airlines":       associated_airlines[i] if i < len(associated_airlines) else [],
-            "income_tier":               income_tiers[i] if i < len(income_tiers) else "any",
-            "travel_value_score":        travel_value_scores[i] if i < len(travel_value_scores) else 5.0,
-            "match_factors":             match_factors,
-            "detailed_metrics": {
-                "description_similarity": float(desc_sim[i]),
-                "review_similarity": float(review_sim[i]),
-                "combined_similarity": float(final_sim[i]),
-                "description_weight": 0.7,
-                "review_weight": 0.3,
-                "svd_dimensions": 130,
-                "top_review_scores": [{"score": float(s), "text": r, "sentiment": sent} 
-                                     for r, s, sent in top_raw_reviews[:3]]
-            }
+                break
+
+    # Explain each preference boost applied to this card, in order
+    for stage, (_, codes, reasons) in enumerate(boosts):
+        if codes[i] < 0:
+            continue
+        reason, impact = reasons[codes[i]]
+        match_factors.append({
+            "factor": reason,
+            "impact": impact,
+            "original_score": float(stage_scores[stage][i]),
+            "new_score": float(stage_scores[stage + 1][i])
         })
 
-    if filters.get("creditScore"):
-        matches = filter_by_credit_score(matches, filters["creditScore"])
-    if filters.get("annualFee"):
-        matches = filter_by_annual_fee(matches, filters["annualFee"])
-        
-    if filters.get("preferredAirline"):
-        matches = apply_airline_preference(matches, filters["preferredAirline"])
-    if filters.get("travelFrequency"):
-        matches = apply_travel_frequency(matches, filters["travelFrequency"])
-    
-    # Re-sort by adjusted similarity score
-    matches.sort(key=lambda x: x["similarity_score"], reverse=True)
-    
-    # Filter out cards with match percentage less than 10%
-    matches = [match for match in matches if match["match_percentage"] >= 10]
-    
-    total = len(matches)
-    return matches[offset:offset+limit], total
+    return match_factors
+
+class RankedResults(object):
+    """Every card that passed filtering for one query, ranked lazily.
+
+    Scoring, filtering and boosting happen up front on bare arrays. The
+    ranked order is only extended (with argpartition) as deep as the pages
+    requested so far, and each card's payload is built once and reused by
+    later pages, so a cached instance serves "load more" by slicing.
+    """
+
+    def __init__(self, snapshot, user_input, sims, stage_scores, boosts, candidates, review_vec):
+        self.snapshot = snapshot
+        self.user_input = user_input
+        self.sims = sims
+        self.stage_scores = stage_scores
+        self.scores = stage_scores[-1]
+        self.boosts = boosts
+        self.candidates = candidates
+        self.review_vec = review_vec
+        self.total = len(candidates)
+        self._order = candidates[:0]
+        self._review_scores = None
+        self._ranked_reviews = None
+        self._payloads = {}
+        self._lock = threading.Lock()
+        # Called with the size of each payload built, once this is in the result cache
+        self.on_grow = None
+
+        # Approximate footprint for the cache budget: the score arrays and the
+        # per-review scores built on first use; payloads are added as they are built
+        arrays = list(sims) + stage_scores[1:] + [codes for _, codes, _ in boosts] + [candidates]
+        self.nbytes = sum(a.nbytes for a in arrays) + 16 * len(snapshot.review_index)
+
+    def page(self, offset, limit, profile=DEFAULT_PROFILE):
+        """Result payloads for ranks offset .. offset + limit - 1"""
+        return list(self.iter_page(offset, limit, profile))
+
+    def iter_page(self, offset, limit, profile=DEFAULT_PROFILE):
+        """Yield the page's payloads one at a time, each as soon as it is built"""
+        sections = RESPONSE_PROFILES[profile]
+        offset = max(offset, 0)
+        k = offset + limit
+        with self._lock:
+            if k > len(self._order) and len(self._order) < self.total:
+                # rank at least twice as deep as before so paging stays cheap
+                with metrics.stage("sort"):
+                    self._order = top_k_indices(self.scores, self.candidates, max(k, 2 * len(self._order)))
+            page = self._order[offset:k]
+
+        for i in page:
+            # The lock is never held across a yield, so a slow stream consumer
+            # can't block other requests for the same cached query
+            built = 0
+            with self._lock:
+                # Reviews are only scored for profiles that return them
+                needs_reviews = "reviews" in sections or "debug_metrics" in sections
+                if needs_reviews and self._review_scores is None:
+                    with metrics.stage("reviews"):
+                        self._review_scores = self.snapshot.review_index.score(self.review_vec)
+                        self._ranked_reviews = self.snapshot.review_index.rank(self._review_scores)
+                if (i, profile) not in self._payloads:
+                    with metrics.stage("payload"):
+                        self._payloads[i, profile] = build_match(
+                            self.snapshot, i, self.user_input, self.sims, self.stage_scores, self.boosts,
+                            self._review_scores, self._ranked_reviews, sections)
+                    # Its JSON length, which is more than the payload's own objects take
+                    built = len(json.dumps(self._payloads[i, profile], default=str))
+                    self.nbytes += built
+                payload = self._payloads[i, profile]
+            if built and self.on_grow is not None:
+                self.on_grow(built)
+            yield payload
+
+def rank_cards(user_input, filters=None):
+    """Score, filter and boost every card for a query; cached by query and filters"""
+    if filters is None:
+        filters = {}
+    snapshot = catalog.current
+    cache_key = (snapshot.version, normalize_query(user_input), canonical_filters(filters))
+    ranked = result_cache.get(cache_key)
+    if ranked is None:
+        ranked = rank_queries([user_input], [filters], snapshot)[0]
+        ranked.on_grow = functools.partial(result_cache.grow, cache_key, ranked)
+        result_cache.put(cache_key, ranked)
+    return ranked
+
+def _per_query_values(filters_list, key, build):
+    """Apply build() to each query's filter value, once per distinct value.
+
+    Returns {row: result} for the queries that set the filter.
+    """
+    built = {}
+    results = {}
+    for row, filters in enumerate(filters_list):
+        value = filters.get(key)
+        if not value:
+            continue
+        value_key = json.dumps(value, sort_keys=True, default=str)
+        if value_key not in built:
+            built[value_key] = build(value)
+        results[row] = built[value_key]
+    return results
+
+def allowed_cards(snapshot, filters_list):
+    """(queries x cards) mask of the cards each query's hard filters allow.
+
+    The credit score and annual fee filters run in the card store (an
+    indexed query for a SQL store) once per distinct pair of limits, so
+    only the cards that pass are scored. None when no query has one.
+    """
+    limits_by_row = [hard_filters(filters) for filters in filters_list]
+    if all(limits is None for limits in limits_by_row):
+        return None
+    allowed = np.ones((len(filters_list), snapshot.size), dtype=bool)
+    masks = {}
+    for row, limits in enumerate(limits_by_row):
+        if limits is None:
+            continue
+        if limits not in masks:
+            masks[limits] = card_store.candidate_mask(
+                snapshot, min_credit_score=limits[0], max_annual_fee=limits[1])
+        allowed[row] = masks[limits]
+    return allowed
+
+def rank_queries(user_inputs, filters_list, snapshot=None):
+    """Rank every card for many queries at once.
+
+    Queries are spell-corrected and alias-expanded (see QueryRewriter),
+    then all vectorized together and scored with one matrix product
+    per similarity matrix, restricted to the cards their hard filters
+    allow; boosts are applied as (queries x cards) multipliers. Returns one RankedResults per query.
+    """
+    if snapshot is None:
+        snapshot = catalog.current
+    models = snapshot.models
+    user_inputs = [normalize_query(q) for q in user_inputs]
+    if QUERY_REWRITE:
+        with metrics.stage("rewrite"):
+            rewriter = snapshot.query_rewriter
+            user_inputs = [rewriter.rewrite(q) for q in user_inputs]
+    filters_list = [filters or {} for filters in filters_list]
+    n_queries = len(user_inputs)
+    if n_queries == 0:
+        return []
+
+    with metrics.stage("vectorize"):
+        desc_vecs = models.svd.transform(models.vectorizer.transform(user_inputs))
+        review_vecs = models.user_svd.transform(models.user_review_vectorizer.transform(user_inputs))
+    with metrics.stage("filter"):
+        allowed = allowed_cards(snapshot, filters_list)
+    keyword_scores = None
+    if ranking.fusion != "dense":
+        with metrics.stage("keywords"):
+            index = snapshot.keyword_index(ranking.weights)
+            if ranking.keyword_candidates:
+                allowed, keyword_scores = index.candidates(user_inputs, ranking.keyword_candidates, allowed)
+            else:
+                keyword_scores = index.scores(user_inputs)
+    with metrics.stage("similarity"):
+        # Cards the retriever didn't score are never ranked
+        desc_sim, review_sim, keep = snapshot.retriever.search(desc_vecs, review_vecs, allowed)
+        final_sim = ranking.description_weight * desc_sim + ranking.review_weight * review_sim
+        if keyword_scores is not None:
+            dense_sim = final_sim
+            keyword_sim = normalize_scores(keyword_scores, keep)
+            final_sim = fuse(ranking.fusion, dense_sim, keyword_sim, keep, ranking.keyword_weight, ranking.rrf_k)
+
+    with metrics.stage("boost"):
+        # Each boost multiplies the previous stage's scores; queries without a
+        # boost get a factor of exactly 1 so their scores pass through unchanged
+        boost_stages = [
+            _per_query_values(filters_list, "preferredAirline", functools.partial(airline_preference_boost, snapshot)),
+            _per_query_values(filters_list, "travelFrequency", functools.partial(travel_frequency_boost, snapshot)),
+        ]
+        stage_scores = [final_sim]
+        for boosts_by_row in boost_stages:
+            factors = np.ones(final_sim.shape)
+            for row, (row_factors, _, _) in boosts_by_row.items():
+                factors[row] = row_factors
+            stage_scores.append(stage_scores[-1] * factors)
+        scores = stage_scores[-1]
+
+        # Filter out cards below the minimum match percentage
+        keep &= np.minimum(scores * 100, 99).astype(int) >= ranking.min_match_percentage
+
+    results = []
+    for row in range(n_queries):
+        # Only the stages whose boost this query actually asked for
+        applied = [stage for stage, boosts_by_row in enumerate(boost_stages) if row in boosts_by_row]
+        sims = (desc_sim[row], review_sim[row], final_sim[row])
+        if keyword_scores is not None:
+            sims += (dense_sim[row], keyword_sim[row])
+        results.append(RankedResults(
+            snapshot,
+            user_inputs[row],
+            sims,
+            [final_sim[row]] + [stage_scores[stage + 1][row] for stage in applied],
+            [boost_stages[stage][row] for stage in applied],
+            np.flatnonzero(keep[row]),
+            review_vecs[row:row + 1],
+        ))
+    return results
+
+def get_recommendations(user_input, filters=None, offset=0, limit=3, profile=DEFAULT_PROFILE):
+    ranked = rank_cards(user_input, filters)
+    return ranked.page(offset, limit, profile), ranked.total
+
+def get_recommendations_batch(requests):
+    """Batch counterpart of get_recommendations.
+
+    Takes a list of {"query", "filters", "offset", "limit", "profile"} dicts and returns
+    a (matches, total) tuple for each, in order. The batch is scored in one
+    pass and bypasses the result cache, so bulk jobs don't evict the
+    interactive traffic's entries.
+    """
+    ranked = rank_queries(
+        [req.get("query", "") for req in requests],
+        [req.get("filters") or {} for req in requests],
+    )
+    return [
+        (result.page(req.get("offset", 0), req.get("limit", 3),
+                     req.get("profile", DEFAULT_PROFILE)), result.total)
+        for req, result in zip(requests, ranked)
+    ]
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # Clients ask for a request's stage breakdown with an X-Debug-Timing header
+    g.timings = metrics.collect() if request.headers.get("X-Debug-Timing") else None
+
+@app.after_request
+def record_request_time(response):
+    start = g.pop("request_start", time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    timings = g.pop("timings", None)
+    if timings is not None:
+        metrics.stop_collecting()
+    if response.is_streamed:
+        # The body is generated after this returns: time the request once it has all been sent.
+        # A streamed body reports its own stage breakdown (see stream_recommendations).
+        response.call_on_close(lambda: metrics.request_seconds.observe(endpoint, time.perf_counter() - start))
+        return response
+
+    elapsed = time.perf_counter() - start
+    metrics.request_seconds.observe(endpoint, elapsed)
+    if timings is not None:
+        response.headers["X-Debug-Timing"] = metrics.format_timings(dict(timings, total=elapsed))
+    return response
 
 @app.route("/")
 def home():
@@ -530,6 +582,54 @@ def filter_cards():
     credit_score = request.form.get('credit-score')
     return render_template('base2.html', title="Card Match - Credit Card Recommender")
 
+def pagination(offset, limit, total):
+    return {
+        "offset": offset,
+        "limit": limit,
+        "total": total,
+        "has_more": (offset + limit) < total
+    }
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+def stream_recommendations(stream_format, query, filters, offset, limit, profile=DEFAULT_PROFILE):
+    """Stream each ranked card as soon as its payload is built, then the pagination.
+
+    ndjson: one {"recommendation": ...} object per line, then {"pagination": ...}.
+    sse: "recommendation" events, then a "pagination" event.
+
+    The headers go out before the body is generated, so a request sent with
+    X-Debug-Timing gets its stage breakdown as a last "timing" record
+    (milliseconds, including the payloads built while streaming) instead of
+    the response header.
+    """
+    start = g.get("request_start", time.perf_counter())
+    timings = g.get("timings")
+    ranked = rank_cards(query, filters)
+
+    def record(kind, body):
+        if stream_format == "sse":
+            return f"event: {kind}\ndata: {app.json.dumps(body)}\n\n"
+        return app.json.dumps({kind: body}) + "\n"
+
+    def generate():
+        with metrics.collecting(timings):
+            for rec in ranked.iter_page(offset, limit, profile):
+                yield record("recommendation", rec)
+        yield record("pagination", pagination(offset, limit, ranked.total))
+        if timings is not None:
+            breakdown = dict(timings, total=time.perf_counter() - start)
+            yield record("timing", {name: round(seconds * 1000, 3) for name, seconds in breakdown.items()})
+
+    response = Response(generate(), mimetype=STREAM_FORMATS[stream_format])
+    # Ask reverse proxies not to buffer the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
 @app.route("/recommend", methods=["POST"])
 def recommend():
     data_in = request.get_json()
@@ -537,20 +637,177 @@ def recommend():
     filters = data_in.get("filters", {})
     offset = data_in.get("offset", 0)
     limit = data_in.get("limit", 3)
+    profile = data_in.get("profile", DEFAULT_PROFILE)
 
     if not query:
         return jsonify({"error": "No query provided"}), 400
+    if profile not in RESPONSE_PROFILES:
+        return jsonify({"error": f"Unknown profile: {profile}"}), 400
+
+    stream = data_in.get("stream")
+    if stream:
+        if stream not in STREAM_FORMATS:
+            return jsonify({"error": f"Unknown stream format: {stream}"}), 400
+        return stream_recommendations(stream, query, filters, offset, limit, profile)
     
-    recs, total = get_recommendations(query, filters, offset, limit)
-    return jsonify({
-        "recommendations": recs,
-        "pagination": {
-            "offset": offset,
-            "limit": limit,
-            "total": total,
-            "has_more": (offset + limit) < total
-        }
-    })
+    recs, total = get_recommendations(query, filters, offset, limit, profile)
+    with metrics.stage("serialize"):
+        return jsonify({
+            "recommendations": recs,
+            "pagination": pagination(offset, limit, total)
+        })
+
+@app.route("/recommend/batch", methods=["POST"])
+def recommend_batch():
+    """Score many /recommend requests in one pass: {"requests": [{query, filters, offset, limit, profile}, ...]}"""
+    data_in = request.get_json()
+    requests_in = data_in.get("requests") if isinstance(data_in, dict) else None
+    if not isinstance(requests_in, list):
+        return jsonify({"error": "Expected a list of requests"}), 400
+    if len(requests_in) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} requests per batch"}), 400
+
+    normalized = []
+    for req in requests_in:
+        req = req if isinstance(req, dict) else {}
+        normalized.append({
+            "query": req.get("query", ""),
+            "filters": req.get("filters") or {},
+            "offset": req.get("offset", 0),
+            "limit": req.get("limit", 3),
+            "profile": req.get("profile", DEFAULT_PROFILE),
+        })
+
+    valid = [req for req in normalized
+             if req["query"] and req["profile"] in RESPONSE_PROFILES]
+    outputs = iter(get_recommendations_batch(valid))
+    results = []
+    for req in normalized:
+        if not req["query"]:
+            results.append({"error": "No query provided"})
+            continue
+        if req["profile"] not in RESPONSE_PROFILES:
+            results.append({"error": f"Unknown profile: {req['profile']}"})
+            continue
+        recs, total = next(outputs)
+        results.append({
+            "recommendations": recs,
+            "pagination": pagination(req["offset"], req["limit"], total)
+        })
+    with metrics.stage("serialize"):
+        return jsonify({"results": results})
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness plus the version and build time of the catalogue snapshot being served"""
+    return jsonify({"status": "ok", "snapshot": catalog.current.info()})
+
+@app.route("/images/<path:filename>", methods=["GET"])
+def card_image_variant(filename):
+    """A card image variant; its name changes with its content, so it is cached for good"""
+    if filename == MANIFEST_NAME:
+        return jsonify({"error": "Not found"}), 404
+    response = send_from_directory(image_variant_dir, filename, max_age=365 * 24 * 3600)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Stage and request latency histograms, cache and catalogue metrics in Prometheus text format"""
+    snapshot = catalog.current
+    cache = result_cache.stats()
+    sentiments = sentiment_store.stats()
+    body = metrics.render(
+        gauges=[
+            ("card_match_catalog_cards", "Cards in the catalogue snapshot being served", snapshot.size),
+            ("card_match_catalog_reviews", "User reviews in the catalogue snapshot being served", len(snapshot.review_index)),
+            ("card_match_catalog_snapshot_version", "Version of the catalogue snapshot being served", snapshot.version),
+            ("card_match_catalog_drift", "Share of the catalogue folded in since the last fit", snapshot.drift),
+            ("card_match_result_cache_entries", "Queries held in the result cache", cache["entries"]),
+            ("card_match_result_cache_bytes", "Approximate size of the result cache", cache["bytes"]),
+            ("card_match_result_cache_hit_ratio", "Result cache hits per lookup", cache["hit_rate"]),
+            ("card_match_sentiment_cache_entries", "Review sentiments held in the sentiment cache", sentiments["entries"]),
+            ("card_match_sentiment_cache_hit_ratio", "Sentiment cache hits per lookup", sentiments["hit_rate"]),
+        ],
+        counters=[
+            ("card_match_result_cache_hits_total", "Result cache hits", cache["hits"]),
+            ("card_match_result_cache_misses_total", "Result cache misses", cache["misses"]),
+            ("card_match_result_cache_evictions_total", "Result cache entries evicted for space", cache["evictions"]),
+            ("card_match_sentiment_cache_hits_total", "Sentiment cache hits", sentiments["hits"]),
+            ("card_match_sentiment_cache_misses_total", "Sentiment cache misses", sentiments["misses"]),
+        ],
+    )
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+@app.route("/recommend/cache", methods=["GET"])
+def recommend_cache_stats():
+    """Hit/miss counters and occupancy of the query result cache"""
+    return jsonify(result_cache.stats())
+
+def admin_authorized():
+    token = request.headers.get("X-Admin-Token", "")
+    return ADMIN_TOKEN is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+def admin_edit(edit, *args):
+    """Run a catalogue edit for an /admin route and report the new snapshot"""
+    if not admin_authorized():
+        return jsonify({"error": "Admin API disabled or token invalid"}), 403
+    try:
+        snapshot = edit(*args)
+    except KeyError as e:
+        return jsonify({"error": f"Unknown card: {e.args[0]}"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"catalog": snapshot.info()})
+
+@app.route("/admin/cards/<path:name>", methods=["PUT"])
+def admin_upsert_card(name):
+    """Add or replace a card: the body is the card's dataset record"""
+    card = request.get_json(silent=True)
+    if isinstance(card, dict):
+        card = dict(card, name=name)
+    return admin_edit(catalog.upsert_card, card)
+
+@app.route("/admin/cards/<path:name>", methods=["DELETE"])
+def admin_remove_card(name):
+    return admin_edit(catalog.remove_card, name)
+
+@app.route("/admin/cards/<path:name>/reviews", methods=["POST"])
+def admin_add_reviews(name):
+    """Append user reviews to a card: {"reviews": ["...", ...]}"""
+    body = request.get_json(silent=True)
+    return admin_edit(catalog.add_reviews, name, body.get("reviews") if isinstance(body, dict) else None)
+
+@app.route("/admin/cards/<path:name>/reviews", methods=["DELETE"])
+def admin_remove_reviews(name):
+    """Remove a card's user reviews by exact text: {"reviews": ["...", ...]}"""
+    body = request.get_json(silent=True)
+    return admin_edit(catalog.remove_reviews, name, body.get("reviews") if isinstance(body, dict) else None)
+
+@app.route("/admin/catalog", methods=["GET"])
+def admin_catalog():
+    if not admin_authorized():
+        return jsonify({"error": "Admin API disabled or token invalid"}), 403
+    return jsonify({"catalog": catalog.current.info(), "drift_threshold": catalog.drift_threshold})
+
+@app.route("/admin/catalog/refit", methods=["POST"])
+def admin_refit():
+    """Start a full model refit in the background"""
+    if not admin_authorized():
+        return jsonify({"error": "Admin API disabled or token invalid"}), 403
+    started = catalog.refit()
+    return jsonify({"refit_started": started, "catalog": catalog.current.info()}), 202
+
+@app.route("/admin/catalog/save", methods=["POST"])
+def admin_save():
+    """Write the current catalogue back to the dataset file (or the card database)"""
+    if not admin_authorized():
+        return jsonify({"error": "Admin API disabled or token invalid"}), 403
+    if card_store.kind == "sql":
+        sha = catalog.dataset_sha = card_store.write([dict(card) for card in catalog.current.data])
+        return jsonify({"store": "sql", "dataset_sha256": sha})
+    sha = catalog.save(json_file_path)
+    return jsonify({"path": json_file_path, "dataset_sha256": sha})
 
 @app.route('/card-catch')
 def card_catch():
@@ -558,4 +815,7 @@ def card_catch():
     return render_template('card_catch.html')
 
 if __name__ == "__main__":
+    # Only the reloader's child process serves requests, so only it watches the dataset
+    if "CARD_MATCH_WATCH_INTERVAL" not in os.environ and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_watching(DEV_WATCH_INTERVAL)
     app.run(debug=True, host="0.0.0.0", port=5001)
\ No newline at end of file
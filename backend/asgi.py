@@ -0,0 +1,245 @@
+"""
+Production ASGI entry point for the Card Match app.
+
+    cd backend
+    uvicorn asgi:application --host 0.0.0.0 --port 5001
+
+Requests are accepted on an asyncio event loop. The ranking routes
+(/recommend and /recommend/batch) run the Flask app in a bounded worker
+pool, and every other route runs on a small thread pool. This keeps
+scoring from tying up connection handling, and gives the ranking routes:
+
+- backpressure: at most CARD_MATCH_MAX_PENDING ranking requests are
+  running or queued. Beyond that the server answers 503 with
+  Retry-After instead of queueing without bound.
+- timeouts: a ranking request that takes longer than
+  CARD_MATCH_REQUEST_TIMEOUT seconds gets a 504. Work that has not
+  started yet is cancelled.
+- graceful shutdown: once shutdown starts, new ranking requests get a
+  503. Running ones get up to CARD_MATCH_SHUTDOWN_GRACE seconds to
+  finish before the pools are stopped.
+
+CARD_MATCH_POOL picks the kind of worker pool:
+
+- "thread" (the default): NumPy releases the GIL for the matrix products.
+- "process": CARD_MATCH_POOL_WORKERS separate interpreters, each loading
+  the catalogue from the model artifacts, which are memory-mapped and so
+  shared. Worker processes see catalogue changes through the dataset
+  watcher (set CARD_MATCH_WATCH_INTERVAL; edit, then /admin/catalog/save),
+  not runtime admin edits, and
+  keep their own result caches and /metrics.
+
+Responses are buffered, so streamed /recommend responses arrive in one
+piece; use the Flask server for streaming.
+"""
+
+import asyncio
+import concurrent.futures
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import app as card_match
+
+POOL_KIND = os.environ.get("CARD_MATCH_POOL", "thread")
+POOL_WORKERS = int(os.environ.get("CARD_MATCH_POOL_WORKERS", 0)) or os.cpu_count() or 1
+MAX_PENDING = int(os.environ.get("CARD_MATCH_MAX_PENDING", 0)) or 4 * POOL_WORKERS
+REQUEST_TIMEOUT = float(os.environ.get("CARD_MATCH_REQUEST_TIMEOUT", 10))
+SHUTDOWN_GRACE = float(os.environ.get("CARD_MATCH_SHUTDOWN_GRACE", 30))
+
+# Routes whose work is scored in the bounded pool
+OFFLOADED_PATHS = frozenset({"/recommend", "/recommend/batch"})
+
+
+def wsgi_environ(scope, body):
+    """The WSGI environ for an ASGI HTTP request, without the stream objects (so it pickles)"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": POOL_KIND == "process",
+        "wsgi.run_once": False,
+        "card_match.body": body,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(environ):
+    """Run the Flask app on environ; returns (status code, headers, body bytes)"""
+    environ = dict(environ, **{"wsgi.input": io.BytesIO(environ["card_match.body"]),
+                               "wsgi.errors": sys.stderr})
+    response = []
+
+    def start_response(status, headers, exc_info=None):
+        response[:] = [int(status.split(" ", 1)[0]), headers]
+        return lambda data: chunks.append(data)
+
+    chunks = []
+    result = card_match.app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response[0], response[1], b"".join(chunks)
+
+
+def worker_ready():
+    """Runs in each process worker once this module (and so the app) is imported there"""
+    return os.getpid()
+
+
+def json_response(status, body, headers=()):
+    return status, [("Content-Type", "application/json")] + list(headers), json.dumps(body).encode("utf-8")
+
+
+class RecommendServer(object):
+    """ASGI application: admission control, timeouts and worker pools around the Flask app."""
+
+    def __init__(self, pool_kind=POOL_KIND, workers=POOL_WORKERS, max_pending=MAX_PENDING,
+                 timeout=REQUEST_TIMEOUT, shutdown_grace=SHUTDOWN_GRACE):
+        if pool_kind not in ("thread", "process"):
+            raise ValueError(f"Unknown pool {pool_kind!r}; expected thread or process")
+        self.pool_kind = pool_kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.shutdown_grace = shutdown_grace
+        # Ranking requests running or queued in the pool; only touched on the event loop
+        self.pending = 0
+        self.closing = False
+        self.pool = None
+        self.io_pool = None
+        self._idle = None
+
+    def start(self):
+        if self.pool_kind == "process":
+            # spawn: each worker imports the app itself instead of inheriting
+            # the parent's threads and locks through fork
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=worker_ready)
+        else:
+            self.pool = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="recommend")
+        self.io_pool = concurrent.futures.ThreadPoolExecutor(4, thread_name_prefix="wsgi")
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.closing = False
+
+    async def stop(self):
+        """Refuse new ranking work, let running requests finish, then stop the pools"""
+        self.closing = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.shutdown_grace)
+        except asyncio.TimeoutError:
+            print(f"{self.pending} ranking requests still running after {self.shutdown_grace}s; "
+                  f"shutting down anyway", file=sys.stderr)
+        # Only wait for the workers to exit when no request is still running on them
+        self.pool.shutdown(wait=self.pending == 0, cancel_futures=True)
+        self.io_pool.shutdown(wait=False, cancel_futures=True)
+        card_match.catalog.stop_watching()
+
+    def _release(self):
+        self.pending -= 1
+        if self.pending == 0:
+            self._idle.set()
+
+    async def rank(self, environ):
+        """Run a ranking request in the pool, or answer 503/504"""
+        if self.closing:
+            return json_response(503, {"error": "Server is shutting down"}, [("Retry-After", "5")])
+        if self.pending >= self.max_pending:
+            return json_response(503, {"error": "Server busy, try again shortly"}, [("Retry-After", "1")])
+
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        self._idle.clear()
+        future = self.pool.submit(call_wsgi, environ)
+        # Capacity is only released when the work itself is done (or cancelled
+        # before it started), not when the client stops waiting for it
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            return json_response(504, {"error": f"Request timed out after {self.timeout:g}s"})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope {scope['type']!r}")
+        if self.pool is None:
+            # Servers that don't run the lifespan protocol
+            self.start()
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        environ = wsgi_environ(scope, bytes(body))
+        start = time.perf_counter()
+        if scope["path"] in OFFLOADED_PATHS:
+            status, headers, payload = await self.rank(environ)
+        else:
+            status, headers, payload = await asyncio.get_running_loop().run_in_executor(
+                self.io_pool, call_wsgi, environ)
+        if status in (503, 504):
+            card_match.metrics.request_seconds.observe(f"{scope['path']} ({status})",
+                                                       time.perf_counter() - start)
+
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.start()
+                if self.pool_kind == "process":
+                    # Don't take traffic until the workers have loaded the catalogue
+                    await asyncio.gather(*(asyncio.wrap_future(self.pool.submit(worker_ready))
+                                           for _ in range(self.workers)))
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+application = RecommendServer()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(application, host="0.0.0.0", port=int(os.environ.get("PORT", 5001)))
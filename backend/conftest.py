@@ -0,0 +1,7 @@
+"""
+Test configuration: the tests import the app's modules as ``helpers.x``
+(and ``app``), like the app itself, so they run from this directory:
+
+    cd backend
+    python -m pytest -q tests
+"""
@@ -1,47 +1,149 @@
 import os
+from contextlib import contextmanager
+
 import sqlalchemy as db
 
+# Connection pool settings, overridable per handler
+DEFAULT_POOL = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    # Seconds before a pooled connection is replaced (MySQL drops idle ones after wait_timeout)
+    "pool_recycle": 1800,
+    # Test each connection on checkout so a dropped one is replaced, not handed out
+    "pool_pre_ping": True,
+    "pool_timeout": 30,
+}
+
+# Rows sent per executemany() batch by bulk_insert, and fetched per round trip by query_stream
+BATCH_SIZE = 1000
+
 class MySQLDatabaseHandler(object):
-    
+    """Pooled access to the app's database.
+
+    Every query runs on a connection checked out of the engine's pool and
+    returned to it when the query (or the ``query_stream`` block) is done.
+    Pass ``url`` (e.g. ``sqlite:///cards.db``) to use another database, such
+    as SQLite as a local stand-in for MySQL.
+    """
+
     IS_DOCKER = True if 'DB_NAME' in os.environ else False
 
-    def __init__(self,MYSQL_USER,MYSQL_USER_PASSWORD,MYSQL_PORT,MYSQL_DATABASE,MYSQL_HOST = "localhost"):
-        
+    def __init__(self,MYSQL_USER=None,MYSQL_USER_PASSWORD=None,MYSQL_PORT=None,MYSQL_DATABASE=None,MYSQL_HOST = "localhost",
+                 url=None, **pool):
+
         self.MYSQL_HOST = os.environ['DB_NAME'] if MySQLDatabaseHandler.IS_DOCKER else MYSQL_HOST
         self.MYSQL_USER = "admin" if MySQLDatabaseHandler.IS_DOCKER else MYSQL_USER
         self.MYSQL_USER_PASSWORD = "admin" if MySQLDatabaseHandler.IS_DOCKER else MYSQL_USER_PASSWORD
         self.MYSQL_PORT = 3306 if MySQLDatabaseHandler.IS_DOCKER else MYSQL_PORT
         self.MYSQL_DATABASE = "kardashiandb" if MySQLDatabaseHandler.IS_DOCKER else MYSQL_DATABASE
+        if url is None:
+            url = db.URL.create("mysql+pymysql", username=self.MYSQL_USER, password=self.MYSQL_USER_PASSWORD,
+                                host=self.MYSQL_HOST, port=self.MYSQL_PORT, database=self.MYSQL_DATABASE)
+        self.url = db.make_url(url)
+        self.pool = {**DEFAULT_POOL, **pool}
         self.engine = self.validate_connection()
 
     def validate_connection(self):
-        print(f"mysql+pymysql://{self.MYSQL_USER}:{self.MYSQL_USER_PASSWORD}@{self.MYSQL_HOST}:{self.MYSQL_PORT}/{self.MYSQL_DATABASE}")
-        return db.create_engine(f"mysql+pymysql://{self.MYSQL_USER}:{self.MYSQL_USER_PASSWORD}@{self.MYSQL_HOST}:{self.MYSQL_PORT}/{self.MYSQL_DATABASE}")
+        """Create the pooled engine; the logged URL never includes the password"""
+        print(f"Database: {self.url.render_as_string(hide_password=True)}")
+        if self.url.get_backend_name() == "sqlite" and self.url.database in (None, "", ":memory:"):
+            # An in-memory SQLite database only exists inside its one connection
+            return db.create_engine(self.url, poolclass=db.pool.StaticPool,
+                                    connect_args={"check_same_thread": False})
+        return db.create_engine(self.url, **self.pool)
 
     def lease_connection(self):
+        """A pooled connection; use it as ``with handler.lease_connection() as conn`` so it is returned"""
         return self.engine.connect()
-    
-    def query_executor(self,query):
-        conn = self.lease_connection()
-        if type(query) == list:
-            for i in query:
-                conn.execute(i)
-        else:
-            conn.execute(query)
-        
-
-    def query_selector(self,query):
-        conn = self.lease_connection()
-        data = conn.execute(query)
-        return data
+
+    @contextmanager
+    def transaction(self):
+        """A pooled connection in a transaction, committed on success and rolled back on error"""
+        with self.engine.begin() as conn:
+            yield conn
+
+    @staticmethod
+    def _statement(query):
+        return db.text(query) if isinstance(query, str) else query
+
+    def query_executor(self,query,params=None):
+        """Run a statement, or a list of statements, in one transaction"""
+        with self.transaction() as conn:
+            if type(query) == list:
+                for i in query:
+                    conn.execute(self._statement(i), params)
+            else:
+                conn.execute(self._statement(query), params)
+
+    def query_selector(self,query,params=None):
+        """All the rows of a query, fetched before its connection returns to the pool"""
+        with self.lease_connection() as conn:
+            return conn.execute(self._statement(query), params).fetchall()
+
+    @contextmanager
+    def query_stream(self,query,params=None,batch_size=BATCH_SIZE):
+        """The rows of a query from a server-side cursor, batch_size at a time.
+
+        Use as ``with handler.query_stream(query) as rows: for row in rows``;
+        the connection returns to the pool when the block exits, whether or
+        not every row was read.
+        """
+        with self.lease_connection() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+                self._statement(query), params)
+            try:
+                yield result
+            finally:
+                result.close()
+
+    def quote(self, identifier):
+        return self.engine.dialect.identifier_preparer.quote(identifier)
+
+    def bulk_insert(self,table,rows,batch_size=BATCH_SIZE,conn=None):
+        """Insert an iterable of dicts (all with the same keys) into table.
+
+        Rows are sent batch_size at a time with executemany, which the MySQL
+        driver turns into multi-row INSERT ... VALUES statements. Everything
+        is inserted in one transaction, or in conn's when one is given.
+        Returns the number of rows inserted.
+        """
+        if conn is None:
+            with self.transaction() as conn:
+                return self.bulk_insert(table, rows, batch_size, conn)
+
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return 0
+        columns = list(first)
+        statement = db.text(
+            f"INSERT INTO {self.quote(table)} ({', '.join(self.quote(c) for c in columns)}) "
+            f"VALUES ({', '.join(f':p{j}' for j in range(len(columns)))})"
+        )
+
+        count = 0
+        batch = [first]
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                conn.execute(statement, [{f"p{j}": r[c] for j, c in enumerate(columns)} for r in batch])
+                count += len(batch)
+                batch = []
+        if batch:
+            conn.execute(statement, [{f"p{j}": r[c] for j, c in enumerate(columns)} for r in batch])
+            count += len(batch)
+        return count
 
     def load_file_into_db(self,file_path  = None):
+        """Run the statements of an SQL script (init.sql by default) in one transaction"""
         if MySQLDatabaseHandler.IS_DOCKER:
             return
         if file_path is None:
             file_path = os.path.join(os.environ['ROOT_PATH'],'init.sql')
-        sql_file = open(file_path,"r")
-        sql_file_data = list(filter(lambda x:x != '',sql_file.read().split(";\n")))
+        with open(file_path,"r") as sql_file:
+            sql_file_data = [statement for statement in sql_file.read().split(";\n") if statement.strip()]
         self.query_executor(sql_file_data)
-        sql_file.close()
 
+    def dispose(self):
+        """Close every pooled connection (e.g. at shutdown, or after forking a worker)"""
+        self.engine.dispose()
@@ -0,0 +1,310 @@
+"""
+Reproducible benchmarks of the recommendation pipeline.
+
+For each scale, a synthetic catalogue of ``scale`` times the cards in
+dataset.json is generated from the real cards and saved to a temporary
+directory. Model artifacts are built for it, and then a fresh Python process
+imports the app against it and runs a fixed corpus of queries and filter
+combinations through:
+
+    get_recommendations        the ranking pipeline, every query cache cleared first
+    recommend                  POST /recommend via the Flask test client, caches cleared
+    recommend_cached           the same requests again, served from the result cache
+
+"Cleared" means the result cache and the snapshot's per-query memos
+(match features and spelling corrections), so each request does the full
+work. Review sentiment is never computed inside a request.
+
+Each scale reports p50/p95/p99/mean latency, sequential throughput, peak
+RSS and startup time (importing app.py with prebuilt artifacts) as JSON:
+
+    cd backend
+    python -m helpers.benchmark --scales 1 10 --out bench.json
+    python -m helpers.benchmark compare before.json after.json
+
+Everything is seeded, so two runs on the same machine measure the same
+work. The 1000x catalogue needs several GB of memory and disk.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from helpers import model_store
+
+DEFAULT_SCALES = (1, 10, 100, 1000)
+SEED = 4300
+
+# Queries like the ones typed into the search box
+QUERIES = [
+    "travel card with airline miles and lounge access",
+    "cash back on groceries and gas",
+    "no annual fee card for students",
+    "hotel rewards and free nights",
+    "low interest balance transfer",
+    "dining rewards restaurants",
+    "secured card to build credit",
+    "no foreign transaction fees for international travel",
+    "delta skymiles",
+    "best starter card",
+    "premium travel card with sapphire points",
+    "online shopping amazon rewards",
+]
+
+# Filter combinations the results page sends
+FILTER_SETS = [
+    {},
+    {"creditScore": "good"},
+    {"creditScore": "fair", "annualFee": "0"},
+    {"annualFee": "95", "preferredAirline": "american"},
+    {"preferredAirline": "delta", "travelFrequency": "frequent"},
+    {"travelFrequency": "occasional", "annualFee": "500", "creditScore": "excellent"},
+]
+
+# Fields copied from a random other card in synthetic copies, so filters and
+# boosts see a realistic mix instead of the same card repeated
+MIXED_FIELDS = ["annual_fee_value", "credit_score_low", "category", "associated_airlines",
+                "travel_value_score", "income_tier"]
+
+
+def synthetic_catalogue(cards, scale, seed=SEED):
+    """scale times as many cards: the originals plus perturbed, uniquely named copies"""
+    rng = random.Random(seed)
+    reviews = [review for card in cards for review in card.get("user_reviews", [])]
+    catalogue = [dict(card) for card in cards]
+    for copy in range(1, scale):
+        for card in cards:
+            synthetic = dict(card, name=f"{card['name']} #{copy}")
+            donor = cards[rng.randrange(len(cards))]
+            for field in MIXED_FIELDS:
+                if field in donor:
+                    synthetic[field] = donor[field]
+            if reviews:
+                count = len(card.get("user_reviews", []))
+                synthetic["user_reviews"] = rng.sample(reviews, min(count, len(reviews)))
+            catalogue.append(synthetic)
+    return catalogue
+
+
+def latency_summary(seconds):
+    """Percentiles (ms) and sequential throughput of a list of request durations"""
+    ms = np.asarray(seconds) * 1000
+    return {
+        "requests": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "throughput_rps": round(len(ms) / float(np.sum(seconds)), 1),
+    }
+
+
+def corpus():
+    return [(query, filters) for query in QUERIES for filters in FILTER_SETS]
+
+
+def run_worker(result_path, iterations, warmup):
+    """Benchmark the app in this process (env already points it at the catalogue)"""
+    start = time.perf_counter()
+    import app
+    startup = time.perf_counter() - start
+
+    requests = corpus()
+    client = app.app.test_client()
+
+    def clear_caches():
+        app.result_cache.clear()
+        app.catalog.current.clear_query_caches()
+
+    def timed(call):
+        durations = []
+        for round_number in range(warmup + iterations):
+            for query, filters in requests:
+                clear_caches()
+                t = time.perf_counter()
+                call(query, filters)
+                if round_number >= warmup:
+                    durations.append(time.perf_counter() - t)
+        return durations
+
+    def route(query, filters):
+        response = client.post("/recommend", json={"query": query, "filters": filters})
+        assert response.status_code == 200, response.status_code
+
+    pipeline = timed(lambda query, filters: app.get_recommendations(query, filters))
+    uncached = timed(route)
+
+    # Second request for each query hits the result cache
+    cached = []
+    for query, filters in requests * iterations:
+        clear_caches()
+        route(query, filters)
+        t = time.perf_counter()
+        route(query, filters)
+        cached.append(time.perf_counter() - t)
+
+    snapshot = app.catalog.current
+    result = {
+        "cards": snapshot.size,
+        "reviews": len(snapshot.review_index),
+        "retriever": snapshot.retriever.stats()["retriever"],
+        "startup_seconds": round(startup, 3),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "get_recommendations": latency_summary(pipeline),
+        "recommend": latency_summary(uncached),
+        "recommend_cached": latency_summary(cached),
+    }
+    with open(result_path, "w") as f:
+        json.dump(result, f)
+
+
+def run_scale(cards, scale, iterations, warmup, work_dir, env):
+    """Generate, build and benchmark one scale in fresh processes"""
+    scale_dir = os.path.join(work_dir, f"x{scale}")
+    os.makedirs(scale_dir)
+    dataset_path = os.path.join(scale_dir, "dataset.json")
+    artifact_dir = os.path.join(scale_dir, "artifacts")
+    result_path = os.path.join(scale_dir, "result.json")
+    with open(dataset_path, "w") as f:
+        json.dump(synthetic_catalogue(cards, scale), f)
+
+    env = dict(env, CARD_MATCH_DATASET=dataset_path, CARD_MATCH_ARTIFACTS=artifact_dir,
+               CARD_MATCH_SENTIMENT_CACHE=os.path.join(scale_dir, "sentiments.json"))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "helpers.model_store", "build",
+                    "--dataset", dataset_path, "--out", artifact_dir],
+                   cwd=model_store.BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    build_seconds = time.perf_counter() - start
+
+    subprocess.run([sys.executable, "-m", "helpers.benchmark", "worker", result_path,
+                    "--iterations", str(iterations), "--warmup", str(warmup)],
+                   cwd=model_store.BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    with open(result_path) as f:
+        result = json.load(f)
+    return dict({"scale": scale, "build_seconds": round(build_seconds, 3)}, **result)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=model_store.BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales=DEFAULT_SCALES, iterations=3, warmup=1, dataset_path=model_store.DEFAULT_DATASET_PATH,
+        out=None, keep=False):
+    with open(dataset_path) as f:
+        cards = json.load(f)
+    env = dict(os.environ, PYTHONHASHSEED="0", CARD_MATCH_WATCH_INTERVAL="0")
+    # Benchmark settings come from the command line, not the caller's shell
+    for name in ("CARD_MATCH_CARD_STORE", "CARD_MATCH_CACHE_SIZE", "CARD_MATCH_CACHE_TTL"):
+        env.pop(name, None)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "retrieval": env.get("CARD_MATCH_RETRIEVAL", "exact"),
+            "fusion": env.get("CARD_MATCH_FUSION", "dense"),
+            "keyword_candidates": int(env.get("CARD_MATCH_KEYWORD_CANDIDATES", 0)),
+            "iterations": iterations,
+            "warmup": warmup,
+            "requests_per_iteration": len(corpus()),
+        },
+        "results": [],
+    }
+    work_dir = tempfile.mkdtemp(prefix="card-match-bench-")
+    try:
+        for scale in scales:
+            print(f"Benchmarking {scale}x ({scale * len(cards)} cards)...", file=sys.stderr)
+            result = run_scale(cards, scale, iterations, warmup, work_dir, env)
+            report["results"].append(result)
+            print(f"  p50 {result['get_recommendations']['p50_ms']} ms, "
+                  f"p99 {result['get_recommendations']['p99_ms']} ms, "
+                  f"startup {result['startup_seconds']} s, peak RSS {result['peak_rss_mb']} MB",
+                  file=sys.stderr)
+    finally:
+        if keep:
+            print(f"Kept catalogues and artifacts in {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if out:
+        with open(out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+
+# Metrics compared by `compare`, all lower-is-better except throughput
+COMPARED = ["startup_seconds", "peak_rss_mb"] + [
+    f"{section}.{metric}"
+    for section in ("get_recommendations", "recommend", "recommend_cached")
+    for metric in ("p50_ms", "p99_ms", "throughput_rps")
+]
+
+
+def compare(before_path, after_path):
+    """Print the relative change of every compared metric, per scale"""
+    with open(before_path) as f:
+        before = {r["scale"]: r for r in json.load(f)["results"]}
+    with open(after_path) as f:
+        after = {r["scale"]: r for r in json.load(f)["results"]}
+
+    def value(result, key):
+        for part in key.split("."):
+            result = result[part]
+        return result
+
+    for scale in sorted(set(before) & set(after)):
+        print(f"{scale}x")
+        for key in COMPARED:
+            old, new = value(before[scale], key), value(after[scale], key)
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"  {key:38} {old:>10} -> {new:>10}  {change:+6.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Card Match recommendation pipeline")
+    commands = parser.add_subparsers(dest="command")
+
+    run_parser = commands.add_parser("run", help="benchmark synthetic catalogues (the default)")
+    compare_parser = commands.add_parser("compare", help="compare two benchmark reports")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    worker_parser = commands.add_parser("worker", help=argparse.SUPPRESS)
+    worker_parser.add_argument("result")
+
+    for p in (parser, run_parser):
+        p.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES))
+        p.add_argument("--dataset", default=model_store.DEFAULT_DATASET_PATH)
+        p.add_argument("--out", help="write the JSON report here instead of stdout")
+        p.add_argument("--keep", action="store_true", help="keep the generated catalogues")
+    for p in (parser, run_parser, worker_parser):
+        p.add_argument("--iterations", type=int, default=3)
+        p.add_argument("--warmup", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        compare(args.before, args.after)
+    elif args.command == "worker":
+        run_worker(args.result, args.iterations, args.warmup)
+    else:
+        run(args.scales, args.iterations, args.warmup, args.dataset, args.out, args.keep)
@@ -1,106 +1,243 @@
+"""
+Find a card-face image for every card in the dataset via Bing Images.
+
+Lookups run concurrently on asyncio: at most ``concurrency`` requests are
+in flight, a token bucket caps the request rate, and failed requests are
+retried with exponential backoff. Requests share one pooled HTTP session,
+so connections are reused. Results are cached on disk by card name, so a
+rerun only looks up cards it has not seen; the cache and the dataset are
+both written atomically.
+
+    cd backend
+    python -m helpers.card_face_finder --rate 2 --concurrency 8
+
+``--search-url`` points the finder at another server (e.g. a local stub)
+instead of Bing.
+"""
+
+import argparse
+import asyncio
 import json
-import time
+import os
 import random
+import tempfile
+import time
 import urllib.parse
+
 import requests
 from bs4 import BeautifulSoup
 
-# 1) load your dataset
-DATASET_PATH = '/Users/rpking/Documents/CS4300/4300-Flask-Template-JSON/backend/dataset/dataset.json'
-with open(DATASET_PATH, 'r') as f:
-    cards = json.load(f)
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_PATH = os.path.join(BACKEND_DIR, 'dataset', 'dataset.json')
+CACHE_PATH = os.path.join(BACKEND_DIR, 'dataset', 'card_face_cache.json')
 
-# 2) headers to mimic a real browser
+SEARCH_URL = 'https://www.bing.com/images/search?q={query}&FORM=HDRSC2'
+
+# headers to mimic a real browser
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
                   'AppleWebKit/537.36 (KHTML, like Gecko) '
                   'Chrome/114.0.0.0 Safari/537.36'
 }
 
-# 3) for each card, fetch the Bing Images page and parse the first thumbnail URL
-for card in cards:
-    name = card.get('name', '')
-    query = urllib.parse.quote_plus(f"{name} credit card logo")
-    url = f'https://www.bing.com/images/search?q={query}&FORM=HDRSC2'
-    
+# Responses worth retrying: rate limited or a server-side error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def write_json_atomic(path, obj, **kwargs):
+    """Write obj as JSON to a temporary file, then rename it over path."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=10)
-        resp.raise_for_status()
-    except requests.RequestException as e:
-        print(f"⚠️  Failed to fetch for '{name}': {e}")
-        card['image_url'] = None
-        continue
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, **kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 
-    soup = BeautifulSoup(resp.text, 'html.parser')
+def parse_image_url(html):
+    """The full-size URL of the first Bing Images result, or None."""
+    soup = BeautifulSoup(html, 'html.parser')
     first = soup.find('a', class_='iusc')
     if first and first.has_attr('m'):
         try:
-            meta = json.loads(first['m'])
-            card['image_url'] = meta.get('murl')
+            return json.loads(first['m']).get('murl')
         except Exception:
-            card['image_url'] = None
-    else:
-        card['image_url'] = None
+            return None
+    return None
 
-    print(f"→ {name}: {card['image_url']}")
-    # polite pause to avoid being blocked
-    time.sleep(random.uniform(1.0, 2.5))
 
-# 4) overwrite your original dataset with the new field injected
-with open(DATASET_PATH, 'w') as f:
-    json.dump(cards, f, indent=2)
+class TokenBucket(object):
+    """Allows ``rate`` acquisitions per second on average, in bursts of up to ``capacity``."""
 
-print("✅ dataset.json updated in place with image_url for each card.")
-import json
-import time
-import random
-import urllib.parse
-import requests
-from bs4 import BeautifulSoup
+    def __init__(self, rate, capacity=1, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
 
-# 1) load your dataset
-DATASET_PATH = 'dataset.json'
-with open(DATASET_PATH, 'r') as f:
-    cards = json.load(f)
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
 
-# 2) headers to mimic a real browser
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                  'AppleWebKit/537.36 (KHTML, like Gecko) '
-                  'Chrome/114.0.0.0 Safari/537.36'
-}
 
-# 3) for each card, fetch the Bing Images page and parse the first thumbnail URL
-for card in cards:
-    name = card.get('name', '')
-    query = urllib.parse.quote_plus(f"{name} credit card logo")
-    url = f'https://www.bing.com/images/search?q={query}&FORM=HDRSC2'
-    
-    try:
-        resp = requests.get(url, headers=HEADERS, timeout=10)
+class FaceCache(object):
+    """Card name -> image URL (None when the search found nothing), kept in a JSON file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def put(self, name, image_url):
+        self.entries[name] = image_url
+
+    def save(self):
+        if self.path:
+            write_json_atomic(self.path, self.entries, indent=2, ensure_ascii=False)
+
+
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CardFaceFinder(object):
+    """Looks up card images concurrently, politely and with retries."""
+
+    def __init__(self, search_url=SEARCH_URL, concurrency=8, rate=2.0, burst=1,
+                 retries=4, backoff=0.5, timeout=10):
+        self.search_url = search_url
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        # One connection pool shared by every request, sized for the concurrency
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(HEADERS)
+
+    def close(self):
+        self.session.close()
+
+    def _get(self, url):
+        resp = self.session.get(url, timeout=self.timeout)
+        if resp.status_code in RETRY_STATUSES:
+            retry_after = resp.headers.get('Retry-After')
+            raise RetryableError(f"HTTP {resp.status_code}",
+                                 float(retry_after) if retry_after and retry_after.isdigit() else None)
         resp.raise_for_status()
-    except requests.RequestException as e:
-        print(f"⚠️  Failed to fetch for '{name}': {e}")
-        card['image_url'] = None
-        continue
+        return resp.text
 
-    soup = BeautifulSoup(resp.text, 'html.parser')
-    first = soup.find('a', class_='iusc')
-    if first and first.has_attr('m'):
-        try:
-            meta = json.loads(first['m'])
-            card['image_url'] = meta.get('murl')
-        except Exception:
-            card['image_url'] = None
-    else:
-        card['image_url'] = None
+    async def fetch(self, url, bucket):
+        """GET url, retrying connection errors, timeouts and retryable statuses."""
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+            try:
+                # requests is blocking, so each request runs on a worker thread
+                return await asyncio.to_thread(self._get, url)
+            except (RetryableError, requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                if getattr(e, 'retry_after', None):
+                    delay = max(delay, e.retry_after)
+                await asyncio.sleep(delay)
+
+    async def find(self, name, bucket):
+        query = urllib.parse.quote_plus(f"{name} credit card logo")
+        html = await self.fetch(self.search_url.format(query=query), bucket)
+        return parse_image_url(html)
+
+    async def find_all(self, names, cache=None):
+        """Look up every name that is not cached yet.
+
+        Returns {name: image URL or None} for the lookups that succeeded and
+        records them in cache; names whose lookup failed are left out.
+        """
+        cache = cache if cache is not None else FaceCache()
+        bucket = TokenBucket(self.rate, self.burst)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        found = {}
+
+        async def lookup(name):
+            async with semaphore:
+                try:
+                    image_url = await self.find(name, bucket)
+                except (requests.RequestException, RetryableError) as e:
+                    print(f"⚠️  Failed to fetch for '{name}': {e}")
+                    return
+            found[name] = image_url
+            cache.put(name, image_url)
+            print(f"→ {name}: {image_url}")
+
+        pending = list(dict.fromkeys(name for name in names if name not in cache))
+        await asyncio.gather(*(lookup(name) for name in pending))
+        return found
+
+
+def update_dataset(dataset_path=DATASET_PATH, cache_path=CACHE_PATH, **options):
+    """Fill in image_url for every card from the cache and new lookups."""
+    start_time = time.time()
+    with open(dataset_path, 'r') as f:
+        cards = json.load(f)
+
+    cache = FaceCache(cache_path)
+    finder = CardFaceFinder(**options)
+    try:
+        found = asyncio.run(finder.find_all([card.get('name', '') for card in cards], cache))
+    finally:
+        # Keep whatever was fetched, even if the run was interrupted
+        cache.save()
+        finder.close()
+
+    for card in cards:
+        name = card.get('name', '')
+        # Cards whose lookup failed keep their current image
+        if name in cache:
+            card['image_url'] = cache.get(name)
 
-    print(f"→ {name}: {card['image_url']}")
-    # polite pause to avoid being blocked
-    time.sleep(random.uniform(1.0, 2.5))
+    write_json_atomic(dataset_path, cards, indent=2)
+    print(f"✅ {os.path.basename(dataset_path)} updated with image_url for each card: "
+          f"{len(found)} looked up in {time.time() - start_time:.1f} seconds.")
 
-# 4) overwrite your original dataset with the new field injected
-with open(DATASET_PATH, 'w') as f:
-    json.dump(cards, f, indent=2)
 
-print("✅ dataset.json updated in place with image_url for each card.")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find card-face images for the dataset")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--cache", default=CACHE_PATH)
+    parser.add_argument("--search-url", default=SEARCH_URL,
+                        help="URL template with a {query} placeholder")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=2.0, help="requests per second")
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--retries", type=int, default=4)
+    args = parser.parse_args()
+    update_dataset(args.dataset, args.cache, search_url=args.search_url,
+                   concurrency=args.concurrency, rate=args.rate, burst=args.burst,
+                   retries=args.retries)
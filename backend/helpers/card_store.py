@@ -0,0 +1,94 @@
+"""
+Where the card catalogue is stored, and the hard filters that run there.
+
+A card store loads the catalogue as (records, dataset sha) and gives the
+cards that pass a query's hard filters as a mask over the catalogue:
+minimum credit score, maximum annual fee, issuer and category.
+``rank_queries`` applies that mask before similarity scoring, so only
+those cards are scored.
+
+``MemoryCardStore`` is the dataset.json file (or a columnar directory)
+loaded into the worker, filtered with NumPy over the snapshot's CardTable.
+``helpers.sql_card_store.SQLCardStore`` keeps the catalogue in a database
+and runs the filters as indexed SQL queries.
+"""
+
+import numpy as np
+
+from helpers import columnar
+
+CREDIT_SCORE_MINIMUMS = {
+    "excellent": 750,
+    "good": 700,
+    "fair": 650,
+    "poor": 300
+}
+
+
+def min_credit_score(credit_score):
+    """The user's credit score from the creditScore filter, or None when it filters nothing"""
+    if not credit_score or credit_score == "all" or credit_score == "not_relevant":
+        return None
+    return CREDIT_SCORE_MINIMUMS.get(credit_score, 0)
+
+
+def max_annual_fee(annual_fee_preference):
+    """The fee limit from the annualFee filter, or None when it filters nothing"""
+    if not annual_fee_preference:
+        return None
+    try:
+        max_fee = int(annual_fee_preference)
+    except (TypeError, ValueError):
+        max_fee = 500
+    # "Don't care"
+    return None if max_fee == 500 else max_fee
+
+
+def hard_filters(filters):
+    """(min_credit_score, max_annual_fee) of a query's filters; None when neither applies"""
+    limits = (min_credit_score(filters.get("creditScore")), max_annual_fee(filters.get("annualFee")))
+    return None if limits == (None, None) else limits
+
+
+def table_mask(snapshot, min_credit_score=None, max_annual_fee=None, issuer=None, category=None):
+    """Mask of the snapshot's cards that pass the hard filters, from its CardTable"""
+    table = snapshot.card_table
+    mask = np.ones(table.size, dtype=bool)
+    if min_credit_score is not None:
+        # Cards without a usable minimum score are never filtered out
+        mask &= np.isnan(table.min_credit_score) | (min_credit_score >= table.min_credit_score)
+    if max_annual_fee is not None:
+        # Unknown fees are NaN, so they never pass either comparison
+        if max_annual_fee == 0:
+            mask &= table.annual_fee == 0
+        else:
+            mask &= table.annual_fee <= max_annual_fee
+    if issuer is not None:
+        mask &= np.array([card_issuer == issuer for card_issuer in snapshot.issuers], dtype=bool)
+    if category is not None:
+        mask &= table.has_category(lambda label: label == category.lower())
+    return mask
+
+
+class MemoryCardStore(object):
+    """The catalogue in a dataset file, loaded whole into each worker."""
+
+    kind = "memory"
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        return columnar.load_dataset(self.path)
+
+    def candidate_mask(self, snapshot, **limits):
+        return table_mask(snapshot, **limits)
+
+
+def open_store(location):
+    """SQLCardStore for a SQLAlchemy URL, MemoryCardStore for a dataset path"""
+    if "://" in location:
+        # SQLAlchemy is only imported when a database is actually used
+        from helpers.sql_card_store import SQLCardStore
+        return SQLCardStore.from_url(location)
+    return MemoryCardStore(location)
@@ -0,0 +1,95 @@
+import re
+
+import numpy as np
+
+
+def parse_annual_fee(fee_raw):
+    """Numeric annual fee; NaN when unknown and inf when no amount is given."""
+    if fee_raw in (None, "N/A"):
+        return np.nan
+    fee_str = str(fee_raw).replace('$', '').strip().lower()
+    if "none" in fee_str or fee_str == "0":
+        return 0.0
+    m = re.search(r'\d+', fee_str)
+    return float(m.group()) if m else np.inf
+
+
+def parse_credit_score(card_req):
+    """Numeric minimum credit score; NaN when the card has no usable minimum."""
+    if isinstance(card_req, bool) or card_req is None:
+        return np.nan
+    if isinstance(card_req, (int, float)):
+        return float(card_req)
+    if isinstance(card_req, str) and card_req.isdigit():
+        return float(card_req)
+    return np.nan
+
+
+def parse_travel_score(score):
+    try:
+        return float(score)
+    except (TypeError, ValueError):
+        return 5.0
+
+
+def encode_bitmask(sets):
+    """Encode one set of labels per card as rows of uint64 bit words.
+
+    Returns (vocab, bits) where bit j of a row is set when the card has
+    label vocab[j].
+    """
+    vocab = sorted(set().union(*sets)) if sets else []
+    position = {label: j for j, label in enumerate(vocab)}
+    n_words = max(1, (len(vocab) + 63) // 64)
+    bits = np.zeros((len(sets), n_words), dtype=np.uint64)
+    for i, labels in enumerate(sets):
+        for label in labels:
+            j = position[label]
+            bits[i, j // 64] |= np.uint64(1) << np.uint64(j % 64)
+    return vocab, bits
+
+
+class CardTable(object):
+    """Columnar view of the numeric and categorical card fields used for
+    filtering and boosting, parsed once when the catalogue is loaded.
+
+    Every column is a NumPy array with one row per card, in catalogue order.
+    """
+
+    def __init__(self, cards):
+        self.size = len(cards)
+        self.annual_fee = np.array(
+            [parse_annual_fee(card.get("annual_fee_value", "N/A")) for card in cards],
+            dtype=np.float64)
+        self.min_credit_score = np.array(
+            [parse_credit_score(card.get("credit_score_low", "N/A")) for card in cards],
+            dtype=np.float64)
+        self.travel_score = np.array(
+            [parse_travel_score(card.get("travel_value_score", 5.0)) for card in cards],
+            dtype=np.float64)
+
+        self.category_vocab, self.category_bits = encode_bitmask([
+            {c.strip() for c in card.get("category", "").lower().split(",") if c.strip()}
+            for card in cards
+        ])
+        self.airline_vocab, self.airline_bits = encode_bitmask([
+            {airline.lower() for airline in card.get("associated_airlines", [])}
+            for card in cards
+        ])
+
+    def _query_bits(self, vocab, bits, predicate):
+        query = np.zeros(bits.shape[1], dtype=np.uint64)
+        for j, label in enumerate(vocab):
+            if predicate(label):
+                query[j // 64] |= np.uint64(1) << np.uint64(j % 64)
+        return query
+
+    def has_category(self, predicate):
+        """Mask of cards with at least one category label matching predicate."""
+        query = self._query_bits(self.category_vocab, self.category_bits, predicate)
+        return (self.category_bits & query).any(axis=1)
+
+    def has_airline(self, predicate):
+        """Mask of cards with at least one (lowercased) airline matching predicate."""
+        query = self._query_bits(self.airline_vocab, self.airline_bits, predicate)
+        return (self.airline_bits & query).any(axis=1)
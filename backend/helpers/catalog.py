@@ -0,0 +1,411 @@
+"""
+The card catalogue and everything derived from it, as immutable snapshots.
+
+A CatalogSnapshot bundles the card records with the per-field lists,
+CardTable, fitted models, review index and retriever built from them.
+Nothing in a snapshot is modified after it is built: an edit builds a new
+snapshot and Catalog publishes it with a single reference assignment, so a
+request that took ``catalog.current`` once sees one consistent catalogue
+for its whole lifetime.
+
+Edits fold new or changed cards into the existing models (see
+model_store.fold_in). Once the folded-in share of the catalogue passes
+``drift_threshold``, the models are refitted from scratch in a background
+thread and swapped in the same way.
+
+Parts of a snapshot that only some deployments use (the spelling
+rewriter, the BM25 keyword index) are built on first use. Catalog's
+``warm(snapshot)`` hook builds the ones in use before every swap, and
+``warm_in_background`` does the same for the startup snapshot, so requests
+don't wait for them after a reload, refit or edit.
+
+``Catalog.watch`` polls the dataset file and rebuilds the catalogue from
+it in the background whenever its contents change. A replaced snapshot is
+simply dropped: requests still holding it finish on it, and it is freed
+once the last of them lets go.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from helpers import columnar, model_store
+from helpers.card_table import CardTable
+from helpers.keyword_matcher import KeywordMatcher
+from helpers.match_features import MatchFeatures
+from helpers.query_rewrite import QueryRewriter
+from helpers.review_index import ReviewIndex
+from helpers.sparse_index import KeywordIndex
+
+
+class CatalogSnapshot(object):
+    """One immutable version of the catalogue and its derived state.
+
+    ``retriever_factory(desc_matrix, review_matrix, previous)`` builds the
+    retriever; ``previous`` is the retriever of the snapshot this one was
+    folded from, or None after a full fit. ``previous_rewriter`` is the
+    QueryRewriter of the snapshot this one replaces, reused when the
+    vocabulary is the same (see QueryRewriter.from_models).
+    """
+
+    def __init__(self, data, models, retriever_factory, version=1, previous_retriever=None,
+                 fit_size=None, changes_since_fit=0, dataset_sha=None, previous_rewriter=None):
+        self.data = data
+        self.version = version
+        self.built_at = time.time()
+        self.dataset_sha = dataset_sha
+        self.fit_size = len(data) if fit_size is None else fit_size
+        self.changes_since_fit = changes_since_fit
+
+        # Pre-extract fields for recommendation math (views over a columnar dataset's files)
+        self.card_names = columnar.field(data, "name")
+        self.reviews = columnar.field(data, "our_take_value", "")
+        self.categories = columnar.field(data, "category", "")
+        self.annual_fees = columnar.field(data, "annual_fee_value", "N/A")
+        self.foreign_transaction_fees = columnar.field(data, "foreign_transaction_fee_value", "N/A")
+        self.issuers = columnar.field(data, "issuer", "")
+        self.bonus_offers = columnar.field(data, "bonus_offer_value", "")
+        self.short_card_names = columnar.field(data, "short_card_name", "")
+        self.pros_value = columnar.field(data, "pros_value", "")
+        self.associated_airlines = columnar.field(data, "associated_airlines", [])
+        self.income_tiers = columnar.field(data, "income_tier", "any")
+        self.travel_value_scores = columnar.field(data, "travel_value_score", 5.0)
+        self.index_by_name = {name: i for i, name in enumerate(self.card_names)}
+
+        # Parse fees, credit scores, categories and airlines into NumPy columns once
+        self.card_table = CardTable(data)
+        # Every catalogue airline (lowercased), for spotting airlines named in a query
+        self.airline_matcher = KeywordMatcher({airline: [airline] for airline in self.card_table.airline_vocab})
+        # Offer-text words, category and airline sets behind each result's match factors
+        self.match_features = MatchFeatures(data, self.card_table, self.airline_matcher)
+
+        self.models = models
+        # Every individual review's embedding and sentiment, computed once up front
+        self.review_index = ReviewIndex(
+            columnar.field(data, "user_reviews", []),
+            models.review_embeddings,
+            models.review_sentiments,
+        )
+        self.retriever = retriever_factory(models.tfidf_matrix, models.user_review_matrix,
+                                           previous_retriever)
+        # Built on first use, so startup doesn't wait for the spelling or keyword index
+        self._query_rewriter = None
+        self._previous_rewriter = previous_rewriter
+        self._keyword_indexes = {}
+        self._lazy_lock = threading.Lock()
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @property
+    def query_rewriter(self):
+        """QueryRewriter for the fitted vocabularies"""
+        with self._lazy_lock:
+            if self._query_rewriter is None:
+                self._query_rewriter = QueryRewriter.from_models(self.models, self._previous_rewriter)
+                self._previous_rewriter = None
+            return self._query_rewriter
+
+    @property
+    def reusable_rewriter(self):
+        """The rewriter a snapshot replacing this one can start from, if any"""
+        return self._query_rewriter or self._previous_rewriter
+
+    def keyword_index(self, weights):
+        """BM25 KeywordIndex of the card documents, with (description, review) field weights"""
+        with self._lazy_lock:
+            if weights not in self._keyword_indexes:
+                self._keyword_indexes[weights] = KeywordIndex.from_models(self.data, self.models, weights)
+            return self._keyword_indexes[weights]
+
+    def clear_query_caches(self):
+        """Forget the per-query memos (match features, spelling corrections), e.g. for cold benchmarks"""
+        self.match_features.for_query.cache_clear()
+        with self._lazy_lock:
+            if self._query_rewriter is not None:
+                self._query_rewriter.correct.cache_clear()
+
+    @property
+    def drift(self):
+        """Share of the catalogue folded in (added, changed or removed) since the last fit"""
+        return self.changes_since_fit / max(self.fit_size, 1)
+
+    def info(self):
+        return {
+            "version": self.version,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.built_at)),
+            "cards": self.size,
+            "reviews": len(self.review_index),
+            "models": self.models.source,
+            "drift": self.drift,
+        }
+
+
+def _validate_card(card):
+    if not isinstance(card, dict):
+        raise ValueError("A card must be a JSON object")
+    if not isinstance(card.get("name"), str) or not card["name"].strip():
+        raise ValueError("A card needs a non-empty \"name\"")
+    reviews = card.get("user_reviews", [])
+    if not isinstance(reviews, list) or not all(isinstance(r, str) for r in reviews):
+        raise ValueError("\"user_reviews\" must be a list of strings")
+
+
+def _validate_reviews(reviews):
+    if not isinstance(reviews, list) or not all(isinstance(r, str) and r.strip() for r in reviews):
+        raise ValueError("\"reviews\" must be a list of non-empty strings")
+
+
+class Catalog(object):
+    """Holder of the current CatalogSnapshot, with runtime edits and refits.
+
+    Edits are serialized by a writer lock; readers never lock and just use
+    ``current``. ``warm(snapshot)`` is called before every swap, to build
+    the snapshot's lazily built parts; ``on_swap(snapshot)`` after it.
+    """
+
+    def __init__(self, snapshot, retriever_factory, sentiments_fn,
+                 drift_threshold=0.2, on_swap=None, n_components=model_store.N_COMPONENTS, warm=None):
+        self.current = snapshot
+        # Hash of the dataset file as last loaded or saved
+        self.dataset_sha = snapshot.dataset_sha
+        self.retriever_factory = retriever_factory
+        self.sentiments_fn = sentiments_fn
+        self.drift_threshold = drift_threshold
+        self.on_swap = on_swap
+        self.warm = warm
+        # SVD dimensions of full refits
+        self.n_components = n_components
+        self._write_lock = threading.RLock()
+        self._refit_thread = None
+        self._watch_thread = None
+        self._stop_watching = threading.Event()
+
+    def _swap(self, snapshot):
+        if self.warm is not None:
+            self.warm(snapshot)
+        self.current = snapshot
+        if self.on_swap is not None:
+            self.on_swap(snapshot)
+
+    def warm_in_background(self):
+        """Warm the current snapshot in a background thread, e.g. right after startup"""
+        if self.warm is None:
+            return None
+        thread = threading.Thread(target=self.warm, args=(self.current,), name="catalog-warm", daemon=True)
+        thread.start()
+        return thread
+
+    def _fold(self, base, data, previous_rows, removed=0):
+        """Snapshot for data folded into base's models; caller holds the write lock"""
+        models = model_store.fold_in(base.models, data, previous_rows,
+                                     model_store.card_reviews(base.data), self.sentiments_fn)
+        changed = sum(1 for row in previous_rows if row < 0) + removed
+        return CatalogSnapshot(
+            data, models, self.retriever_factory,
+            version=self.current.version + 1,
+            previous_retriever=base.retriever,
+            previous_rewriter=base.reusable_rewriter,
+            fit_size=base.fit_size,
+            changes_since_fit=base.changes_since_fit + changed,
+        )
+
+    def _edit(self, edit):
+        """Apply edit(data) -> (new data, replaced card names), fold it in and swap"""
+        with self._write_lock:
+            snapshot = self.current
+            data, replaced = edit(list(snapshot.data))
+            rows = [snapshot.index_by_name.get(card["name"], -1) if card["name"] not in replaced else -1
+                    for card in data]
+            removed = len(set(snapshot.card_names) - {card["name"] for card in data})
+            new_snapshot = self._fold(snapshot, data, rows, removed)
+            self._swap(new_snapshot)
+        if new_snapshot.drift > self.drift_threshold:
+            self.refit()
+        return new_snapshot
+
+    def _position(self, data, name):
+        for i, card in enumerate(data):
+            if card["name"] == name:
+                return i
+        raise KeyError(name)
+
+    def upsert_card(self, card):
+        """Add a card, or replace the card with the same name"""
+        _validate_card(card)
+        card = dict(card)
+
+        def edit(data):
+            try:
+                data[self._position(data, card["name"])] = card
+            except KeyError:
+                data.append(card)
+            return data, {card["name"]}
+        return self._edit(edit)
+
+    def remove_card(self, name):
+        def edit(data):
+            del data[self._position(data, name)]
+            return data, set()
+        return self._edit(edit)
+
+    def add_reviews(self, name, reviews):
+        _validate_reviews(reviews)
+
+        def edit(data):
+            i = self._position(data, name)
+            data[i] = dict(data[i], user_reviews=list(data[i].get("user_reviews", [])) + reviews)
+            return data, {name}
+        return self._edit(edit)
+
+    def remove_reviews(self, name, reviews):
+        """Remove every review of the card whose text is in reviews"""
+        _validate_reviews(reviews)
+        unwanted = set(reviews)
+
+        def edit(data):
+            i = self._position(data, name)
+            kept = [r for r in data[i].get("user_reviews", []) if r not in unwanted]
+            data[i] = dict(data[i], user_reviews=kept)
+            return data, {name}
+        return self._edit(edit)
+
+    def replace(self, data, models, dataset_sha=None):
+        """Swap in a fully fitted catalogue"""
+        with self._write_lock:
+            snapshot = CatalogSnapshot(data, models, self.retriever_factory,
+                                       version=self.current.version + 1,
+                                       dataset_sha=dataset_sha,
+                                       previous_rewriter=self.current.reusable_rewriter)
+            self._swap(snapshot)
+        return snapshot
+
+    def refit(self, wait=False):
+        """Refit the models on the current catalogue in a background thread.
+
+        Edits made while the refit runs are folded into the refitted models
+        before the swap. Returns False if a refit is already running.
+        """
+        with self._write_lock:
+            if self._refit_thread is not None and self._refit_thread.is_alive():
+                return False
+            self._refit_thread = threading.Thread(target=self._refit, name="catalog-refit", daemon=True)
+            self._refit_thread.start()
+        if wait:
+            self._refit_thread.join()
+        return True
+
+    def _refit(self):
+        start_time = time.time()
+        base = self.current
+        try:
+            models = model_store.fit_models(base.data, self.sentiments_fn, self.n_components)
+        except Exception as e:
+            print(f"Catalogue refit failed: {str(e)}", file=sys.stderr)
+            return
+
+        with self._write_lock:
+            current = self.current
+            if current.data is base.data:
+                snapshot = CatalogSnapshot(base.data, models, self.retriever_factory,
+                                           version=current.version + 1, dataset_sha=base.dataset_sha,
+                                           previous_rewriter=current.reusable_rewriter)
+            else:
+                # Fold edits made during the refit into the new models; edited
+                # cards are new dict objects, unchanged ones are the same objects
+                fitted = CatalogSnapshot(base.data, models, self.retriever_factory, version=base.version,
+                                         previous_rewriter=current.reusable_rewriter)
+                rows = [fitted.index_by_name.get(card["name"], -1) for card in current.data]
+                rows = [row if row >= 0 and base.data[row] is card else -1
+                        for row, card in zip(rows, current.data)]
+                removed = len(set(base.card_names) - set(current.card_names))
+                snapshot = self._fold(fitted, current.data, rows, removed)
+            self._swap(snapshot)
+        print(f"Refitted catalogue of {snapshot.size} cards in {time.time() - start_time:.2f} seconds")
+
+    def save(self, path):
+        """Write the current catalogue to path (JSON or columnar), atomically"""
+        data = [dict(card) for card in self.current.data]
+        if columnar.is_columnar(path):
+            columnar.write_dataset(data, path)
+            self.dataset_sha = columnar.ColumnarDataset(path).source_sha
+            return self.dataset_sha
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        # The watcher must not reload a file we just wrote ourselves
+        self.dataset_sha = model_store.dataset_hash(path)
+        return self.dataset_sha
+
+    def reload(self, path, models_fn):
+        """Rebuild the catalogue from the dataset file if its contents changed.
+
+        models_fn(data, path, dataset_sha) returns fitted models for data.
+        Edits made through the admin API since the file was last loaded or
+        saved are replaced by the file's contents. Returns the new snapshot,
+        or None when the file is unchanged.
+        """
+        start_time = time.time()
+        data, dataset_sha = columnar.load_dataset(path)
+        if dataset_sha == self.dataset_sha:
+            return None
+
+        for card in data:
+            _validate_card(card)
+        models = models_fn(data, path, dataset_sha)
+        snapshot = self.replace(data, models, dataset_sha)
+        self.dataset_sha = dataset_sha
+        print(f"Reloaded {snapshot.size} cards from {path} as snapshot v{snapshot.version} "
+              f"in {time.time() - start_time:.2f} seconds")
+        return snapshot
+
+    def watch(self, path, models_fn, interval=2.0):
+        """Poll path every interval seconds and reload it after it changes.
+
+        A change is detected by the mtime, inode or size of the file (or of
+        a columnar dataset's manifest). The file is only read
+        once two polls agree, so a file that is still being written is not
+        loaded half-way; unreadable or invalid files are reported and the
+        current snapshot stays in place.
+        """
+        def signature():
+            try:
+                st = os.stat(columnar.signature_path(path))
+            except OSError:
+                return None
+            return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+        def poll():
+            # Unknown at first, so a change made during startup is still picked
+            # up; reload() skips the rebuild when the contents are the same
+            loaded = None
+            previous = signature()
+            while not self._stop_watching.wait(interval):
+                current = signature()
+                if current is not None and current != loaded and current == previous:
+                    try:
+                        self.reload(path, models_fn)
+                    except Exception as e:
+                        print(f"Could not reload {path}: {str(e)}", file=sys.stderr)
+                    loaded = current
+                previous = current
+
+        self._stop_watching.clear()
+        self._watch_thread = threading.Thread(target=poll, name="catalog-watch", daemon=True)
+        self._watch_thread.start()
+
+    def stop_watching(self):
+        self._stop_watching.set()
+        if self._watch_thread is not None:
+            self._watch_thread.join()
+            self._watch_thread = None
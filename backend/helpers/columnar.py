@@ -0,0 +1,340 @@
+"""
+Binary columnar storage for the card dataset.
+
+dataset.json is a list of ~80-key records, but a worker only reads a
+handful of those keys. A columnar dataset is a directory with one set of
+files per key, written by ``write_dataset`` (or helpers/data_to_json.py):
+
+    manifest.json          format version, row count, source hash, columns
+    c<j>.npy               numeric column j (int64 or float64)
+    c<j>.offsets.npy       string column j: row i is bytes[offsets[i]:offsets[i + 1]]
+    c<j>.bytes             ... its UTF-8 bytes, back to back
+    c<j>.rows.npy          list-of-strings column j: row i is items rows[i]:rows[i + 1]
+    c<j>.present.npy       rows that have the key, when some rows don't
+
+Every file is memory-mapped when its column is first read, and forked
+workers share the pages through the OS page cache. ``ColumnarDataset.records()``
+exposes the rows as read-only mappings that fetch fields on access, so code
+written against the JSON records (``card.get("name")``) works unchanged,
+and ``field`` gives one key of every row as a view that decodes on access.
+A CatalogSnapshot keeps its per-field lists and the review texts as such
+views. The fee, score and category columns, the offer text and the card
+names are still parsed once at load, into NumPy arrays and indexes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def _column_kind(values):
+    if all(isinstance(v, str) for v in values):
+        return "str"
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return "int"
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return "float"
+    if all(isinstance(v, list) and all(isinstance(item, str) for item in v) for v in values):
+        return "str_list"
+    return "json"
+
+
+def _write_strings(directory, stem, strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(os.path.join(directory, f"{stem}.offsets.npy"), offsets)
+    with open(os.path.join(directory, f"{stem}.bytes"), "wb") as f:
+        f.write(b"".join(encoded))
+
+
+def write_dataset(records, directory, source_sha=None):
+    """Write records (a list of dicts) as a columnar dataset in directory.
+
+    ``source_sha`` is the SHA-256 of the JSON file the records came from;
+    without one, a hash of the records' JSON encoding is recorded instead.
+    The files are written to a temporary directory that then replaces
+    ``directory``, and manifest.json is written last.
+    """
+    if source_sha is None:
+        source_sha = hashlib.sha256(
+            json.dumps(records, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    keys = {}
+    for record in records:
+        for key in record:
+            keys.setdefault(key, None)
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".columnar-")
+    try:
+        columns = []
+        for j, key in enumerate(keys):
+            stem = f"c{j}"
+            present = np.array([key in record for record in records], dtype=bool)
+            values = [record[key] for record in records if key in record]
+            kind = _column_kind(values)
+            column = {"name": key, "kind": kind, "file": stem, "sparse": not present.all()}
+            if column["sparse"]:
+                np.save(os.path.join(tmp_dir, f"{stem}.present.npy"), present)
+
+            # Rows without the key hold a placeholder, masked out by present
+            filled = iter(values)
+            if kind in ("int", "float"):
+                dtype = np.int64 if kind == "int" else np.float64
+                array = np.array([next(filled) if p else 0 for p in present], dtype=dtype)
+                np.save(os.path.join(tmp_dir, f"{stem}.npy"), array)
+            elif kind == "str_list":
+                lists = [next(filled) if p else [] for p in present]
+                rows = np.zeros(len(lists) + 1, dtype=np.int64)
+                np.cumsum([len(items) for items in lists], out=rows[1:])
+                np.save(os.path.join(tmp_dir, f"{stem}.rows.npy"), rows)
+                _write_strings(tmp_dir, stem, [item for items in lists for item in items])
+            else:
+                strings = [next(filled) if p else "" for p in present]
+                if kind == "json":
+                    strings = [json.dumps(s, ensure_ascii=False) for s in strings]
+                _write_strings(tmp_dir, stem, strings)
+            columns.append(column)
+
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "rows": len(records),
+            "source_sha256": source_sha,
+            "columns": columns,
+        }
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        if os.path.isdir(directory):
+            old_dir = tempfile.mkdtemp(dir=parent, prefix=".columnar-old-")
+            os.rename(directory, os.path.join(old_dir, "dataset"))
+            os.rename(tmp_dir, directory)
+            shutil.rmtree(old_dir)
+        else:
+            os.rename(tmp_dir, directory)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+class StringColumn(Sequence):
+    """Lazily decoded strings stored as offsets into one memory-mapped byte blob."""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+
+class StringListColumn(Sequence):
+    """Ragged column: row i is the list of strings items[rows[i]:rows[i + 1]]."""
+
+    def __init__(self, rows, items):
+        self.rows = rows
+        self.items = items
+
+    def __len__(self):
+        return len(self.rows) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.items[self.rows[i]:self.rows[i + 1]]
+
+
+class FieldColumn(Sequence):
+    """One key of every row of a ColumnarDataset, ``default`` where a row lacks it; decoded on access."""
+
+    def __init__(self, dataset, key, default=None):
+        self.dataset = dataset
+        self.key = key
+        self.default = default
+
+    def __len__(self):
+        return self.dataset.rows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if not self.dataset.has(self.key, i):
+            return self.default
+        return self.dataset.value(self.key, i)
+
+    def flat(self):
+        """(every item back to back, row offsets) for a list-of-strings key that every row has, else None"""
+        spec = self.dataset._specs.get(self.key)
+        if spec is None or spec["kind"] != "str_list" or spec["sparse"]:
+            return None
+        column = self.dataset.column(self.key)
+        return column.items, column.rows
+
+
+class ColumnarDataset(object):
+    """Read side of a columnar dataset directory; columns load on first use."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar dataset version in {directory}")
+        self.rows = self.manifest["rows"]
+        self.source_sha = self.manifest.get("source_sha256")
+        self._specs = {column["name"]: column for column in self.manifest["columns"]}
+        self.keys = list(self._specs)
+        self._columns = {}
+        self._present = {}
+        self._records = [None] * self.rows
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _strings(self, stem):
+        offsets = np.load(self._path(f"{stem}.offsets.npy"), mmap_mode="r")
+        if offsets[-1] == 0:
+            # np.memmap refuses empty files
+            return StringColumn(offsets, np.zeros(0, dtype=np.uint8))
+        return StringColumn(offsets, np.memmap(self._path(f"{stem}.bytes"), dtype=np.uint8, mode="r"))
+
+    def column(self, key):
+        """The whole column for key: an ndarray or a lazily decoded sequence"""
+        column = self._columns.get(key)
+        if column is None:
+            spec = self._specs[key]
+            stem = spec["file"]
+            if spec["kind"] in ("int", "float"):
+                column = np.load(self._path(f"{stem}.npy"), mmap_mode="r")
+            elif spec["kind"] == "str_list":
+                column = StringListColumn(np.load(self._path(f"{stem}.rows.npy"), mmap_mode="r"),
+                                          self._strings(stem))
+            else:
+                column = self._strings(stem)
+            self._columns[key] = column
+        return column
+
+    def has(self, key, i):
+        """Whether row i has key"""
+        spec = self._specs.get(key)
+        if spec is None:
+            return False
+        if not spec["sparse"]:
+            return True
+        present = self._present.get(key)
+        if present is None:
+            present = self._present[key] = np.load(self._path(f"{spec['file']}.present.npy"), mmap_mode="r")
+        return bool(present[i])
+
+    def value(self, key, i):
+        spec = self._specs[key]
+        value = self.column(key)[i]
+        if spec["kind"] == "int":
+            return int(value)
+        if spec["kind"] == "float":
+            return float(value)
+        if spec["kind"] == "json":
+            return json.loads(value)
+        return value
+
+    def records(self):
+        """The rows as a sequence of lazy, read-only record mappings"""
+        return ColumnarRecords(self)
+
+
+class ColumnarRecord(Mapping):
+    """Read-only view of one row; each field is read from its column on access."""
+
+    __slots__ = ("_dataset", "_row")
+
+    def __init__(self, dataset, row):
+        self._dataset = dataset
+        self._row = row
+
+    def __getitem__(self, key):
+        if not self._dataset.has(key, self._row):
+            raise KeyError(key)
+        return self._dataset.value(key, self._row)
+
+    def __iter__(self):
+        return (key for key in self._dataset.keys if self._dataset.has(key, self._row))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class ColumnarRecords(Sequence):
+    """All rows of a ColumnarDataset; the same view object is returned for a row every time."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return self.dataset.rows
+
+    def field(self, key, default=None):
+        return FieldColumn(self.dataset, key, default)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        record = self.dataset._records[i]
+        if record is None:
+            record = self.dataset._records[i] = ColumnarRecord(self.dataset, i)
+        return record
+
+
+def field(data, key, default=None):
+    """Every record's value for key (default when it has none).
+
+    Record sequences with a ``field`` method answer for themselves: for a
+    columnar dataset's records this is a FieldColumn, so the values stay in
+    the memory-mapped files. For a list of dicts it is a list.
+    """
+    if hasattr(data, "field"):
+        return data.field(key, default)
+    return [entry.get(key, default) for entry in data]
+
+
+def is_columnar(path):
+    return os.path.isdir(path)
+
+
+def signature_path(path):
+    """The file whose replacement marks a new version of the dataset at path"""
+    return os.path.join(path, "manifest.json") if is_columnar(path) else path
+
+
+def load_dataset(path):
+    """(records, sha256) for a JSON dataset file or a columnar dataset directory.
+
+    For a columnar dataset the hash is that of the JSON it was converted
+    from, so it matches model artifacts built from that JSON.
+    """
+    if is_columnar(path):
+        dataset = ColumnarDataset(path)
+        return dataset.records(), dataset.source_sha
+    with open(path, "rb") as f:
+        raw = f.read()
+    return json.loads(raw), hashlib.sha256(raw).hexdigest()
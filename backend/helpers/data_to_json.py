@@ -1,6 +1,14 @@
 import csv
+import hashlib
 import json
 import os
+import sys
+
+try:
+    from helpers.columnar import write_dataset
+except ImportError:
+    # Run as a script from inside helpers/
+    from columnar import write_dataset
 
 def csv_to_json(csv_file_path, json_file_path):
     # Create an empty list to store the rows as dictionaries
@@ -22,9 +30,33 @@ def csv_to_json(csv_file_path, json_file_path):
     
     print(f"Successfully converted {csv_file_path} to {json_file_path}")
 
+def json_to_columnar(json_file_path, columnar_dir):
+    """Convert a dataset JSON file into a columnar dataset directory (see helpers/columnar.py)"""
+    with open(json_file_path, 'rb') as json_file:
+        raw = json_file.read()
+    data = json.loads(raw)
+    # Recorded so model artifacts built from the JSON still match
+    write_dataset(data, columnar_dir, source_sha=hashlib.sha256(raw).hexdigest())
+    print(f"Successfully converted {json_file_path} to {columnar_dir}")
+
+def csv_to_columnar(csv_file_path, columnar_dir):
+    """Convert a CSV export straight into a columnar dataset directory"""
+    with open(csv_file_path, 'r', encoding='utf-8') as csv_file:
+        data = list(csv.DictReader(csv_file))
+    write_dataset(data, columnar_dir)
+    print(f"Successfully converted {csv_file_path} to {columnar_dir}")
+
 # Example usage
 if __name__ == "__main__":
     base_dir = os.path.dirname(os.path.abspath(__file__))
+    if len(sys.argv) == 4 and sys.argv[1] == "columnar":
+        # python data_to_json.py columnar <dataset.json or .csv> <output directory>
+        source, columnar_dir = sys.argv[2], sys.argv[3]
+        if source.endswith(".csv"):
+            csv_to_columnar(source, columnar_dir)
+        else:
+            json_to_columnar(source, columnar_dir)
+        sys.exit(0)
     csv_file_path = os.path.join(base_dir, "/Users/rpking/Documents/CS4300/4300-Flask-Template-JSON/CreditCardCardRaw - Main (1).csv")  # Replace with your CSV file path
     json_file_path = os.path.join(base_dir, "/Users/rpking/Documents/CS4300/4300-Flask-Template-JSON/backend/dataset/dataset.json")  # Replace with your desired JSON file path
     csv_to_json(csv_file_path, json_file_path)
@@ -0,0 +1,247 @@
+"""
+Offline evaluation of ranking configs against a labelled query set.
+
+Each labelled query (dataset/eval_queries.json by default) has optional
+filters and grades its relevant cards by name: 2 for the cards it is
+looking for, 1 for acceptable ones. Every other card counts as 0.
+
+For every config, model artifacts with its ``n_components`` are built
+(once per size), then a fresh Python process imports the app with
+CARD_MATCH_RANKING_CONFIG pointing at the config and replays each query
+through get_recommendations, with the query caches cleared. Reported per
+config, as JSON:
+
+    quality        mean NDCG@k, MRR@k and recall@k, plus each query's values
+    latency        get_recommendations percentiles and throughput
+    peak_rss_mb    of the worker process
+    model_mb       size of the embedding matrices and SVD components
+
+``--components`` runs every config once per SVD size, which is how to see
+what fewer dimensions cost in quality:
+
+    cd backend
+    python -m helpers.evaluate --components 130 96 64 32
+    python -m helpers.evaluate --configs prod.json candidate.json --out eval.json
+"""
+
+import argparse
+import json
+import math
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from helpers import model_store
+from helpers.benchmark import git_commit, latency_summary
+from helpers.ranking_config import ENV_OVERRIDES, RankingConfig
+
+DEFAULT_QUERIES_PATH = os.path.join(model_store.BACKEND_DIR, 'dataset', 'eval_queries.json')
+DEFAULT_K = 10
+# App settings outside RankingConfig that also change rankings; workers always run with their defaults
+RANKING_ENV = ["CARD_MATCH_QUERY_REWRITE", "CARD_MATCH_RETRIEVAL", "CARD_MATCH_IVF_NLIST",
+               "CARD_MATCH_IVF_NPROBE", "CARD_MATCH_CARD_STORE", "CARD_MATCH_RANKING_CONFIG"]
+
+
+def dcg(gains):
+    return sum((2 ** gain - 1) / math.log2(rank + 2) for rank, gain in enumerate(gains))
+
+
+def ndcg(ranked, relevant, k):
+    """NDCG@k of a ranked list of card names against {name: grade}"""
+    ideal = dcg(sorted(relevant.values(), reverse=True)[:k])
+    return dcg([relevant.get(name, 0) for name in ranked[:k]]) / ideal if ideal else 0.0
+
+
+def reciprocal_rank(ranked, relevant, k):
+    for rank, name in enumerate(ranked[:k], 1):
+        if relevant.get(name, 0) > 0:
+            return 1.0 / rank
+    return 0.0
+
+
+def recall(ranked, relevant, k):
+    wanted = {name for name, grade in relevant.items() if grade > 0}
+    return len(wanted.intersection(ranked[:k])) / len(wanted) if wanted else 0.0
+
+
+def load_queries(path, card_names=None):
+    """The labelled queries; ValueError when one grades a card that isn't in card_names"""
+    with open(path, 'r', encoding='utf-8') as f:
+        queries = json.load(f)
+    if card_names is not None:
+        for labelled in queries:
+            unknown = sorted(set(labelled["relevant"]) - set(card_names))
+            if unknown:
+                raise ValueError(f"Query {labelled['query']!r} grades unknown cards: {', '.join(unknown)}")
+    return queries
+
+
+def run_worker(queries_path, k, iterations, warmup, result_path):
+    """Evaluate the app's ranking config in this process (env already points it at the config)"""
+    start = time.perf_counter()
+    import app
+    startup = time.perf_counter() - start
+
+    queries = load_queries(queries_path, app.catalog.current.card_names)
+
+    def recommend(labelled):
+        app.result_cache.clear()
+        app.catalog.current.clear_query_caches()
+        matches, _ = app.get_recommendations(labelled["query"], labelled.get("filters"), limit=k,
+                                             profile="minimal")
+        return [match["title"] for match in matches]
+
+    per_query = []
+    for labelled in queries:
+        ranked = recommend(labelled)
+        per_query.append({
+            "query": labelled["query"],
+            "ndcg": round(ndcg(ranked, labelled["relevant"], k), 4),
+            "mrr": round(reciprocal_rank(ranked, labelled["relevant"], k), 4),
+            "recall": round(recall(ranked, labelled["relevant"], k), 4),
+            "results": len(ranked),
+        })
+
+    durations = []
+    for round_number in range(warmup + iterations):
+        for labelled in queries:
+            t = time.perf_counter()
+            recommend(labelled)
+            if round_number >= warmup:
+                durations.append(time.perf_counter() - t)
+
+    models = app.catalog.current.models
+    arrays = [models.tfidf_matrix, models.user_review_matrix, models.review_embeddings,
+              models.svd.components_, models.user_svd.components_]
+    result = {
+        "quality": {
+            f"ndcg@{k}": round(sum(q["ndcg"] for q in per_query) / len(per_query), 4),
+            f"mrr@{k}": round(sum(q["mrr"] for q in per_query) / len(per_query), 4),
+            f"recall@{k}": round(sum(q["recall"] for q in per_query) / len(per_query), 4),
+        },
+        "latency": latency_summary(durations),
+        "startup_seconds": round(startup, 3),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "model_mb": round(sum(a.nbytes for a in arrays) / 2 ** 20, 2),
+        "queries": per_query,
+    }
+    with open(result_path, "w") as f:
+        json.dump(result, f)
+
+
+def config_runs(config_paths, components):
+    """(label, settings) for every config, times every SVD size when components are given"""
+    configs = []
+    for path in config_paths or [None]:
+        if path is None:
+            configs.append(("default", {}))
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                configs.append((os.path.splitext(os.path.basename(path))[0], json.load(f)))
+    runs = []
+    for label, settings in configs:
+        for n in components or [None]:
+            if n is None:
+                runs.append((label, settings))
+            else:
+                runs.append((f"{label}@{n}", dict(settings, n_components=n)))
+    for _, settings in runs:
+        # Fail before building anything
+        RankingConfig(**settings)
+    return runs
+
+
+def run(config_paths=None, components=None, queries_path=DEFAULT_QUERIES_PATH, k=DEFAULT_K,
+        iterations=3, warmup=1, dataset_path=model_store.DEFAULT_DATASET_PATH, out=None):
+    runs = config_runs(config_paths, components)
+    env = dict(os.environ, PYTHONHASHSEED="0", CARD_MATCH_WATCH_INTERVAL="0",
+               CARD_MATCH_DATASET=dataset_path)
+    # Only the configs decide the ranking
+    ignored = sorted(name for name in list(ENV_OVERRIDES) + RANKING_ENV if name in env)
+    for name in ignored:
+        env.pop(name)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "queries": queries_path,
+            "k": k,
+            "iterations": iterations,
+            "warmup": warmup,
+            # Set in the caller's environment, but not passed on to the workers
+            "ignored_env": ignored,
+        },
+        "results": [],
+    }
+    work_dir = tempfile.mkdtemp(prefix="card-match-eval-")
+    try:
+        built = {}
+        for number, (label, settings) in enumerate(runs):
+            config = RankingConfig(**settings)
+            artifact_dir = os.path.join(work_dir, f"svd{config.n_components}")
+            if config.n_components not in built:
+                start = time.perf_counter()
+                subprocess.run([sys.executable, "-m", "helpers.model_store", "build", "--dataset", dataset_path,
+                                "--out", artifact_dir, "--components", str(config.n_components)],
+                               cwd=model_store.BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+                built[config.n_components] = round(time.perf_counter() - start, 3)
+
+            config_path = os.path.join(work_dir, f"config{number}.json")
+            result_path = os.path.join(work_dir, f"result{number}.json")
+            with open(config_path, "w") as f:
+                json.dump(config.to_dict(), f)
+            print(f"Evaluating {label}...", file=sys.stderr)
+            subprocess.run([sys.executable, "-m", "helpers.evaluate", "worker", result_path,
+                            "--queries", queries_path, "--k", str(k),
+                            "--iterations", str(iterations), "--warmup", str(warmup)],
+                           cwd=model_store.BACKEND_DIR, check=True, stdout=subprocess.DEVNULL,
+                           env=dict(env, CARD_MATCH_RANKING_CONFIG=config_path,
+                                    CARD_MATCH_ARTIFACTS=artifact_dir))
+            with open(result_path) as f:
+                result = json.load(f)
+            report["results"].append(dict({"config": label, "settings": config.to_dict(),
+                                           "build_seconds": built[config.n_components]}, **result))
+            quality = ", ".join(f"{name} {value}" for name, value in result["quality"].items())
+            print(f"  {quality}, p50 {result['latency']['p50_ms']} ms, "
+                  f"peak RSS {result['peak_rss_mb']} MB, models {result['model_mb']} MB", file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if out:
+        with open(out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate Card Match ranking configs on labelled queries")
+    commands = parser.add_subparsers(dest="command")
+    run_parser = commands.add_parser("run", help="evaluate ranking configs (the default)")
+    worker_parser = commands.add_parser("worker", help=argparse.SUPPRESS)
+    worker_parser.add_argument("result")
+
+    for p in (parser, run_parser):
+        p.add_argument("--configs", nargs="+", help="ranking config JSON files (default: the built-in defaults)")
+        p.add_argument("--components", type=int, nargs="+", help="run every config at each of these SVD sizes")
+        p.add_argument("--dataset", default=model_store.DEFAULT_DATASET_PATH)
+        p.add_argument("--out", help="write the JSON report here instead of stdout")
+    for p in (parser, run_parser, worker_parser):
+        p.add_argument("--queries", default=DEFAULT_QUERIES_PATH)
+        p.add_argument("--k", type=int, default=DEFAULT_K)
+        p.add_argument("--iterations", type=int, default=3)
+        p.add_argument("--warmup", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        run_worker(args.queries, args.k, args.iterations, args.warmup, args.result)
+    else:
+        run(args.configs, args.components, args.queries, args.k, args.iterations, args.warmup,
+            args.dataset, args.out)
@@ -0,0 +1,232 @@
+"""
+Pre-resized, modern-format variants of the card art for the results page.
+
+``static/images/cards/`` holds the card images at whatever size they were
+scraped, some of them several MB, while a result tile is only 200px wide.
+``build`` resizes every source image to a few fixed widths, encodes each
+width as AVIF and WebP, and writes the files under content-hashed names
+together with a manifest:
+
+    cd backend
+    python -m helpers.image_pipeline build
+
+Because a variant's name changes whenever its bytes do, the app serves the
+variants with an immutable, year-long Cache-Control header, and a CDN in
+front of it never has to revalidate them. ``ImageManifest`` maps each card
+to its variants at request time; cards without one keep their ``image_url``.
+
+Building needs Pillow (with AVIF support for the AVIF variants); reading the
+manifest does not.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import urllib.parse
+
+from helpers.columnar import load_dataset
+
+# Bump whenever the variant encoding or the manifest layout changes
+MANIFEST_VERSION = 1
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATASET_PATH = os.path.join(BACKEND_DIR, 'dataset', 'dataset.json')
+DEFAULT_SOURCE_DIR = os.path.join(BACKEND_DIR, 'static', 'images', 'cards')
+DEFAULT_VARIANT_DIR = os.path.join(BACKEND_DIR, 'static', 'images', 'variants')
+MANIFEST_NAME = 'manifest.json'
+
+# 1x and 2x of the 200px result tile
+DEFAULT_WIDTHS = (200, 400)
+
+# Preferred first: browsers take the first <source> type they support
+FORMATS = {
+    "avif": {"pillow": "AVIF", "mime": "image/avif", "options": {"quality": 55}},
+    "webp": {"pillow": "WEBP", "mime": "image/webp", "options": {"quality": 80, "method": 6}},
+}
+# The format of image_url itself, for clients that ignore the srcsets
+DEFAULT_FORMAT = "webp"
+
+SOURCE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif"}
+
+
+def card_slug(name):
+    """File name prefix of a card's scraped image"""
+    return name.lower().replace(" ", "_")
+
+
+def source_image_name(card, source_names):
+    """The file in the source directory that holds card's image, or None.
+
+    Scraped images are saved as ``<card slug>_<basename of image_url>``.
+    """
+    image_url = card.get("image_url") or ""
+    basename = os.path.basename(urllib.parse.urlparse(image_url).path)
+    name = f"{card_slug(card.get('name', ''))}_{basename}"
+    return name if basename and name in source_names else None
+
+
+def _safe_stem(filename):
+    return re.sub(r"[^A-Za-z0-9_-]+", "-", os.path.splitext(filename)[0]).strip("-")
+
+
+def _write_atomic(path, payload):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def encode_variants(path, widths, formats):
+    """{(format, width): encoded bytes} for the image at path, never upscaled"""
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+    encoded = {}
+    for width in sorted({min(w, image.width) for w in widths}):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            buffer = io.BytesIO()
+            resized.save(buffer, FORMATS[fmt]["pillow"], **FORMATS[fmt]["options"])
+            encoded[(fmt, width)] = buffer.getvalue()
+    return encoded
+
+
+def build(source_dir=DEFAULT_SOURCE_DIR, out_dir=DEFAULT_VARIANT_DIR,
+          dataset_path=DEFAULT_DATASET_PATH, widths=DEFAULT_WIDTHS, formats=tuple(FORMATS)):
+    """Encode the variants of every source image and write the manifest.
+
+    Source images whose bytes, widths and formats are unchanged since the
+    last build are not re-encoded. Variant files no longer in the manifest
+    are deleted.
+    """
+    from PIL import features
+
+    supported = [fmt for fmt in formats if features.check(FORMATS[fmt]["pillow"].lower())]
+    for fmt in set(formats) - set(supported):
+        print(f"Skipping {fmt}: this Pillow build cannot encode it.")
+    widths = sorted(set(widths))
+
+    os.makedirs(out_dir, exist_ok=True)
+    previous = read_manifest(out_dir) or {"images": {}}
+    source_names = sorted(
+        name for name in os.listdir(source_dir)
+        if os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS
+    )
+
+    images = {}
+    source_bytes = variant_bytes = 0
+    for name in source_names:
+        path = os.path.join(source_dir, name)
+        with open(path, "rb") as f:
+            source_sha = hashlib.sha256(f.read()).hexdigest()
+        source_bytes += os.path.getsize(path)
+
+        entry = previous["images"].get(name)
+        if (entry and entry["source_sha256"] == source_sha and entry["widths"] == widths
+                and entry["formats"] == supported
+                and all(os.path.exists(os.path.join(out_dir, v["file"])) for v in entry["variants"])):
+            images[name] = entry
+        else:
+            variants = []
+            for (fmt, width), payload in encode_variants(path, widths, supported).items():
+                digest = hashlib.sha256(payload).hexdigest()[:16]
+                filename = f"{_safe_stem(name)}-{width}w.{digest}.{fmt}"
+                if not os.path.exists(os.path.join(out_dir, filename)):
+                    _write_atomic(os.path.join(out_dir, filename), payload)
+                variants.append({"format": fmt, "width": width, "file": filename})
+            images[name] = {"source_sha256": source_sha, "widths": widths,
+                            "formats": supported, "variants": variants}
+        variant_bytes += sum(os.path.getsize(os.path.join(out_dir, v["file"]))
+                             for v in images[name]["variants"])
+
+    # Which card each source image belongs to, and the image_url it was scraped
+    # from, so a card whose image_url is later edited stops using stale variants
+    data, _ = load_dataset(dataset_path)
+    cards = {}
+    for card in data:
+        name = source_image_name(card, images)
+        if name:
+            cards[card["name"]] = {"image": name, "image_url": card["image_url"]}
+
+    manifest = {"version": MANIFEST_VERSION, "images": images, "cards": cards}
+    _write_atomic(os.path.join(out_dir, MANIFEST_NAME),
+                  json.dumps(manifest, indent=2, ensure_ascii=False).encode("utf-8"))
+
+    referenced = {v["file"] for entry in images.values() for v in entry["variants"]}
+    for filename in os.listdir(out_dir):
+        if filename != MANIFEST_NAME and filename not in referenced:
+            os.remove(os.path.join(out_dir, filename))
+
+    print(f"Built variants of {len(images)} images for {len(cards)} cards in {out_dir}: "
+          f"{source_bytes / 1e6:.1f} MB of sources -> {variant_bytes / 1e6:.1f} MB of variants.")
+    return manifest
+
+
+class ImageManifest(object):
+    """Card name -> URL and per-format srcsets of its image variants."""
+
+    def __init__(self, manifest=None, base_url="/images/"):
+        self.base_url = base_url
+        self.cards = {}
+        if not manifest:
+            return
+        for card_name, card in manifest["cards"].items():
+            entry = manifest["images"].get(card["image"])
+            if not entry or not entry["variants"]:
+                continue
+            srcset = {}
+            for fmt in entry["formats"]:
+                srcset[fmt] = ", ".join(
+                    f"{base_url}{v['file']} {v['width']}w" for v in entry["variants"] if v["format"] == fmt)
+            # The widest variant of the default format (2x the tile)
+            fallback = [v for v in entry["variants"] if v["format"] == DEFAULT_FORMAT] or entry["variants"]
+            url = base_url + max(fallback, key=lambda v: v["width"])["file"]
+            self.cards[card_name] = (card["image_url"], url, srcset)
+
+    @classmethod
+    def load(cls, directory=DEFAULT_VARIANT_DIR, base_url="/images/"):
+        """The manifest in directory; an empty one if the variants were never built"""
+        return cls(read_manifest(directory), base_url)
+
+    def __len__(self):
+        return len(self.cards)
+
+    def variants(self, card):
+        """(url, {format: srcset}) for card, or None if its image has no variants"""
+        found = self.cards.get(card.get("name"))
+        if found is None or found[0] != card.get("image_url"):
+            return None
+        return found[1], found[2]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build resized card image variants")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--source", default=DEFAULT_SOURCE_DIR)
+    parser.add_argument("--out", default=DEFAULT_VARIANT_DIR)
+    parser.add_argument("--dataset", default=DEFAULT_DATASET_PATH)
+    parser.add_argument("--widths", type=int, nargs="+", default=list(DEFAULT_WIDTHS))
+    parser.add_argument("--formats", nargs="+", choices=list(FORMATS), default=list(FORMATS))
+    args = parser.parse_args()
+    build(args.source, args.out, args.dataset, args.widths, tuple(args.formats))
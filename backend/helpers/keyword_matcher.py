@@ -0,0 +1,105 @@
+"""
+Labelled keyword tables, matched as plain substrings.
+
+Each keyword carries one or more labels, so one matcher built from several
+keyword lists answers several "does the text mention any of ..." questions
+at once, and the sentiment rules, airline tagging and match factors share
+one implementation.
+
+Small tables are matched with ``keyword in text``, which scans the text in
+C and stops at the first keyword found for each label. That costs one scan
+per keyword, so tables of ``SCAN_LIMIT`` keywords or more are compiled into
+one regex instead: the keywords are merged into a trie, longest first, and
+the text is scanned once from every match's next character. The crossover
+was measured on the dataset's 627 reviews:
+
+    keywords    scan       regex
+    57          5.7 ms     ~8 ms     (the sentiment table)
+    100         13.1 ms    12.4 ms
+    300         38.5 ms    15.2 ms
+    1000        132.3 ms   25.2 ms
+
+Matching is case-sensitive; callers lowercase both sides.
+"""
+
+import re
+
+# Tables with at least this many keywords are matched with one compiled regex
+SCAN_LIMIT = 100
+
+
+def trie_pattern(keywords):
+    """Regex source matching any of keywords, with common prefixes merged.
+
+    Alternatives are tried longest first, so at each position the pattern
+    matches the longest keyword that starts there.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        # Longer continuations come before the end of a shorter keyword
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher(object):
+    """Substring matcher over labelled keywords.
+
+    ``patterns`` maps each label to an iterable of keywords; a keyword may
+    appear under several labels.
+    """
+
+    def __init__(self, patterns):
+        # keyword -> its labels
+        self.labels = {}
+        # label -> its distinct keywords, in their original order
+        self._keywords = {}
+
+        for label, keywords in patterns.items():
+            for keyword in keywords:
+                if not keyword:
+                    continue
+                self.labels.setdefault(keyword, set()).add(label)
+                self._keywords.setdefault(label, {})[keyword] = None
+        self._keywords = {label: tuple(keywords) for label, keywords in self._keywords.items()}
+
+        self._regex = None
+        if len(self.labels) >= SCAN_LIMIT:
+            self._regex = re.compile(trie_pattern(self.labels))
+            # A match is the longest keyword at its position; the shorter keywords inside it occur too
+            self._contained = {keyword: frozenset(other for other in self.labels if other in keyword)
+                               for keyword in self.labels}
+
+    def keywords_in(self, text):
+        """Set of keywords that occur in text."""
+        if self._regex is None:
+            return {keyword for keyword in self.labels if keyword in text}
+        found = set()
+        search = self._regex.search
+        match = search(text)
+        while match:
+            found |= self._contained[match.group()]
+            match = search(text, match.start() + 1)
+        return found
+
+    def labels_in(self, text):
+        """Set of labels with at least one keyword occurring in text."""
+        if self._regex is not None:
+            return {label for keyword in self.keywords_in(text) for label in self.labels[keyword]}
+        found = set()
+        for label, keywords in self._keywords.items():
+            for keyword in keywords:
+                if keyword in text:
+                    found.add(label)
+                    break
+        return found
@@ -0,0 +1,104 @@
+"""
+The per-card features behind a result's match factors, parsed once per catalogue.
+
+A result explains its match with the query words found in the card's offer
+and reward text, the categories it shares with the query and the first of
+its airlines the query mentions. Instead of lowercasing and scanning each
+card's text per result, a MatchFeatures built with the snapshot keeps:
+
+- an inverted index from each distinct (lowercased, whitespace-separated)
+  word of the offer and reward texts to the cards that use it,
+- for each category word, the mask of cards with a category containing it,
+- each card's airlines with their lowercased names.
+
+The query side (``for_query``) is computed once per query and cached: the
+mask of cards matching each query word, the category words and the
+airlines mentioned. Each card's factors are then mask lookups and a few
+set membership tests.
+
+A query word matches a card when it is a substring of the card's text, as
+before. Query words contain no whitespace, so every occurrence lies inside
+one word of the text, and scanning the distinct words finds them all.
+"""
+
+import bisect
+import functools
+
+import numpy as np
+
+# Query words too generic to count as a keyword match
+KEYWORD_STOP_WORDS = ["credit", "card", "want"]
+# Query words that count as a category match
+CATEGORY_WORDS = ["travel", "cash back", "rewards", "miles", "hotel", "dining"]
+# Distinct queries whose features are remembered
+CACHE_SIZE = 1024
+
+
+def offer_text(card):
+    """The text whose words count as keyword matches"""
+    return card.get("offer_details_value", "") + " " + card.get("rewards_rate_value", "")
+
+
+class QueryFeatures(object):
+    """One query's side of the match factors.
+
+    ``keywords`` and ``categories`` are (word, mask over the cards) pairs in
+    query order; ``airlines`` is the set of catalogue airlines the query
+    mentions.
+    """
+
+    def __init__(self, keywords, categories, airlines):
+        self.keywords = keywords
+        self.categories = categories
+        self.airlines = airlines
+
+
+class MatchFeatures(object):
+    """Match-factor features of every card in a catalogue."""
+
+    def __init__(self, data, card_table, airline_matcher):
+        self.size = len(data)
+        self.airline_matcher = airline_matcher
+
+        postings = {}
+        for i, card in enumerate(data):
+            for word in set(offer_text(card).lower().split()):
+                postings.setdefault(word, []).append(i)
+        self._words = list(postings)
+        self._postings = [np.array(postings[word], dtype=np.int64) for word in self._words]
+        # Every distinct word on its own line, so one str.find scan covers them all
+        self._text = "\n".join(self._words)
+        self._starts = []
+        offset = 0
+        for word in self._words:
+            self._starts.append(offset)
+            offset += len(word) + 1
+
+        # Category labels are lowercased and split on commas by the CardTable
+        self._category_cards = {
+            word: card_table.has_category(lambda label, word=word: word in label)
+            for word in CATEGORY_WORDS
+        }
+        # (airline, lowercased airline) per card, in the card's order
+        self.airlines = [tuple((airline, airline.lower()) for airline in card.get("associated_airlines", []))
+                         for card in data]
+
+        self.for_query = functools.lru_cache(maxsize=CACHE_SIZE)(self._for_query)
+
+    def cards_containing(self, token):
+        """Mask of the cards whose offer text contains token"""
+        mask = np.zeros(self.size, dtype=bool)
+        start = self._text.find(token)
+        while start >= 0:
+            j = bisect.bisect_right(self._starts, start) - 1
+            mask[self._postings[j]] = True
+            # Later matches inside this word would find the same cards
+            start = self._text.find(token, self._starts[j] + len(self._words[j]) + 1)
+        return mask
+
+    def _for_query(self, user_input):
+        words = user_input.lower().split()
+        keywords = [(token, self.cards_containing(token)) for token in dict.fromkeys(words)
+                    if len(token) > 3 and token not in KEYWORD_STOP_WORDS]
+        categories = [(word, self._category_cards[word]) for word in words if word in self._category_cards]
+        return QueryFeatures(keywords, categories, self.airline_matcher.keywords_in(user_input.lower()))
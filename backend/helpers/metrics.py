@@ -0,0 +1,137 @@
+"""
+Latency histograms and the Prometheus text exposition of the app's metrics.
+
+Code in the request path wraps each stage in ``stage(name)``:
+
+    with metrics.stage("similarity"):
+        ...
+
+Every stage's duration goes into the ``card_match_stage_seconds``
+histogram. An observation is a bisect into fixed buckets plus two adds
+under a lock, a few microseconds at most. While a request collects its own
+breakdown (``collect()``, used for the X-Debug-Timing header), the stage
+also adds its duration there.
+
+Metrics are per process: with several workers, each serves its own
+/metrics and Prometheus sums them.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from 50us to 10s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """Cumulative-bucket histogram with one series per label value."""
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        # label value -> [per-bucket counts (last is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {value: (list(counts), total) for value, (counts, total) in self._series.items()}
+        for value, (counts, total) in sorted(series.items()):
+            label = f'{self.label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+stage_seconds = Histogram("card_match_stage_seconds",
+                          "Time spent in each stage of ranking and serving recommendations", "stage")
+request_seconds = Histogram("card_match_request_seconds",
+                            "Time to handle a request, by endpoint", "endpoint")
+
+# The current request's {stage: seconds}, when it asked for its breakdown
+_timings = contextvars.ContextVar("card_match_timings", default=None)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as stage name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(name, elapsed)
+        timings = _timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def timed(name, fn):
+    """fn wrapped so that every call is timed as stage name"""
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def collect():
+    """Start collecting the current request's stage breakdown; returns the dict it fills"""
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def stop_collecting():
+    _timings.set(None)
+
+
+@contextmanager
+def collecting(timings):
+    """Add the block's stages to timings (a dict from collect(), or None for no breakdown).
+
+    Streamed response bodies are generated after the request handler has
+    returned, so they re-enter the request's breakdown with this.
+    """
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def format_timings(timings):
+    """A breakdown in Server-Timing syntax: ``stage;dur=<ms>, ...``"""
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings.items())
+
+
+def render(gauges=(), counters=()):
+    """Prometheus text for the histograms plus (name, help, value) gauges and counters"""
+    lines = stage_seconds.render() + request_seconds.render()
+    for kind, metrics in (("gauge", gauges), ("counter", counters)):
+        for name, help_text, value in metrics:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
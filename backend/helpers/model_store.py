@@ -0,0 +1,406 @@
+"""
+Fitting, saving and loading of the TF-IDF + SVD recommendation models.
+
+Fitting two TF-IDF vectorizers and two truncated SVDs on every worker start
+is slow, so the fitted state can be written once to a versioned artifact
+directory and memory-mapped by the app on startup:
+
+    cd backend
+    python -m helpers.model_store build
+
+The artifacts record the SHA-256 of the dataset they were fitted on and the
+scikit-learn version that fitted them. When either changes the app ignores
+the stale artifacts and refits in-process. Artifacts are never built
+without VADER, so fallback sentiment can't be persisted.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from helpers.columnar import load_dataset
+from helpers.review_index import normalize_rows
+
+# scikit-learn is only imported when models are actually fitted: importing it
+# alone takes longer than loading every artifact.
+
+# Bump whenever the artifact layout or the document construction changes
+ARTIFACT_VERSION = 1
+N_COMPONENTS = 130
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATASET_PATH = os.path.join(BACKEND_DIR, 'dataset', 'dataset.json')
+DEFAULT_ARTIFACT_DIR = os.path.join(BACKEND_DIR, 'artifacts', f'v{ARTIFACT_VERSION}')
+
+# TfidfVectorizer's default token_pattern
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+def stop_words():
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+    custom_stop_words = set(ENGLISH_STOP_WORDS)
+    custom_stop_words.update(["card", "want", "credit"])
+    return sorted(custom_stop_words)
+
+
+def fitted_stop_words(models):
+    """The stop words both vectorizers were fitted with"""
+    words = set()
+    for vectorizer in (models.vectorizer, models.user_review_vectorizer):
+        # Artifacts from before stop words were saved: get them from scikit-learn
+        words.update(vectorizer.stop_words if vectorizer.stop_words is not None else stop_words())
+    return words
+
+
+def dataset_hash(path):
+    """SHA-256 hex digest of the dataset file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def description_documents(data):
+    """One informed description per card: our take, pros and repeated identifiers."""
+    docs = []
+    for entry in data:
+        name = f"{entry['name']}/{entry.get('short_card_name', '')}"
+        category = entry.get("category", "")
+        docs.append(
+            f"{entry.get('our_take_value', '')} {entry.get('pros_value', '')} "
+            f"issuer: {entry.get('issuer', '')} card name: {name} card name: {name} "
+            f"card name: {name} category: {category} category: {category}"
+        )
+    return docs
+
+
+def review_documents(data):
+    """All of a card's user reviews joined into one document."""
+    return ["     ".join(entry.get("user_reviews", [])) for entry in data]
+
+
+def card_reviews(data):
+    return [entry.get("user_reviews", []) for entry in data]
+
+
+class TfidfProjection(object):
+    """The transform half of a fitted TfidfVectorizer, without scikit-learn.
+
+    Matches TfidfVectorizer(stop_words=...).transform for our settings:
+    lowercased word tokens, raw term counts times IDF, then L2-normalized
+    rows. Stop words never make it into a fitted vocabulary, so looking
+    tokens up in the vocabulary also drops them. ``stop_words`` is the
+    list the vectorizer was fitted with, like TfidfVectorizer's parameter
+    (None for artifacts saved before it was kept).
+    """
+
+    def __init__(self, vocabulary, idf, stop_words=None):
+        self.vocabulary_ = vocabulary
+        self.idf_ = idf
+        self.stop_words = stop_words
+
+    def transform(self, raw_documents):
+        from scipy import sparse
+
+        indptr = [0]
+        indices = []
+        counts = []
+        for doc in raw_documents:
+            doc_counts = {}
+            for token in TOKEN_PATTERN.findall(doc.lower()):
+                j = self.vocabulary_.get(token)
+                if j is not None:
+                    doc_counts[j] = doc_counts.get(j, 0) + 1
+            for j in sorted(doc_counts):
+                indices.append(j)
+                counts.append(doc_counts[j])
+            indptr.append(len(indices))
+
+        indices = np.asarray(indices, dtype=np.int32)
+        values = np.asarray(counts, dtype=np.float64) * self.idf_[indices]
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        norms = np.zeros(len(indptr) - 1)
+        np.add.at(norms, rows, values * values)
+        norms = np.sqrt(norms)
+        norms[norms == 0] = 1.0
+        values /= norms[rows]
+        return sparse.csr_matrix(
+            (values, indices, np.asarray(indptr, dtype=np.int32)),
+            shape=(len(indptr) - 1, len(self.idf_)),
+        )
+
+
+class SVDProjection(object):
+    """The transform half of a fitted TruncatedSVD: X @ components_.T"""
+
+    def __init__(self, components):
+        self.components_ = components
+
+    def transform(self, X):
+        return X @ self.components_.T
+
+
+class RecommenderModels(object):
+    """Everything fitted on the catalogue that the recommender needs at request time.
+
+    ``vectorizer``/``svd``/``tfidf_matrix`` embed the card descriptions,
+    ``user_review_vectorizer``/``user_svd``/``user_review_matrix`` the joined
+    user reviews, and ``review_embeddings``/``review_sentiments`` every
+    individual review. All three embedding matrices are row-normalized, so
+    cosine similarity against them is a plain dot product.
+    """
+
+    def __init__(self, vectorizer, svd, tfidf_matrix,
+                 user_review_vectorizer, user_svd, user_review_matrix,
+                 review_embeddings, review_sentiments, source="fit"):
+        self.vectorizer = vectorizer
+        self.svd = svd
+        self.tfidf_matrix = tfidf_matrix
+        self.user_review_vectorizer = user_review_vectorizer
+        self.user_svd = user_svd
+        self.user_review_matrix = user_review_matrix
+        self.review_embeddings = review_embeddings
+        self.review_sentiments = review_sentiments
+        self.source = source
+
+
+def fit_models(data, sentiments_fn, n_components=N_COMPONENTS):
+    """Fit both TF-IDF + SVD pipelines on the catalogue and embed every review.
+
+    sentiments_fn maps a list of review texts to their sentiment dicts.
+    """
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(stop_words=stop_words())
+    tfidf_matrix_raw = vectorizer.fit_transform(description_documents(data))
+    svd = TruncatedSVD(n_components=n_components, random_state=42)
+    tfidf_matrix = svd.fit_transform(tfidf_matrix_raw)
+
+    user_review_vectorizer = TfidfVectorizer(stop_words=stop_words())
+    user_review_matrix_raw = user_review_vectorizer.fit_transform(review_documents(data))
+    user_svd = TruncatedSVD(n_components=n_components, random_state=42)
+    user_review_matrix = user_svd.fit_transform(user_review_matrix_raw)
+
+    texts = [rev for revs in card_reviews(data) for rev in revs]
+    if texts:
+        review_embeddings = user_svd.transform(user_review_vectorizer.transform(texts))
+    else:
+        review_embeddings = np.zeros((0, n_components))
+    review_sentiments = sentiments_fn(texts)
+
+    return RecommenderModels(vectorizer, svd, normalize_rows(tfidf_matrix),
+                             user_review_vectorizer, user_svd, normalize_rows(user_review_matrix),
+                             normalize_rows(review_embeddings), review_sentiments)
+
+
+def fold_in(models, data, previous_rows, previous_reviews, sentiments_fn):
+    """Models for an edited catalogue, without refitting.
+
+    previous_rows[i] is the row of card i in ``models``, or -1 if the card
+    is new or changed; previous_reviews are the per-card reviews ``models``
+    was built from. Rows of unchanged cards are copied, and the documents of
+    the rest are projected through the fitted vectorizers and SVDs.
+    """
+    previous_rows = np.asarray(previous_rows, dtype=np.int64).reshape(-1)
+    kept = np.flatnonzero(previous_rows >= 0)
+    changed = np.flatnonzero(previous_rows < 0)
+    changed_cards = [data[i] for i in changed]
+
+    def project(vectorizer, svd, matrix, docs):
+        rows = np.zeros((len(data), matrix.shape[1]))
+        rows[kept] = matrix[previous_rows[kept]]
+        if docs:
+            rows[changed] = normalize_rows(svd.transform(vectorizer.transform(docs)))
+        return rows
+
+    tfidf_matrix = project(models.vectorizer, models.svd, models.tfidf_matrix,
+                           description_documents(changed_cards))
+    user_review_matrix = project(models.user_review_vectorizer, models.user_svd,
+                                 models.user_review_matrix, review_documents(changed_cards))
+
+    # Individual reviews: copy the rows of unchanged cards, embed the rest
+    old_offsets = np.zeros(len(previous_reviews) + 1, dtype=np.int64)
+    np.cumsum([len(revs) for revs in previous_reviews], out=old_offsets[1:])
+    reviews = card_reviews(data)
+    source = np.full(sum(len(revs) for revs in reviews), -1, dtype=np.int64)
+    new_texts = []
+    position = 0
+    for i, revs in enumerate(reviews):
+        row = previous_rows[i]
+        if row >= 0:
+            source[position:position + len(revs)] = np.arange(old_offsets[row], old_offsets[row + 1])
+        else:
+            new_texts.extend(revs)
+        position += len(revs)
+
+    copied = source >= 0
+    review_embeddings = np.zeros((len(source), models.review_embeddings.shape[1]))
+    review_embeddings[copied] = models.review_embeddings[source[copied]]
+    new_sentiments = iter(sentiments_fn(new_texts) if new_texts else [])
+    if new_texts:
+        review_embeddings[~copied] = normalize_rows(
+            models.user_svd.transform(models.user_review_vectorizer.transform(new_texts)))
+    review_sentiments = [models.review_sentiments[j] if j >= 0 else next(new_sentiments)
+                         for j in source]
+
+    return RecommenderModels(models.vectorizer, models.svd, tfidf_matrix,
+                             models.user_review_vectorizer, models.user_svd, user_review_matrix,
+                             review_embeddings, review_sentiments, source="fold-in")
+
+
+def _save_vectorizer(directory, name, vectorizer):
+    vocabulary = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    with open(os.path.join(directory, f'{name}_vocabulary.json'), 'w', encoding='utf-8') as f:
+        json.dump(vocabulary, f)
+    np.save(os.path.join(directory, f'{name}_idf.npy'), vectorizer.idf_)
+    if vectorizer.stop_words is not None:
+        with open(os.path.join(directory, f'{name}_stop_words.json'), 'w', encoding='utf-8') as f:
+            json.dump(sorted(vectorizer.stop_words), f)
+
+
+def _load_vectorizer(directory, name):
+    with open(os.path.join(directory, f'{name}_vocabulary.json'), 'r', encoding='utf-8') as f:
+        vocabulary = json.load(f)
+    try:
+        with open(os.path.join(directory, f'{name}_stop_words.json'), 'r', encoding='utf-8') as f:
+            stop_words = json.load(f)
+    except OSError:
+        stop_words = None
+    return TfidfProjection(
+        {term: i for i, term in enumerate(vocabulary)},
+        np.load(os.path.join(directory, f'{name}_idf.npy')),
+        stop_words,
+    )
+
+
+def save_models(models, directory, dataset_sha, n_components=N_COMPONENTS):
+    """Write fitted models to ``directory``; the manifest is written last."""
+    import sklearn
+
+    os.makedirs(directory, exist_ok=True)
+    _save_vectorizer(directory, 'description', models.vectorizer)
+    _save_vectorizer(directory, 'reviews', models.user_review_vectorizer)
+    arrays = {
+        'description_components': models.svd.components_,
+        'description_matrix': models.tfidf_matrix,
+        'reviews_components': models.user_svd.components_,
+        'reviews_matrix': models.user_review_matrix,
+        'review_embeddings': models.review_embeddings,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array))
+    with open(os.path.join(directory, 'review_sentiments.json'), 'w', encoding='utf-8') as f:
+        json.dump(models.review_sentiments, f, ensure_ascii=False)
+
+    manifest = {
+        "artifact_version": ARTIFACT_VERSION,
+        "dataset_sha256": dataset_sha,
+        # The requested size; small catalogues get fewer actual components
+        "n_components": n_components,
+        "sklearn_version": sklearn.__version__,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    with open(os.path.join(directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def sklearn_version():
+    """The installed scikit-learn version, read without importing it (None if not installed)"""
+    from importlib import metadata
+    try:
+        return metadata.version("scikit-learn")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, 'manifest.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_models(directory, dataset_sha, n_components=N_COMPONENTS):
+    """Memory-map saved models, or return None if they are missing or stale."""
+    manifest = read_manifest(directory)
+    if (manifest is None
+            or manifest.get("artifact_version") != ARTIFACT_VERSION
+            or manifest.get("dataset_sha256") != dataset_sha
+            or manifest.get("n_components") != n_components):
+        return None
+    # Models fitted by another scikit-learn may tokenize or weight differently: refit
+    installed = sklearn_version()
+    if installed is not None and manifest.get("sklearn_version") != installed:
+        return None
+
+    def array(name):
+        return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+
+    with open(os.path.join(directory, 'review_sentiments.json'), 'r', encoding='utf-8') as f:
+        review_sentiments = json.load(f)
+
+    return RecommenderModels(
+        _load_vectorizer(directory, 'description'),
+        SVDProjection(array('description_components')),
+        array('description_matrix'),
+        _load_vectorizer(directory, 'reviews'),
+        SVDProjection(array('reviews_components')),
+        array('reviews_matrix'),
+        array('review_embeddings'),
+        review_sentiments,
+        source=directory,
+    )
+
+
+def load_or_fit(data, dataset_path, sentiments_fn, directory=DEFAULT_ARTIFACT_DIR,
+                n_components=N_COMPONENTS, dataset_sha=None):
+    """Load matching artifacts from ``directory``, refitting when there are none.
+
+    ``dataset_sha`` is the hash of the dataset bytes ``data`` was parsed
+    from; it is computed from ``dataset_path`` when not given.
+    """
+    if dataset_sha is None:
+        dataset_sha = dataset_hash(dataset_path)
+    models = load_models(directory, dataset_sha, n_components)
+    if models is not None:
+        print(f"Loaded model artifacts from {directory}")
+        return models
+    print(f"No up-to-date model artifacts in {directory}; fitting models "
+          f"(run `python -m helpers.model_store build` to skip this step).")
+    return fit_models(data, sentiments_fn, n_components)
+
+
+def build(dataset_path=DEFAULT_DATASET_PATH, directory=DEFAULT_ARTIFACT_DIR,
+          n_components=N_COMPONENTS):
+    from helpers.sentiment import analyze_sentiments, get_sentiment_analyzer, sentiment_store
+
+    if get_sentiment_analyzer() is None:
+        # The neutral fallback would be saved as every review's sentiment and outlive the outage
+        raise RuntimeError("VADER sentiment analysis is unavailable; not writing model artifacts "
+                           "with placeholder review sentiment")
+    start_time = time.time()
+    data, dataset_sha = load_dataset(dataset_path)
+    models = fit_models(data, analyze_sentiments, n_components)
+    save_models(models, directory, dataset_sha, n_components)
+    sentiment_store.save()
+    print(f"Wrote model artifacts for {len(data)} cards to {directory} "
+          f"in {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build Card Match model artifacts")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--dataset", default=DEFAULT_DATASET_PATH)
+    parser.add_argument("--out", default=DEFAULT_ARTIFACT_DIR)
+    parser.add_argument("--components", type=int, default=N_COMPONENTS)
+    args = parser.parse_args()
+    build(args.dataset, args.out, args.components)
@@ -0,0 +1,176 @@
+"""
+Spelling correction and synonym expansion of queries, before vectorizing.
+
+The TF-IDF vectorizers ignore every token outside their fitted vocabulary,
+so a misspelling ("cashbak", "skymilles") or a loyalty-programme name the
+catalogue never uses contributes nothing to the query vector. A
+QueryRewriter replaces each such out-of-vocabulary token with:
+
+- its synonym expansion, when it is an airline or hotel alias from
+  ``update_airline_data`` ("westin" -> "marriott bonvoy"), or else
+- the closest vocabulary word within edit distance 1-2, if there is one.
+
+Tokens already in the vocabulary are never changed, so queries the
+vectorizers fully understand rank exactly as before.
+
+Candidates come from a symmetric-delete index (as in SymSpell): every
+vocabulary word is indexed under each string obtained by deleting up to two
+of its characters. A token's own deletions then find every word within
+distance two with a few dict lookups, and only those candidates get a real
+(bounded) edit-distance check. Results are cached per token.
+"""
+
+import functools
+
+from helpers import model_store
+from helpers.model_store import TOKEN_PATTERN
+from helpers.update_airline_data import AIRLINES, HOTEL_CHAINS
+
+MAX_DISTANCE = 2
+# Distinct tokens whose correction is remembered
+CACHE_SIZE = 8192
+
+
+def max_distance(token):
+    """Edits allowed when correcting token: none for short words, where a guess is usually wrong"""
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) < 6 else MAX_DISTANCE
+
+
+def deletes(word, distance):
+    """Every string obtained by deleting up to distance characters of word (including word)"""
+    results = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (Levenshtein plus adjacent swaps), or limit + 1 if above limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+def synonym_table(vocabulary, stop_words=(), groups=(AIRLINES, HOTEL_CHAINS)):
+    """{alias: expansion} for the one-word aliases that the vectorizers drop.
+
+    An alias expands to the vocabulary words among its group's canonical
+    name and other one-word aliases, e.g. "westin" -> "marriott bonvoy".
+    """
+    table = {}
+    for group in groups:
+        for canonical, aliases in group.items():
+            # "miles & more" or "miles&smiles" would expand to plain "miles"
+            words = [alias for alias in aliases if TOKEN_PATTERN.fullmatch(alias)]
+            expansion = []
+            for phrase in [canonical] + words:
+                expansion += [token for token in TOKEN_PATTERN.findall(phrase)
+                              if token in vocabulary and token not in expansion]
+            if not expansion:
+                continue
+            for alias in [canonical] + words:
+                if TOKEN_PATTERN.fullmatch(alias) and alias not in vocabulary and alias not in stop_words:
+                    table.setdefault(alias, " ".join(expansion))
+    return table
+
+
+class QueryRewriter(object):
+    """Rewrites the out-of-vocabulary tokens of normalized queries.
+
+    ``vocabulary`` maps each known word to a rank used to break ties between
+    equally close corrections (lower wins; the IDF, so more common words are
+    preferred). ``synonyms`` maps out-of-vocabulary tokens to replacements.
+    Stop words are dropped by the vectorizers on purpose, so they are kept
+    as they are rather than corrected to some vocabulary word.
+
+    ``shared`` is another rewriter for the same words and stop words (only
+    the ranks may differ), whose synonyms and deletes index are reused
+    instead of being built again.
+    """
+
+    def __init__(self, vocabulary, stop_words=(), synonyms=None, shared=None):
+        self.vocabulary = vocabulary
+        self.stop_words = frozenset(stop_words)
+        if shared is not None:
+            self.synonyms = shared.synonyms
+            self._index = shared._index
+        else:
+            self.synonyms = synonym_table(vocabulary, self.stop_words) if synonyms is None else synonyms
+            # Synonym keys are indexed too, so a misspelled alias still expands
+            self._index = {}
+            for word in list(vocabulary) + list(self.synonyms):
+                if word.isalpha():
+                    for key in deletes(word, MAX_DISTANCE):
+                        self._index.setdefault(key, []).append(word)
+        self.correct = functools.lru_cache(maxsize=CACHE_SIZE)(self._correct)
+
+    @classmethod
+    def from_models(cls, models, previous=None):
+        """Rewriter for both fitted vectorizers' vocabularies and stop words.
+
+        ``previous`` is returned as is when the models have the same
+        vocabulary and IDF ranks (e.g. after a fold-in), and shares its
+        index when only the ranks changed (e.g. after a refit).
+        """
+        vocabulary = {}
+        for vectorizer in (models.vectorizer, models.user_review_vectorizer):
+            for word, j in vectorizer.vocabulary_.items():
+                idf = float(vectorizer.idf_[j])
+                vocabulary[word] = min(idf, vocabulary.get(word, idf))
+        stop_words = frozenset(model_store.fitted_stop_words(models))
+        if previous is None or previous.stop_words != stop_words or previous.vocabulary.keys() != vocabulary.keys():
+            return cls(vocabulary, stop_words)
+        if previous.vocabulary == vocabulary:
+            return previous
+        return cls(vocabulary, stop_words, shared=previous)
+
+    def _correct(self, token):
+        """token's replacement, or None to keep it"""
+        if token in self.vocabulary or token in self.stop_words:
+            return None
+        if token in self.synonyms:
+            return self.synonyms[token]
+        limit = max_distance(token)
+        if limit == 0 or not token.isalpha():
+            return None
+
+        candidates = set()
+        for key in deletes(token, limit):
+            candidates.update(self._index.get(key, ()))
+        best = None
+        for word in candidates:
+            distance = edit_distance(token, word, limit)
+            if distance > limit:
+                continue
+            # Closest first, then the most common word, then alphabetical for stable results
+            rank = (distance, self.vocabulary.get(word, float("inf")), word)
+            if best is None or rank < best:
+                best = rank
+        if best is None:
+            return None
+        return self.synonyms.get(best[2], best[2])
+
+    def rewrite(self, query):
+        """query with every correctable out-of-vocabulary token replaced"""
+        return TOKEN_PATTERN.sub(lambda m: self.correct(m.group()) or m.group(), query)
+
+    def stats(self):
+        info = self.correct.cache_info()
+        return {"vocabulary": len(self.vocabulary), "synonyms": len(self.synonyms),
+                "index_keys": len(self._index), "cache_hits": info.hits, "cache_misses": info.misses}
@@ -0,0 +1,123 @@
+"""
+The tunable parameters of the ranking pipeline, loadable per deployment.
+
+A deployment points CARD_MATCH_RANKING_CONFIG at a JSON file holding any
+subset of the settings below; everything it leaves out keeps its default,
+including the individual entries of the nested boost tables:
+
+    {"description_weight": 0.6, "review_weight": 0.4, "n_components": 64,
+     "travel_frequency_boost": {"frequent": {"travel": 1.2}}}
+
+Models fitted with a different ``n_components`` need their own artifacts
+(``python -m helpers.model_store build --components 64 --out ...`` and
+CARD_MATCH_ARTIFACTS); without them the app fits its models at startup.
+``python -m helpers.evaluate`` compares configs offline.
+"""
+
+import copy
+import json
+import os
+
+from helpers.model_store import N_COMPONENTS
+from helpers.sparse_index import FUSIONS, RRF_K
+
+DEFAULTS = {
+    # Dense score: description_weight * description + review_weight * review similarity
+    "description_weight": 0.7,
+    "review_weight": 0.3,
+    # SVD dimensions of both embeddings
+    "n_components": N_COMPONENTS,
+    # Cards below this match percentage (after boosts) are dropped
+    "min_match_percentage": 10,
+    # preferredAirline: cards associated with that airline, or with one whose name contains it
+    "airline_boost": {"direct": 1.15, "partial": 1.10},
+    # travelFrequency: factors for travel cards, cash back cards and every other card
+    "travel_frequency_boost": {
+        "frequent": {"travel": 1.10, "cash_back": 1.01, "other": 1.01},
+        "occasional": {"travel": 1.05, "cash_back": 1.01, "other": 1.01},
+        "rare": {"travel": 1.01, "cash_back": 1.05, "other": 1.01},
+    },
+    # Hybrid keyword ranking (see helpers/sparse_index.py)
+    "fusion": "dense",
+    "keyword_weight": 0.3,
+    "rrf_k": RRF_K,
+    "keyword_candidates": 0,
+}
+
+# Environment variables that override a setting after the config file
+ENV_OVERRIDES = {
+    "CARD_MATCH_FUSION": ("fusion", str),
+    "CARD_MATCH_KEYWORD_WEIGHT": ("keyword_weight", float),
+    "CARD_MATCH_RRF_K": ("rrf_k", int),
+    "CARD_MATCH_KEYWORD_CANDIDATES": ("keyword_candidates", int),
+}
+
+
+def _merge(defaults, overrides, path=""):
+    """defaults with overrides applied, recursing into nested tables; unknown keys raise ValueError"""
+    unknown = sorted(set(overrides) - set(defaults))
+    if unknown:
+        raise ValueError(f"Unknown ranking settings: {', '.join(path + key for key in unknown)}")
+    merged = copy.deepcopy(defaults)
+    for key, value in overrides.items():
+        if isinstance(defaults[key], dict):
+            if not isinstance(value, dict):
+                raise ValueError(f"Ranking setting {path + key} must be an object")
+            merged[key] = _merge(defaults[key], value, f"{path}{key}.")
+        else:
+            merged[key] = value
+    return merged
+
+
+class RankingConfig(object):
+    """Ranking weights, SVD size, boost factors, match cutoff and keyword fusion.
+
+    Settings are attributes named as in DEFAULTS; the constructor takes any
+    subset of them as keyword arguments and raises ValueError for unknown
+    or invalid ones.
+    """
+
+    def __init__(self, **settings):
+        self._settings = _merge(DEFAULTS, settings)
+        for key, value in self._settings.items():
+            setattr(self, key, value)
+
+        if self.fusion not in FUSIONS:
+            raise ValueError(f"Unknown fusion {self.fusion!r}; expected one of {', '.join(FUSIONS)}")
+        if self.description_weight < 0 or self.review_weight < 0:
+            raise ValueError("Similarity weights must not be negative")
+        if self.n_components < 1:
+            raise ValueError("n_components must be at least 1")
+
+    @property
+    def weights(self):
+        """(description weight, review weight)"""
+        return (self.description_weight, self.review_weight)
+
+    def travel_boosts(self, travel_frequency):
+        """(travel, cash back, other) factors for a travelFrequency, or None if it boosts nothing"""
+        boosts = self.travel_frequency_boost.get(travel_frequency)
+        if boosts is None:
+            return None
+        return (boosts["travel"], boosts["cash_back"], boosts["other"])
+
+    def to_dict(self):
+        return copy.deepcopy(self._settings)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """The config file named by CARD_MATCH_RANKING_CONFIG (defaults if unset), then ENV_OVERRIDES"""
+        path = environ.get("CARD_MATCH_RANKING_CONFIG")
+        settings = {}
+        if path:
+            with open(path, "r", encoding="utf-8") as f:
+                settings = json.load(f)
+        for variable, (key, parse) in ENV_OVERRIDES.items():
+            if variable in environ:
+                settings[key] = parse(environ[variable])
+        return cls(**settings)
@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace; the recommender is insensitive to both."""
+    return " ".join(str(query).lower().split())
+
+
+def canonical_filters(filters):
+    """Stable string form of a filters dict; unset (falsy) filters are dropped."""
+    active = {key: value for key, value in (filters or {}).items() if value}
+    return json.dumps(active, sort_keys=True, default=str)
+
+
+class ResultCache(object):
+    """Thread-safe LRU cache with a per-entry TTL and a total size budget.
+
+    Values must report their approximate size in bytes through a ``nbytes``
+    attribute; the least recently used entries are evicted until both
+    ``max_entries`` and ``max_bytes`` hold. A value that grows after it was
+    cached reports the growth with ``grow``.
+    """
+
+    def __init__(self, max_entries=256, ttl=300.0, max_bytes=64 * 1024 * 1024, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value, bytes charged)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.max_entries <= 0 or value.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, value, value.nbytes)
+            self._bytes += value.nbytes
+            self._evict()
+
+    def grow(self, key, value, nbytes):
+        """Charge nbytes more to key's entry, if it still holds value, and evict to stay in budget"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] is not value:
+                return
+            self._entries[key] = (entry[0], value, entry[2] + nbytes)
+            self._bytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, _, nbytes = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+            }
@@ -0,0 +1,92 @@
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """L2-normalize each row; all-zero rows stay zero (cosine similarity 0)."""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def cosine_scores(query_vecs, card_matrix):
+    """Cosine similarity of each query against each row of a row-normalized
+    matrix, as a (queries x rows) array.
+
+    One matrix product for the whole batch. BLAS may round a query's scores
+    slightly differently alone and in a batch (the kernel depends on the
+    shape), so batch and single results agree to within float tolerance.
+    """
+    return normalize_rows(query_vecs) @ card_matrix.T
+
+
+class ReviewTexts(object):
+    """The reviews of every card back to back, read from each card's review sequence on access.
+
+    Used for reviews that are fetched on demand (e.g. from a card
+    database), so they are not all copied into one list.
+    """
+
+    def __init__(self, card_reviews, offsets):
+        self.card_reviews = card_reviews
+        self.offsets = offsets
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, j):
+        card = int(np.searchsorted(self.offsets, j, side="right")) - 1
+        return self.card_reviews[card][j - self.offsets[card]]
+
+
+class ReviewIndex(object):
+    """Precomputed embeddings and sentiment for every individual user review.
+
+    Reviews of all cards are stored back to back: the reviews of card ``i``
+    are rows ``offsets[i]:offsets[i + 1]`` of ``matrix``, ``texts`` and
+    ``sentiments``. ``card_reviews`` is a list of review lists per card,
+    or a columnar.FieldColumn, whose memory-mapped texts are used as is.
+    Cards whose reviews are some other sequence (read on access, like an
+    SQLReviewList) keep them that way, and ``texts`` reads through them.
+    ``embeddings`` must be row-normalized, so scoring a query against every
+    review is one matrix-vector product.
+    """
+
+    def __init__(self, card_reviews, embeddings, sentiments):
+        flat = card_reviews.flat() if hasattr(card_reviews, "flat") else None
+        if flat is not None:
+            # A columnar dataset's reviews are already stored back to back: keep them mapped
+            self.texts, self.offsets = flat
+            counts = np.diff(self.offsets)
+        else:
+            counts = [len(revs) for revs in card_reviews]
+            self.offsets = np.zeros(len(card_reviews) + 1, dtype=np.int64)
+            np.cumsum(counts, out=self.offsets[1:])
+            if all(isinstance(revs, list) for revs in card_reviews):
+                self.texts = [rev for revs in card_reviews for rev in revs]
+            else:
+                self.texts = ReviewTexts(list(card_reviews), self.offsets)
+        self.card_ids = np.repeat(np.arange(len(card_reviews)), counts)
+        self.matrix = embeddings
+        self.sentiments = sentiments
+
+    def __len__(self):
+        return len(self.texts)
+
+    def score(self, query_vec):
+        """Cosine similarity between a (1, d) query embedding and every review."""
+        return self.matrix @ normalize_rows(query_vec).ravel()
+
+    def rank(self, scores):
+        """Order review rows by card, best score first within each card."""
+        # lexsort is stable, so equal scores keep their original review order
+        return np.lexsort((-scores, self.card_ids))
+
+    def top_reviews(self, card_idx, scores, ranked, k=3):
+        """Top ``k`` (text, score, sentiment) tuples for one card."""
+        start = self.offsets[card_idx]
+        end = min(self.offsets[card_idx + 1], start + k)
+        return [
+            (self.texts[j], float(scores[j]), self.sentiments[j])
+            for j in ranked[start:end]
+        ]
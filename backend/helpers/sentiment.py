@@ -0,0 +1,336 @@
+# Sentiment analysis of credit card reviews (NLTK VADER + card-specific rules)
+
+import hashlib
+import json
+import os
+import ssl
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from helpers.keyword_matcher import KeywordMatcher
+
+# Fix SSL issues for NLTK download (common issue)
+try:
+    _create_unverified_https_context = ssl._create_unverified_context
+except AttributeError:
+    pass
+else:
+    ssl._create_default_https_context = _create_unverified_https_context
+
+# Never reach for the network when set, e.g. in offline containers
+OFFLINE = os.environ.get("CARD_MATCH_OFFLINE", "").lower() in ("1", "true", "yes")
+
+NEUTRAL_SENTIMENT = {
+    "compound": 0,
+    "pos": 0.5,
+    "neu": 0.5,
+    "neg": 0,
+    "sentiment": "neutral",
+    "emoji": "😐"
+}
+
+# Memoized results: at most this many texts, optionally persisted to a JSON file
+SENTIMENT_CACHE_SIZE = int(os.environ.get("CARD_MATCH_SENTIMENT_CACHE_SIZE", 100000))
+SENTIMENT_CACHE_PATH = os.environ.get("CARD_MATCH_SENTIMENT_CACHE")
+
+# Bulk scoring only starts a process pool for at least this many uncached texts
+MIN_POOL_TEXTS = 256
+POOL_CHUNK_SIZE = 64
+
+_analyzer = None
+_analyzer_ready = False
+_analyzer_lock = threading.Lock()
+
+
+def get_sentiment_analyzer():
+    """The shared VADER analyzer, set up on first use; None if unavailable.
+
+    NLTK is imported and the lexicon downloaded only when first needed (and
+    only if it is not installed already), so a worker that loads precomputed
+    review sentiment never touches NLTK at all.
+    """
+    global _analyzer, _analyzer_ready
+    if _analyzer_ready:
+        return _analyzer
+    with _analyzer_lock:
+        if _analyzer_ready:
+            return _analyzer
+        try:
+            # Import NLTK for sentiment analysis (slow, so only when needed)
+            import nltk
+            try:
+                nltk.data.find('sentiment/vader_lexicon.zip')
+            except LookupError:
+                if OFFLINE:
+                    raise
+                print("Downloading VADER lexicon...")
+                nltk.download('vader_lexicon', quiet=True)
+                print("Download complete.")
+            from nltk.sentiment.vader import SentimentIntensityAnalyzer
+            _analyzer = SentimentIntensityAnalyzer()
+            print("Sentiment analyzer initialized successfully.")
+        except Exception as e:
+            print(f"Error setting up sentiment analysis: {str(e)}", file=sys.stderr)
+            print("Using fallback sentiment analysis function.")
+            _analyzer = None
+        _analyzer_ready = True
+    return _analyzer
+
+
+def text_key(text):
+    """Content address of a review text."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SentimentStore(object):
+    """Bounded, thread-safe LRU of sentiment results keyed by text_key.
+
+    Results are plain JSON-compatible dicts, so the store can be saved to
+    and loaded from a JSON file; saving writes a temporary file and renames
+    it into place, so readers never see a partial file.
+    """
+
+    def __init__(self, max_entries=SENTIMENT_CACHE_SIZE, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def load(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for key, result in json.load(f).items():
+                self.put(key, result)
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            entries = dict(self._entries)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+sentiment_store = SentimentStore(path=SENTIMENT_CACHE_PATH)
+
+
+def analyze_sentiment(text):
+    """Sentiment of one text, memoized in sentiment_store."""
+    if not text or text.strip() == "":
+        return dict(NEUTRAL_SENTIMENT)
+    key = text_key(text)
+    result = sentiment_store.get(key)
+    if result is None:
+        result = score_sentiment(text)
+        # Fallback results are not cached, so they are redone once NLTK works
+        if get_sentiment_analyzer() is not None:
+            sentiment_store.put(key, result)
+    return dict(result)
+
+
+def _score_batch(texts):
+    return [score_sentiment(text) for text in texts]
+
+
+def analyze_sentiments(texts, workers=None):
+    """Sentiment of many texts, in order.
+
+    Each distinct uncached text is scored once. Large backlogs are scored
+    by a process pool with ``workers`` processes (default: one per core);
+    pass workers=1 to score in-process.
+    """
+    keys = [text_key(text) if text and text.strip() else None for text in texts]
+    results = {}
+    pending = {}
+    for key, text in zip(keys, texts):
+        if key is None or key in results or key in pending:
+            continue
+        cached = sentiment_store.get(key)
+        if cached is None:
+            pending[key] = text
+        else:
+            results[key] = cached
+
+    pending_keys = list(pending)
+    pending_texts = [pending[key] for key in pending_keys]
+    # Set up VADER before starting the pool, so forked workers inherit it
+    cacheable = bool(pending_texts) and get_sentiment_analyzer() is not None
+    if workers != 1 and len(pending_texts) >= MIN_POOL_TEXTS:
+        chunks = [pending_texts[i:i + POOL_CHUNK_SIZE]
+                  for i in range(0, len(pending_texts), POOL_CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            scored = [result for batch in pool.map(_score_batch, chunks) for result in batch]
+    else:
+        scored = _score_batch(pending_texts)
+
+    for key, result in zip(pending_keys, scored):
+        results[key] = result
+        if cacheable:
+            sentiment_store.put(key, result)
+
+    return [dict(results[key]) if key is not None else dict(NEUTRAL_SENTIMENT) for key in keys]
+
+
+# Define keyword patterns for credit card reviews
+NEGATIVE_KEYWORDS = [
+    'annual fee', 'expensive', 'high fee', 'too high', 'drawback', 
+    'downside', 'catch', 'problem', 'disappoint', 'not worth', 
+    'not happy', 'limited', 'fee', 'fees', 'cost', 'costly',
+    'not good', 'not great', 'beware', 'warn', 'caution', 
+    'better options', 'better card', 'could be better'
+]
+
+POSITIVE_KEYWORDS = [
+    'great', 'excellent', 'awesome', 'worth', 'best', 'love', 
+    'recommend', 'perfect', 'fantastic', 'amazing', 'valuable',
+    'benefits', 'reward', 'cash back', 'points', 'perks', 'no annual fee',
+    'free', 'bonus', 'satisfied', 'happy with'
+]
+
+# Phrases that indicate conditional positivity
+CONDITIONAL_PHRASES = [
+    "if you", "for those who", "as long as", "assuming", 
+    "provided that", "only if", "when you", "depending on"
+]
+
+# Fee-related phrases that indicate mixed sentiment
+FEE_OFFSET_PHRASES = ["annual fee", "worth the fee", "fee is worth", "justified", "offset"]
+
+# Every keyword list above (and the bare word "fee"), as labels of one shared matcher
+SENTIMENT_MATCHER = KeywordMatcher({
+    "negative": NEGATIVE_KEYWORDS,
+    "positive": POSITIVE_KEYWORDS,
+    "conditional": CONDITIONAL_PHRASES,
+    "fee_offset": FEE_OFFSET_PHRASES,
+    "fee": ["fee"],
+})
+
+
+# Function to analyze sentiment of a text with improved credit card context
+def score_sentiment(text):
+    """Uncached analysis of one text: VADER plus card-specific rules."""
+    if not text or text.strip() == "":
+        return dict(NEUTRAL_SENTIMENT)
+
+    analyzer = get_sentiment_analyzer()
+    if analyzer is None:
+        # Fall back to a neutral sentiment if NLTK could not be set up
+        return dict(NEUTRAL_SENTIMENT)
+
+    # First, get the base sentiment scores from VADER
+    scores = analyzer.polarity_scores(text)
+    compound = scores['compound']
+
+    # Credit card review specific analysis
+    text_lower = text.lower()
+    mentions = SENTIMENT_MATCHER.labels_in(text_lower)
+
+    # Check for mixed sentiment (both positive and negative aspects)
+    has_negative = "negative" in mentions
+    has_positive = "positive" in mentions
+
+    # Special case for credit card reviews:
+    # If the review mentions positive aspects but also mentions fees/drawbacks,
+    # it should be considered mixed rather than purely positive
+    if has_positive and has_negative:
+        # Override the VADER compound score for mixed reviews
+        compound = 0  # Neutral compound score for mixed reviews
+        sentiment_type = "neutral"
+        emoji = "😐"
+    elif compound >= 0.05:
+        sentiment_type = "positive"
+        # Gradation of positive emojis
+        if compound >= 0.75:
+            emoji = "😍"  # Extremely positive
+        elif compound >= 0.5:
+            emoji = "😁"  # Very positive
+        else:
+            emoji = "🙂"  # Moderately positive
+    elif compound <= -0.05:
+        sentiment_type = "negative"
+        # Gradation of negative emojis
+        if compound <= -0.75:
+            emoji = "😡"  # Extremely negative
+        elif compound <= -0.5:
+            emoji = "😞"  # Very negative
+        else:
+            emoji = "😕"  # Moderately negative
+    else:
+        sentiment_type = "neutral"
+        emoji = "😐"  # Neutral
+
+    # Look for specific phrases that indicate conditional positivity
+    if "conditional" in mentions and compound > 0:
+        # Reviews with conditional statements are more nuanced
+        if compound > 0.5:  # If it was very positive, tone it down
+            compound = 0.3  # Make it only slightly positive
+            emoji = "🙂"
+            sentiment_type = "positive"
+        else:
+            compound = 0  # Otherwise make it neutral
+            emoji = "😐"
+            sentiment_type = "neutral"
+
+    # Check for specific fee-related phrases that indicate mixed sentiment
+    if "fee" in mentions and "fee_offset" in mentions:
+        # Reviews discussing fee-value tradeoffs are generally mixed
+        compound = 0
+        emoji = "😐"
+        sentiment_type = "neutral"
+
+    return {
+        "compound": compound,
+        "pos": scores["pos"],
+        "neu": scores["neu"],
+        "neg": scores["neg"],
+        "sentiment": sentiment_type,
+        "emoji": emoji
+    }
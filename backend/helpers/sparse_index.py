@@ -0,0 +1,195 @@
+"""
+BM25 keyword scoring over an inverted index of the card documents.
+
+The dense score compares queries and cards in a 130-dimensional SVD space,
+which blurs exact hits on card names, issuers and airline programmes. A
+KeywordIndex scores the same documents the models are fitted on (each
+card's informed description and its joined user reviews) with BM25,
+weighted per field like the dense score, and ``fuse`` merges the two:
+
+- "dense": the dense score alone (the default; no index is built),
+- "weighted": ``(1 - weight) * dense + weight * keyword``, where the
+  keyword score is BM25 divided by the query's best BM25 score,
+- "rrf": reciprocal-rank fusion, ``1 / (k + dense rank) + 1 / (k + keyword
+  rank)``, divided by its largest possible value so it stays in [0, 1].
+
+Each (field, term) posting list stores card ids and their precomputed,
+field-weighted BM25 impacts, plus the largest impact as its upper bound.
+``top_k`` uses those bounds for MaxScore-style early termination: lists are
+processed from the highest bound down, and once the bounds of the lists
+left can't lift an unseen card (or a low-scoring one) past the current
+k-th best score, those cards are no longer considered. The app can use it
+to pick the cards worth scoring at all on large catalogues.
+"""
+
+import math
+
+import numpy as np
+
+from helpers import model_store
+from helpers.model_store import TOKEN_PATTERN
+
+FUSIONS = ("dense", "weighted", "rrf")
+K1 = 1.2
+B = 0.75
+RRF_K = 60
+
+
+class KeywordIndex(object):
+    """Inverted index over several text fields per card, scored with BM25.
+
+    ``fields`` is a list of (weight, documents) pairs with one document per
+    card; a card's score is the weighted sum of its per-field BM25 scores.
+    Tokens are lowercased words as for the TF-IDF vectorizers, minus
+    ``stop_words``.
+    """
+
+    def __init__(self, fields, stop_words=(), k1=K1, b=B):
+        self.stop_words = frozenset(stop_words)
+        self.size = len(fields[0][1]) if fields else 0
+        # term -> ids of its posting lists (one per field the term occurs in)
+        self.terms = {}
+        self._ids = []
+        self._impacts = []
+        upper_bounds = []
+
+        for weight, documents in fields:
+            postings = {}
+            lengths = np.zeros(self.size)
+            for card, document in enumerate(documents):
+                counts = {}
+                for token in TOKEN_PATTERN.findall(document.lower()):
+                    if token not in self.stop_words:
+                        counts[token] = counts.get(token, 0) + 1
+                lengths[card] = sum(counts.values())
+                for token, count in counts.items():
+                    postings.setdefault(token, ([], []))
+                    postings[token][0].append(card)
+                    postings[token][1].append(count)
+            norms = k1 * (1 - b + b * lengths / max(lengths.mean(), 1.0)) if self.size else lengths
+
+            for token, (cards, counts) in postings.items():
+                cards = np.array(cards, dtype=np.int64)
+                counts = np.array(counts, dtype=np.float64)
+                idf = math.log(1 + (self.size - len(cards) + 0.5) / (len(cards) + 0.5))
+                impacts = weight * idf * counts * (k1 + 1) / (counts + norms[cards])
+                self.terms.setdefault(token, []).append(len(self._ids))
+                self._ids.append(cards)
+                self._impacts.append(impacts)
+                upper_bounds.append(impacts.max())
+        self.upper_bounds = np.array(upper_bounds)
+
+    @classmethod
+    def from_models(cls, data, models, weights=(0.7, 0.3)):
+        """Index of the documents the models were fitted on, weighted like the dense score"""
+        return cls([(weights[0], model_store.description_documents(data)),
+                    (weights[1], model_store.review_documents(data))],
+                   model_store.fitted_stop_words(models))
+
+    def posting_lists(self, query):
+        """Ids of the posting lists of the query's distinct indexed terms"""
+        lists = []
+        for token in dict.fromkeys(TOKEN_PATTERN.findall(query.lower())):
+            lists += self.terms.get(token, [])
+        return lists
+
+    def scores(self, queries):
+        """(queries x cards) BM25 scores of every card"""
+        scores = np.zeros((len(queries), self.size))
+        for row, query in enumerate(queries):
+            for j in self.posting_lists(query):
+                # Card ids are unique within a list, so fancy-index += is safe
+                scores[row, self._ids[j]] += self._impacts[j]
+        return scores
+
+    def top_k(self, query, k, allowed=None):
+        """(card ids, BM25 scores) of the k best allowed cards, best first, with MaxScore pruning.
+
+        Cards without any query term are never returned, so fewer than k
+        may come back.
+        """
+        lists = sorted(self.posting_lists(query), key=lambda j: -self.upper_bounds[j])
+        # remaining[j]: the most the lists from j on can still add to a card
+        remaining = np.append(np.cumsum(self.upper_bounds[lists][::-1])[::-1], 0.0)
+        ids = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0)
+        threshold = 0.0
+
+        for position, j in enumerate(lists):
+            list_ids, impacts = self._ids[j], self._impacts[j]
+            if allowed is not None:
+                keep = allowed[list_ids]
+                list_ids, impacts = list_ids[keep], impacts[keep]
+            if len(ids) >= k and remaining[position] < threshold:
+                # No card outside the accumulator can reach the top k any more:
+                # only add this list's impacts to the cards already there
+                at = np.minimum(np.searchsorted(list_ids, ids), max(len(list_ids) - 1, 0))
+                hit = list_ids[at] == ids if len(list_ids) else np.zeros(len(ids), dtype=bool)
+                scores[hit] += impacts[at[hit]]
+            else:
+                merged = np.union1d(ids, list_ids)
+                merged_scores = np.zeros(len(merged))
+                merged_scores[np.searchsorted(merged, ids)] = scores
+                merged_scores[np.searchsorted(merged, list_ids)] += impacts
+                ids, scores = merged, merged_scores
+
+            if len(ids) >= k:
+                # Scores only grow, so today's k-th best is a lower bound on the final one
+                threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+                keep = scores + remaining[position + 1] >= threshold
+                ids, scores = ids[keep], scores[keep]
+
+        order = np.lexsort((ids, -scores))[:k]
+        return ids[order], scores[order]
+
+    def candidates(self, queries, k, allowed=None):
+        """(allowed narrowed to each query's top_k cards, their BM25 scores), both (queries x cards).
+
+        A query without any indexed term keeps all its allowed cards.
+        """
+        scores = np.zeros((len(queries), self.size))
+        narrowed = np.ones(scores.shape, dtype=bool) if allowed is None else allowed.copy()
+        for row, query in enumerate(queries):
+            ids, row_scores = self.top_k(query, k, None if allowed is None else allowed[row])
+            if len(ids) == 0:
+                continue
+            scores[row, ids] = row_scores
+            narrowed[row] = False
+            narrowed[row, ids] = True
+        return narrowed, scores
+
+    def stats(self):
+        return {"terms": len(self.terms), "postings": int(sum(len(ids) for ids in self._ids))}
+
+
+def normalize_scores(scores, candidates):
+    """Each row divided by its best score among candidates (rows without a hit stay 0)"""
+    best = np.where(candidates, scores, 0.0).max(axis=1, initial=0.0)
+    best[best == 0] = 1.0
+    return scores / best[:, None]
+
+
+def _ranks(scores, ids):
+    """1-based rank of each of ids by descending score, ties broken by card id"""
+    ranks = np.empty(len(ids), dtype=np.int64)
+    ranks[np.lexsort((ids, -scores[ids]))] = np.arange(1, len(ids) + 1)
+    return ranks
+
+
+def fuse(fusion, dense, keyword, candidates, weight=0.3, rrf_k=RRF_K):
+    """Combined (queries x cards) scores of the candidate cards; keyword is normalized BM25"""
+    if fusion == "dense":
+        return dense
+    if fusion == "weighted":
+        return (1 - weight) * dense + weight * keyword
+    if fusion != "rrf":
+        raise ValueError(f"Unknown fusion {fusion!r}; expected one of {', '.join(FUSIONS)}")
+
+    fused = np.zeros(dense.shape)
+    for row in range(len(dense)):
+        ids = np.flatnonzero(candidates[row])
+        fused[row, ids] = 1.0 / (rrf_k + _ranks(dense[row], ids))
+        # Only cards that contain a query term have a keyword rank
+        hits = ids[keyword[row, ids] > 0]
+        fused[row, hits] += 1.0 / (rrf_k + _ranks(keyword[row], hits))
+    return fused * (rrf_k + 1) / 2.0
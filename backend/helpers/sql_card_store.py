@@ -0,0 +1,331 @@
+"""
+The card catalogue in a SQL database, with hard filters as indexed queries.
+
+``SQLCardStore`` uses this normalized schema:
+
+    cards            id (catalogue row), name, issuer, category,
+                     annual_fee_number, credit_score_low,
+                     record (the card's JSON, minus its reviews)
+    card_categories  card_id, category (one row per category label)
+    reviews          card_id, position, text
+    catalog_meta     key, value (the source dataset's SHA-256)
+
+Every filter column is indexed, so the hard filters of a query are one
+indexed SELECT of card ids.
+
+Workers keep only the record keys ranking reads (``RANKING_KEYS``) in
+memory. The rest of a card's record and its review texts are read from
+the database when a result page needs them, by card name, with the most
+recently read ones cached. Rewriting the database under running workers
+makes those reads fail until the workers are restarted.
+
+Load a database from the dataset file with:
+
+    cd backend
+    python -m helpers.sql_card_store load sqlite:///cards.db
+
+and start the app with ``CARD_MATCH_CARD_STORE=sqlite:///cards.db``. Any
+SQLAlchemy URL works; SQLite is the local stand-in for MySQL.
+"""
+
+import argparse
+import functools
+import hashlib
+import json
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+import sqlalchemy as db
+from sqlalchemy.dialects import mysql
+
+from helpers import columnar, model_store
+from helpers.card_store import table_mask
+from helpers.card_table import parse_annual_fee, parse_credit_score
+from helpers.MySQLDatabaseHandler import MySQLDatabaseHandler
+
+# Schema of SQLCardStore; catalogue order is the id order
+metadata = db.MetaData()
+cards_table = db.Table(
+    "cards", metadata,
+    db.Column("id", db.Integer, primary_key=True, autoincrement=False),
+    db.Column("name", db.String(255), nullable=False, unique=True),
+    db.Column("issuer", db.String(255), index=True),
+    db.Column("category", db.String(255), index=True),
+    # NULL when the fee or the minimum score is unknown (or the fee has no amount)
+    db.Column("annual_fee_number", db.Float, index=True),
+    db.Column("credit_score_low", db.Float, index=True),
+    db.Column("record", db.Text().with_variant(mysql.MEDIUMTEXT(), "mysql"), nullable=False),
+)
+card_categories_table = db.Table(
+    "card_categories", metadata,
+    db.Column("card_id", db.Integer, db.ForeignKey("cards.id"), primary_key=True),
+    db.Column("category", db.String(64), primary_key=True),
+    db.Index("ix_card_categories_category", "category", "card_id"),
+)
+reviews_table = db.Table(
+    "reviews", metadata,
+    db.Column("card_id", db.Integer, db.ForeignKey("cards.id"), primary_key=True),
+    db.Column("position", db.Integer, primary_key=True, autoincrement=False),
+    db.Column("text", db.Text, nullable=False),
+)
+meta_table = db.Table(
+    "catalog_meta", metadata,
+    db.Column("key", db.String(64), primary_key=True),
+    db.Column("value", db.String(255)),
+)
+
+
+# Record keys ranking, the hard filters, the match factors and the models'
+# description documents read; workers hold these for every card
+RANKING_KEYS = frozenset({
+    "name", "short_card_name", "issuer", "category", "our_take_value", "pros_value",
+    "annual_fee_value", "foreign_transaction_fee_value", "credit_score_low", "bonus_offer_value",
+    "offer_details_value", "rewards_rate_value", "associated_airlines", "income_tier", "travel_value_score",
+})
+# Full records and review lists of this many cards are cached per worker
+RECORD_CACHE_SIZE = 256
+
+
+class SQLReviewList(Sequence):
+    """One card's review texts, read from the database on access; its length is known up front."""
+
+    __slots__ = ("_store", "_name", "_count")
+
+    def __init__(self, store, name, count):
+        self._store = store
+        self._name = name
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        reviews = self._store.reviews(self._name)
+        if isinstance(i, slice):
+            return list(reviews[i])
+        return reviews[i]
+
+
+class SQLRecord(Mapping):
+    """Read-only view of one stored card: RANKING_KEYS from memory, every other key from the database."""
+
+    __slots__ = ("_records", "_row")
+
+    def __init__(self, records, row):
+        self._records = records
+        self._row = row
+
+    def __getitem__(self, key):
+        fields = self._records.fields[self._row]
+        if key in fields:
+            return fields[key]
+        if key in RANKING_KEYS or key == "user_reviews":
+            raise KeyError(key)
+        return self._records.store.record(fields["name"])[key]
+
+    def __iter__(self):
+        return iter(self._records.store.record(self._records.fields[self._row]["name"]))
+
+    def __len__(self):
+        return len(self._records.store.record(self._records.fields[self._row]["name"]))
+
+
+class SQLRecords(Sequence):
+    """The cards loaded by SQLCardStore.load, in id order; the same view object is returned for a row every time."""
+
+    def __init__(self, store, fields):
+        self.store = store
+        # Per card: its RANKING_KEYS, and an SQLReviewList under "user_reviews"
+        self.fields = fields
+        self._records = [None] * len(fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        record = self._records[i]
+        if record is None:
+            record = self._records[i] = SQLRecord(self, i)
+        return record
+
+    def field(self, key, default=None):
+        if key in RANKING_KEYS or key == "user_reviews":
+            return [fields.get(key, default) for fields in self.fields]
+        return [record.get(key, default) for record in self]
+
+
+def _number(value):
+    return None if np.isnan(value) or np.isinf(value) else float(value)
+
+
+class SQLCardStore(object):
+    """The catalogue in a SQL database; hard filters run as indexed queries."""
+
+    kind = "sql"
+
+    def __init__(self, handler):
+        self.handler = handler
+        # SHA-256 of the dataset the database was loaded from, once known
+        self.sha = None
+        self.record = functools.lru_cache(maxsize=RECORD_CACHE_SIZE)(self._record)
+        self.reviews = functools.lru_cache(maxsize=RECORD_CACHE_SIZE)(self._reviews)
+
+    @classmethod
+    def from_url(cls, url, **pool):
+        return cls(MySQLDatabaseHandler(url=url, **pool))
+
+    def write(self, records, source_sha=None):
+        """Replace the stored catalogue with records, in one transaction.
+
+        ``source_sha`` is the hash of the dataset file records came from, so
+        model artifacts built from that file match; without one, a hash of
+        the records' JSON is stored instead. Records loaded from this
+        database are read in full first, as its tables are replaced.
+        """
+        records = [dict(card, user_reviews=list(card["user_reviews"])) if "user_reviews" in card else dict(card)
+                   for card in records]
+        if source_sha is None:
+            source_sha = hashlib.sha256(
+                json.dumps(records, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+        def card_rows():
+            for i, card in enumerate(records):
+                # Reviews live in their own table; keep the key so it is restored in place
+                record = dict(card, user_reviews=[]) if "user_reviews" in card else dict(card)
+                yield {
+                    "id": i,
+                    "name": card["name"],
+                    "issuer": card.get("issuer", ""),
+                    "category": card.get("category", ""),
+                    "annual_fee_number": _number(parse_annual_fee(card.get("annual_fee_value", "N/A"))),
+                    "credit_score_low": _number(parse_credit_score(card.get("credit_score_low", "N/A"))),
+                    "record": json.dumps(record, ensure_ascii=False),
+                }
+
+        def category_rows():
+            for i, card in enumerate(records):
+                labels = {c.strip() for c in card.get("category", "").lower().split(",") if c.strip()}
+                for label in sorted(labels):
+                    yield {"card_id": i, "category": label}
+
+        def review_rows():
+            for i, card in enumerate(records):
+                for position, text in enumerate(card.get("user_reviews", [])):
+                    yield {"card_id": i, "position": position, "text": text}
+
+        with self.handler.transaction() as conn:
+            metadata.drop_all(conn)
+            metadata.create_all(conn)
+            self.handler.bulk_insert("cards", card_rows(), conn=conn)
+            self.handler.bulk_insert("card_categories", category_rows(), conn=conn)
+            self.handler.bulk_insert("reviews", review_rows(), conn=conn)
+            self.handler.bulk_insert("catalog_meta", [{"key": "source_sha256", "value": source_sha}], conn=conn)
+        self.sha = source_sha
+        self.record.cache_clear()
+        self.reviews.cache_clear()
+        return source_sha
+
+    def load(self):
+        """(records, source sha) of the stored catalogue, in id order.
+
+        The records are SQLRecords: only their RANKING_KEYS and review
+        counts are held in memory. The sha is None when the database has no
+        catalog_meta row (it wasn't written by ``write``); snapshots of it
+        are then filtered in memory.
+        """
+        self.sha = self._stored_sha()
+        self.record.cache_clear()
+        self.reviews.cache_clear()
+        counts = dict(self.handler.query_selector(
+            db.select(reviews_table.c.card_id, db.func.count()).group_by(reviews_table.c.card_id)))
+        fields = []
+        with self.handler.query_stream(
+                db.select(cards_table.c.id, cards_table.c.record).order_by(cards_table.c.id)) as rows:
+            for card_id, record in rows:
+                card = json.loads(record)
+                kept = {key: value for key, value in card.items() if key in RANKING_KEYS}
+                if "user_reviews" in card:
+                    kept["user_reviews"] = SQLReviewList(self, card["name"], counts.get(card_id, 0))
+                fields.append(kept)
+        return SQLRecords(self, fields), self.sha
+
+    def _stored_sha(self):
+        rows = self.handler.query_selector(
+            db.select(meta_table.c.value).where(meta_table.c.key == "source_sha256"))
+        return rows[0][0] if rows else None
+
+    def _check_unchanged(self, conn):
+        """Raise if the database was rewritten since this worker loaded or wrote it"""
+        stored = conn.execute(
+            db.select(meta_table.c.value).where(meta_table.c.key == "source_sha256")).scalar()
+        if stored != self.sha:
+            raise RuntimeError("The card database was rewritten since it was loaded; restart the app")
+
+    def _record(self, name):
+        """A stored card's record, without its reviews (cached in ``record``)"""
+        with self.handler.lease_connection() as conn:
+            self._check_unchanged(conn)
+            record = conn.execute(db.select(cards_table.c.record).where(cards_table.c.name == name)).scalar()
+        if record is None:
+            raise KeyError(name)
+        return json.loads(record)
+
+    def _reviews(self, name):
+        """A stored card's review texts, in order (cached in ``reviews``)"""
+        card_id = db.select(cards_table.c.id).where(cards_table.c.name == name).scalar_subquery()
+        with self.handler.lease_connection() as conn:
+            self._check_unchanged(conn)
+            rows = conn.execute(db.select(reviews_table.c.text).where(reviews_table.c.card_id == card_id)
+                                .order_by(reviews_table.c.position)).fetchall()
+        return tuple(row[0] for row in rows)
+
+    def candidate_ids(self, min_credit_score=None, max_annual_fee=None, issuer=None, category=None):
+        """Sorted ids of the stored cards that pass the hard filters"""
+        query = db.select(cards_table.c.id)
+        if min_credit_score is not None:
+            query = query.where(db.or_(cards_table.c.credit_score_low.is_(None),
+                                       cards_table.c.credit_score_low <= min_credit_score))
+        if max_annual_fee is not None:
+            # NULL (unknown) fees never pass, as in table_mask
+            if max_annual_fee == 0:
+                query = query.where(cards_table.c.annual_fee_number == 0)
+            else:
+                query = query.where(cards_table.c.annual_fee_number <= max_annual_fee)
+        if issuer is not None:
+            query = query.where(cards_table.c.issuer == issuer)
+        if category is not None:
+            query = query.where(cards_table.c.id.in_(
+                db.select(card_categories_table.c.card_id)
+                .where(card_categories_table.c.category == category.lower())))
+        return np.fromiter((row[0] for row in self.handler.query_selector(query.order_by(cards_table.c.id))),
+                           dtype=np.int64)
+
+    def candidate_mask(self, snapshot, **limits):
+        """Mask of the snapshot's cards that pass the hard filters.
+
+        The database only describes snapshots loaded from it unchanged; a
+        snapshot with runtime edits (which have no dataset sha) is filtered
+        in memory instead.
+        """
+        if snapshot.dataset_sha is None or snapshot.dataset_sha != self.sha:
+            return table_mask(snapshot, **limits)
+        mask = np.zeros(snapshot.size, dtype=bool)
+        mask[self.candidate_ids(**limits)] = True
+        return mask
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the card catalogue into a SQL database")
+    parser.add_argument("command", choices=["load"])
+    parser.add_argument("url", help="SQLAlchemy database URL, e.g. sqlite:///cards.db")
+    parser.add_argument("--dataset", default=model_store.DEFAULT_DATASET_PATH)
+    args = parser.parse_args()
+    data, dataset_sha = columnar.load_dataset(args.dataset)
+    SQLCardStore.from_url(args.url).write([dict(card) for card in data], dataset_sha)
+    print(f"Loaded {len(data)} cards into {db.make_url(args.url).render_as_string(hide_password=True)}")
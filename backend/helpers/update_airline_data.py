@@ -5,13 +5,17 @@ import re
 import time
 from pathlib import Path
 
+try:
+    from helpers.keyword_matcher import KeywordMatcher
+except ImportError:
+    # Run as a script from inside helpers/
+    from keyword_matcher import KeywordMatcher
+
 """
 This script analyzes the credit card dataset and automatically adds
 airline associations based on card names, descriptions, and other fields.
 """
 
-print("Starting airline association script...")
-
 # Define major airlines and their common variations
 AIRLINES = {
     "delta": ["delta", "delta air", "skymiles"],
@@ -36,8 +40,6 @@ AIRLINES = {
     "asiana": ["asiana", "asiana airlines"]
 }
 
-print(f"Loaded {len(AIRLINES)} airline references")
-
 # Hotel chains for future use
 HOTEL_CHAINS = {
     "marriott": ["marriott", "bonvoy", "westin", "sheraton", "ritz-carlton", "ritz carlton"],
@@ -50,7 +52,14 @@ HOTEL_CHAINS = {
     "radisson": ["radisson", "radisson rewards", "country inn", "park inn"]
 }
 
-print(f"Loaded {len(HOTEL_CHAINS)} hotel chain references")
+# Words to exclude from matching
+WORDS_TO_EXCLUDE = ["credit", "card", "want"]
+
+# Every airline alias, labelled with its airline
+AIRLINE_MATCHER = KeywordMatcher({
+    airline: [keyword for keyword in keywords if keyword not in WORDS_TO_EXCLUDE]
+    for airline, keywords in AIRLINES.items()
+})
 
 # Define income tiers based on annual fee
 def get_income_tier(annual_fee):
@@ -174,20 +183,8 @@ def update_dataset():
             card.get("our_take_value", "")).lower()
         )
         
-        # Find airline associations
-        associated_airlines = []
-        words_to_exclude = ["credit", "card", "want"]  # Words to exclude from matching
-        for airline, keywords in AIRLINES.items():
-            for keyword in keywords:
-                # Skip matching on excluded words
-                if keyword in words_to_exclude:
-                    continue
-                if keyword in search_text:
-                    associated_airlines.append(airline)
-                    break  # Found one keyword for this airline
-        
-        # Remove duplicates and sort
-        associated_airlines = sorted(list(set(associated_airlines)))
+        # Find airline associations (sorted, one entry per airline)
+        associated_airlines = sorted(AIRLINE_MATCHER.labels_in(search_text))
         
         # Calculate income tier
         income_tier = get_income_tier(card.get("annual_fee_value"))
@@ -236,6 +233,9 @@ def update_dataset():
     print("-" * 50)
 
 if __name__ == "__main__":
+    print("Starting airline association script...")
+    print(f"Loaded {len(AIRLINES)} airline references")
+    print(f"Loaded {len(HOTEL_CHAINS)} hotel chain references")
     print("Script execution started")
     update_dataset()
     print("Script execution finished") 
\ No newline at end of file
@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+TOKEN = "test-token"
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", TOKEN)
+    original = app_module.catalog.current
+    sha = app_module.catalog.dataset_sha
+    yield app_module.app.test_client()
+    # Put the loaded catalogue back for the next test
+    app_module.catalog.replace(list(original.data), original.models, original.dataset_sha)
+    app_module.catalog.dataset_sha = sha
+
+
+def admin(client, method, path, body=None, token=TOKEN):
+    return client.open(path, method=method, json=body, headers={"X-Admin-Token": token} if token else {})
+
+
+def titles(client, query):
+    response = client.post("/recommend", json={"query": query, "limit": 5, "profile": "minimal"})
+    assert response.status_code == 200
+    return [match["title"] for match in response.get_json()["recommendations"]]
+
+
+@pytest.mark.parametrize("token", [None, "wrong"])
+def test_admin_api_needs_the_token(client, token):
+    version = admin(client, "GET", "/admin/catalog").get_json()["catalog"]["version"]
+    assert admin(client, "GET", "/admin/catalog", token=token).status_code == 403
+    assert admin(client, "DELETE", "/admin/cards/anything", token=token).status_code == 403
+    assert admin(client, "POST", "/admin/catalog/save", token=token).status_code == 403
+    assert admin(client, "GET", "/admin/catalog").get_json()["catalog"]["version"] == version
+
+
+def test_admin_api_is_off_without_a_token(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", None)
+    assert admin(client, "GET", "/admin/catalog").status_code == 403
+    assert admin(client, "GET", "/admin/catalog", token="").status_code == 403
+
+
+def test_upserted_card_is_recommended(client, app_module):
+    snapshot = app_module.catalog.current
+    card = dict(snapshot.data[7])
+    # The fitted vocabulary still knows the card's words once it is gone
+    query = card["our_take_value"]
+    assert titles(client, query)[0] == card["name"]
+    assert admin(client, "DELETE", f"/admin/cards/{card['name']}").status_code == 200
+    assert card["name"] not in titles(client, query)
+
+    card["name"] = "Readded Card"
+    response = admin(client, "PUT", "/admin/cards/Readded Card", card)
+    assert response.status_code == 200
+    info = response.get_json()["catalog"]
+    assert info["cards"] == snapshot.size and info["models"] == "fold-in"
+    assert info["version"] == snapshot.version + 2
+    assert titles(client, query)[0] == "Readded Card"
+
+
+def test_reviews_are_added_and_removed(client, app_module):
+    name = app_module.catalog.current.card_names[0]
+    reviews = admin(client, "GET", "/admin/catalog").get_json()["catalog"]["reviews"]
+    response = admin(client, "POST", f"/admin/cards/{name}/reviews", {"reviews": ["brand new review"]})
+    assert response.status_code == 200 and response.get_json()["catalog"]["reviews"] == reviews + 1
+    response = admin(client, "DELETE", f"/admin/cards/{name}/reviews", {"reviews": ["brand new review"]})
+    assert response.status_code == 200 and response.get_json()["catalog"]["reviews"] == reviews
+
+
+@pytest.mark.parametrize("method,path,body", [
+    ("PUT", "/admin/cards/X", [1, 2]),
+    ("PUT", "/admin/cards/X", {"user_reviews": "not a list"}),
+    ("POST", "/admin/cards/{name}/reviews", {"reviews": [""]}),
+    ("POST", "/admin/cards/{name}/reviews", {}),
+    ("POST", "/admin/cards/{name}/reviews", ["not", "an", "object"]),
+    ("DELETE", "/admin/cards/{name}/reviews", {"reviews": [{"a": 1}]}),
+    ("DELETE", "/admin/cards/{name}/reviews", {"reviews": "text"}),
+    ("DELETE", "/admin/cards/{name}/reviews", None),
+])
+def test_invalid_edits_are_rejected(client, app_module, method, path, body):
+    snapshot = app_module.catalog.current
+    response = admin(client, method, path.format(name=snapshot.card_names[0]), body)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+    assert app_module.catalog.current is snapshot
+
+
+@pytest.mark.parametrize("method,path,body", [
+    ("DELETE", "/admin/cards/No Such Card", None),
+    ("POST", "/admin/cards/No Such Card/reviews", {"reviews": ["text"]}),
+    ("DELETE", "/admin/cards/No Such Card/reviews", {"reviews": ["text"]}),
+])
+def test_unknown_cards_are_404(client, method, path, body):
+    response = admin(client, method, path, body)
+    assert response.status_code == 404
+    assert "No Such Card" in response.get_json()["error"]
+
+
+def test_save_writes_the_edited_catalogue(client, app_module, monkeypatch, tmp_path):
+    path = tmp_path / "dataset.json"
+    monkeypatch.setattr(app_module, "json_file_path", str(path))
+    name = app_module.catalog.current.card_names[0]
+    admin(client, "DELETE", f"/admin/cards/{name}")
+    response = admin(client, "POST", "/admin/catalog/save")
+    assert response.status_code == 200
+    saved = json.loads(path.read_text())
+    assert len(saved) == app_module.catalog.current.size
+    assert name not in {card["name"] for card in saved}
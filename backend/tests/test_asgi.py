@@ -0,0 +1,168 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import asgi
+
+
+class StubApp(object):
+    """Stand-in for call_wsgi: each request blocks until released, and is recorded when it starts."""
+
+    def __init__(self):
+        self.started = []
+        self.release = threading.Event()
+
+    def __call__(self, environ):
+        self.started.append(environ["PATH_INFO"])
+        self.release.wait(5)
+        return 200, [("Content-Type", "text/plain")], environ["PATH_INFO"].encode()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = StubApp()
+    monkeypatch.setattr(asgi, "call_wsgi", stub)
+    yield stub
+    stub.release.set()
+
+
+def environ(path="/recommend"):
+    return {"PATH_INFO": path}
+
+
+async def until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting"
+        await asyncio.sleep(0.01)
+
+
+def server(**options):
+    options = dict(dict(pool_kind="thread", workers=2, max_pending=2, timeout=5, shutdown_grace=5), **options)
+    return asgi.RecommendServer(**options)
+
+
+def test_full_server_answers_503(stub):
+    async def scenario():
+        srv = server()
+        srv.start()
+        running = [asyncio.ensure_future(srv.rank(environ(f"/r{i}"))) for i in range(2)]
+        await until(lambda: len(stub.started) == 2)
+        status, headers, body = await srv.rank(environ("/r2"))
+        assert status == 503 and ("Retry-After", "1") in headers
+        assert "busy" in json.loads(body)["error"]
+        assert srv.pending == 2
+
+        stub.release.set()
+        assert [result[0] for result in await asyncio.gather(*running)] == [200, 200]
+        await until(lambda: srv.pending == 0)
+        assert (await srv.rank(environ("/r3")))[0] == 200
+        await srv.stop()
+        assert stub.started == ["/r0", "/r1", "/r3"]
+
+    asyncio.run(scenario())
+
+
+def test_timeout_keeps_capacity_until_the_work_finishes(stub):
+    async def scenario():
+        srv = server(workers=1, max_pending=2, timeout=0.1)
+        srv.start()
+        status, _, body = await srv.rank(environ("/slow"))
+        assert status == 504 and "timed out" in json.loads(body)["error"]
+        # The request still runs in the pool, so it still counts
+        assert srv.pending == 1 and stub.started == ["/slow"]
+
+        # Queued behind it, this one times out before it starts and is cancelled
+        assert (await srv.rank(environ("/queued")))[0] == 504
+        await until(lambda: srv.pending == 1)
+        stub.release.set()
+        await until(lambda: srv.pending == 0)
+        assert stub.started == ["/slow"]
+        await srv.stop()
+
+    asyncio.run(scenario())
+
+
+def test_timed_out_work_can_fill_the_server(stub):
+    async def scenario():
+        srv = server(workers=1, max_pending=1, timeout=0.1)
+        srv.start()
+        assert (await srv.rank(environ("/slow")))[0] == 504
+        # The client gave up, but the worker is still busy with it
+        assert (await srv.rank(environ("/next")))[0] == 503
+        stub.release.set()
+        await until(lambda: srv.pending == 0)
+        assert (await srv.rank(environ("/next")))[0] == 200
+        await srv.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stop_refuses_new_work_and_waits_for_running_requests(stub):
+    async def scenario():
+        srv = server()
+        srv.start()
+        running = asyncio.ensure_future(srv.rank(environ("/running")))
+        await until(lambda: stub.started == ["/running"])
+        stopping = asyncio.ensure_future(srv.stop())
+        await until(lambda: srv.closing)
+
+        status, headers, body = await srv.rank(environ("/late"))
+        assert status == 503 and ("Retry-After", "5") in headers
+        assert "shutting down" in json.loads(body)["error"]
+        await asyncio.sleep(0.05)
+        assert not stopping.done()
+
+        stub.release.set()
+        assert (await running)[0] == 200
+        await asyncio.wait_for(stopping, 2)
+        assert srv.pending == 0 and stub.started == ["/running"]
+
+    asyncio.run(scenario())
+
+
+def test_stop_gives_up_after_the_grace_period(stub):
+    async def scenario():
+        srv = server(shutdown_grace=0.1)
+        srv.start()
+        running = asyncio.ensure_future(srv.rank(environ("/stuck")))
+        await until(lambda: stub.started == ["/stuck"])
+        start = time.monotonic()
+        await srv.stop()
+        assert time.monotonic() - start < 1 and srv.pending == 1
+        stub.release.set()
+        assert (await running)[0] == 200
+
+    asyncio.run(scenario())
+
+
+def test_http_requests_go_through_admission_control(stub):
+    async def request(srv, path):
+        sent = []
+        messages = iter([{"type": "http.request", "body": b"{}"}])
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message)
+
+        await srv({"type": "http", "method": "POST", "path": path, "headers": []}, receive, send)
+        return sent[0]["status"], dict(sent[0]["headers"]), sent[1]["body"]
+
+    async def scenario():
+        srv = server(workers=1, max_pending=1)
+        running = asyncio.ensure_future(request(srv, "/recommend"))
+        await until(lambda: stub.started == ["/recommend"])
+        status, headers, _ = await request(srv, "/recommend/batch")
+        assert status == 503 and headers[b"retry-after"] == b"1"
+        stub.release.set()
+        assert await running == (200, {b"content-type": b"text/plain"}, b"/recommend")
+        # Other routes don't count against the ranking pool
+        assert (await request(srv, "/healthz"))[0] == 200
+        await srv.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from helpers.card_face_finder import CardFaceFinder, FaceCache, TokenBucket, update_dataset
+
+
+def result_page(name):
+    m = json.dumps({"murl": f"https://img.example/{urllib.parse.quote(name)}.png"})
+    return f"<html><body><a class='iusc' m='{m}'></a></body></html>"
+
+
+class StubSearch(object):
+    """Local stand-in for Bing Images.
+
+    Answers with a one-result page, except for card names that contain
+    "missing" (404), "slow" (answers after ``delay`` seconds) or "flaky"
+    (503 on the first request). Every request's card name and arrival
+    time are recorded.
+    """
+
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self.requests = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)["q"][0]
+                name = query[:-len(" credit card logo")]
+                with stub._lock:
+                    stub.requests.append((name, time.monotonic()))
+                    attempts = sum(1 for requested, _ in stub.requests if requested == name)
+                if "missing" in name:
+                    status, body = 404, "not found"
+                elif "flaky" in name and attempts == 1:
+                    status, body = 503, "busy"
+                else:
+                    if "slow" in name:
+                        time.sleep(stub.delay)
+                    status, body = 200, result_page(name)
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "text/html")
+                    self.end_headers()
+                    self.wfile.write(body.encode())
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client timed out and hung up
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/images/search?q={{query}}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def names(self):
+        return [name for name, _ in self.requests]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    with StubSearch(delay=1.0) as server:
+        yield server
+
+
+def find_all(stub, names, cache=None, **options):
+    options = dict(dict(concurrency=4, rate=1000.0, burst=10, retries=2, backoff=0.01, timeout=5), **options)
+    finder = CardFaceFinder(search_url=stub.url, **options)
+    try:
+        return asyncio.run(finder.find_all(names, cache))
+    finally:
+        finder.close()
+
+
+def test_finds_image_urls(stub):
+    found = find_all(stub, ["Card A", "Card B", "Card A"])
+    assert found == {"Card A": "https://img.example/Card%20A.png",
+                     "Card B": "https://img.example/Card%20B.png"}
+    # Duplicate names are looked up once
+    assert sorted(stub.names()) == ["Card A", "Card B"]
+
+
+def test_rate_limit_spaces_requests(stub):
+    names = [f"Card {i}" for i in range(6)]
+    start = time.monotonic()
+    found = find_all(stub, names, concurrency=6, rate=20.0, burst=1)
+    elapsed = time.monotonic() - start
+
+    assert len(found) == 6
+    # One token up front, then one every 1/20 s
+    assert elapsed >= 5 / 20.0 * 0.9
+    arrivals = sorted(t for _, t in stub.requests)
+    assert arrivals[-1] - arrivals[0] >= 5 / 20.0 * 0.9
+
+
+def test_token_bucket_allows_bursts():
+    async def acquire_all(bucket, n):
+        start = time.monotonic()
+        for _ in range(n):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # A full bucket hands out its capacity at once
+    assert asyncio.run(acquire_all(TokenBucket(rate=10.0, capacity=5), 5)) < 0.05
+    assert asyncio.run(acquire_all(TokenBucket(rate=10.0, capacity=5), 7)) >= 0.15
+
+
+def test_cache_hits_skip_requests(stub, tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = FaceCache(path)
+    find_all(stub, ["Card A", "Card B"], cache)
+    cache.save()
+    assert len(stub.requests) == 2
+
+    cache = FaceCache(path)
+    assert cache.get("Card A") == "https://img.example/Card%20A.png"
+    found = find_all(stub, ["Card A", "Card B", "Card C"], cache)
+    # Only the card that wasn't cached is looked up
+    assert found == {"Card C": "https://img.example/Card%20C.png"}
+    assert stub.names()[2:] == ["Card C"]
+
+
+def test_not_found_is_not_retried_or_cached(stub):
+    cache = FaceCache()
+    found = find_all(stub, ["missing card", "Card A"], cache)
+    assert list(found) == ["Card A"]
+    assert "missing card" not in cache
+    assert stub.names().count("missing card") == 1
+
+
+def test_retryable_status_is_retried(stub):
+    found = find_all(stub, ["flaky card"])
+    assert found == {"flaky card": "https://img.example/flaky%20card.png"}
+    assert stub.names() == ["flaky card", "flaky card"]
+
+
+def test_timeout_gives_up_after_retries(stub):
+    cache = FaceCache()
+    found = find_all(stub, ["slow card", "Card A"], cache, retries=1, timeout=0.2)
+    assert list(found) == ["Card A"]
+    assert "slow card" not in cache
+    # The first attempt and one retry
+    assert stub.names().count("slow card") == 2
+
+
+def test_update_dataset_fills_image_urls(stub, tmp_path):
+    dataset_path = tmp_path / "dataset.json"
+    cache_path = tmp_path / "cache.json"
+    dataset_path.write_text(json.dumps([{"name": "Card A"}, {"name": "missing card", "image_url": "old.png"}]))
+
+    update_dataset(str(dataset_path), str(cache_path), search_url=stub.url, rate=1000.0, burst=10,
+                   retries=0)
+    cards = json.loads(dataset_path.read_text())
+    assert cards[0]["image_url"] == "https://img.example/Card%20A.png"
+    # A failed lookup keeps the card's current image
+    assert cards[1]["image_url"] == "old.png"
+    assert json.loads(cache_path.read_text()) == {"Card A": "https://img.example/Card%20A.png"}
+    assert not [p for p in tmp_path.iterdir() if p.suffix == ".tmp"]
@@ -0,0 +1,179 @@
+import threading
+
+import numpy as np
+import pytest
+
+from helpers import columnar, model_store, sentiment
+from helpers.catalog import Catalog, CatalogSnapshot
+from helpers.query_rewrite import QueryRewriter
+from helpers.retrieval import build_retriever
+
+N_CARDS = 30
+N_COMPONENTS = 8
+WEIGHTS = (0.7, 0.3)
+
+
+def neutral_sentiments(texts):
+    return [dict(sentiment.NEUTRAL_SENTIMENT) for _ in texts]
+
+
+def make_retriever(desc_matrix, review_matrix, previous=None):
+    return build_retriever("exact", desc_matrix, review_matrix)
+
+
+@pytest.fixture(scope="module")
+def cards():
+    data, _ = columnar.load_dataset(model_store.DEFAULT_DATASET_PATH)
+    return [dict(card) for card in data[:N_CARDS]]
+
+
+@pytest.fixture(scope="module")
+def models(cards):
+    return model_store.fit_models(cards, neutral_sentiments, N_COMPONENTS)
+
+
+class Warmer(object):
+    """warm hook that builds the rewriter and keyword index and records each snapshot"""
+
+    def __init__(self):
+        self.warmed = []
+
+    def __call__(self, snapshot):
+        snapshot.query_rewriter
+        snapshot.keyword_index(WEIGHTS)
+        self.warmed.append(snapshot)
+
+
+@pytest.fixture
+def catalog(cards, models):
+    return Catalog(CatalogSnapshot(list(cards), models, make_retriever), make_retriever, neutral_sentiments,
+                   n_components=N_COMPONENTS, warm=Warmer())
+
+
+def is_built(snapshot):
+    return snapshot._query_rewriter is not None and WEIGHTS in snapshot._keyword_indexes
+
+
+def test_snapshots_are_warmed_before_every_swap(catalog, cards, models):
+    swapped = []
+    catalog.on_swap = lambda snapshot: swapped.append(is_built(snapshot))
+    catalog.upsert_card(dict(cards[0], name="Brand New Card"))
+    catalog.add_reviews("Brand New Card", ["great lounge access"])
+    catalog.replace(list(cards), models)
+    catalog.refit(wait=True)
+    assert swapped == [True] * 4
+    assert catalog.warm.warmed[-1] is catalog.current
+
+
+def test_startup_snapshot_is_warmed_in_the_background(catalog):
+    assert not is_built(catalog.current)
+    catalog.warm_in_background().join()
+    assert is_built(catalog.current)
+
+
+def test_rewriter_is_carried_over_while_the_vocabulary_holds(catalog, cards, models):
+    rewriter = catalog.current.query_rewriter
+    # Folding keeps the fitted vectorizers
+    assert catalog.upsert_card(dict(cards[1], pros_value="zzzunseenword")).query_rewriter is rewriter
+    # Reloading the same catalogue, and refitting one with the same documents
+    assert catalog.replace(list(cards), models).query_rewriter is rewriter
+    catalog.replace(list(reversed(cards)), models)
+    catalog.refit(wait=True)
+    assert catalog.current.models.source != "fold-in"
+    assert catalog.current.query_rewriter is rewriter
+
+
+def test_rewriter_shares_its_index_when_only_the_ranks_change(cards, models):
+    rewriter = QueryRewriter.from_models(models)
+    # A duplicated card changes document frequencies but no vocabulary words
+    refitted = model_store.fit_models(cards + [dict(cards[0])], neutral_sentiments, N_COMPONENTS)
+    shared = QueryRewriter.from_models(refitted, rewriter)
+    assert shared is not rewriter and shared.vocabulary != rewriter.vocabulary
+    assert shared._index is rewriter._index
+    fresh = QueryRewriter.from_models(refitted)
+    for query in ["chace saphire", "travle rewrds", "no anual fee"]:
+        assert shared.rewrite(query) == fresh.rewrite(query)
+
+    smaller = model_store.fit_models(cards[:10], neutral_sentiments, N_COMPONENTS)
+    assert QueryRewriter.from_models(smaller, rewriter)._index is not rewriter._index
+
+
+def test_lazy_parts_are_built_once(cards, models):
+    snapshot = CatalogSnapshot(list(cards), models, make_retriever)
+    rewriters, indexes = [], []
+
+    def use():
+        rewriters.append(snapshot.query_rewriter)
+        indexes.append(snapshot.keyword_index(WEIGHTS))
+    threads = [threading.Thread(target=use) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(r) for r in rewriters}) == 1 and len({id(i) for i in indexes}) == 1
+
+
+def test_edits_publish_new_versions(catalog, cards):
+    first = catalog.current
+    snapshot = catalog.upsert_card(dict(cards[0], name="Brand New Card", user_reviews=["nice card"]))
+    assert snapshot is catalog.current and snapshot.version == first.version + 1
+    assert snapshot.models.source == "fold-in"
+    assert snapshot.index_by_name["Brand New Card"] == N_CARDS
+    assert snapshot.drift == pytest.approx(1 / N_CARDS)
+    # The replaced snapshot is left as it was
+    assert first.size == N_CARDS and "Brand New Card" not in first.index_by_name
+
+    assert catalog.remove_card("Brand New Card").version == first.version + 2
+    assert catalog.current.size == N_CARDS
+    with pytest.raises(KeyError):
+        catalog.remove_card("Brand New Card")
+    assert catalog.current.version == first.version + 2
+
+
+def test_folded_in_card_is_found_by_its_own_text(catalog, cards):
+    card = dict(cards[3], name="Zephyr Quasar Card", short_card_name="Zephyr Quasar")
+    snapshot = catalog.upsert_card(card)
+    models = snapshot.models
+    row = snapshot.index_by_name["Zephyr Quasar Card"]
+    query = models.svd.transform(models.vectorizer.transform(model_store.description_documents([card])))
+    desc_sim, _, _ = snapshot.retriever.search(query, np.zeros((1, N_COMPONENTS)))
+    assert desc_sim[0, row] == pytest.approx(desc_sim[0].max())
+    assert desc_sim[0, row] == pytest.approx(1.0)
+
+
+def test_reviews_are_added_and_removed(catalog, cards):
+    name = cards[2]["name"]
+    before = len(catalog.current.review_index)
+    count = len(cards[2]["user_reviews"])
+    snapshot = catalog.add_reviews(name, ["first new review", "second new review"])
+    assert len(snapshot.review_index) == before + 2
+    row = snapshot.index_by_name[name]
+    assert snapshot.review_index.offsets[row + 1] - snapshot.review_index.offsets[row] == count + 2
+    assert snapshot.review_index.texts[snapshot.review_index.offsets[row + 1] - 1] == "second new review"
+
+    snapshot = catalog.remove_reviews(name, ["first new review", cards[2]["user_reviews"][0]])
+    assert len(snapshot.review_index) == before
+    assert list(snapshot.data[row]["user_reviews"]) == cards[2]["user_reviews"][1:] + ["second new review"]
+
+
+@pytest.mark.parametrize("reviews", [None, "text", [{"a": 1}], [""], ["ok", 3]])
+def test_invalid_reviews_are_rejected(catalog, cards, reviews):
+    version = catalog.current.version
+    with pytest.raises(ValueError):
+        catalog.add_reviews(cards[0]["name"], reviews)
+    with pytest.raises(ValueError):
+        catalog.remove_reviews(cards[0]["name"], reviews)
+    assert catalog.current.version == version
+
+
+def test_drift_past_the_threshold_refits(catalog, cards):
+    catalog.drift_threshold = 1.5 / N_CARDS
+    catalog.upsert_card(dict(cards[0], name="Extra Card 1"))
+    assert catalog._refit_thread is None and catalog.current.drift == pytest.approx(1 / N_CARDS)
+    folded = catalog.upsert_card(dict(cards[0], name="Extra Card 2"))
+    catalog._refit_thread.join()
+    refitted = catalog.current
+    assert refitted.version == folded.version + 1
+    assert refitted.drift == 0 and refitted.fit_size == N_CARDS + 2
+    assert refitted.models.source != "fold-in"
+    assert refitted.size == N_CARDS + 2
@@ -0,0 +1,34 @@
+import numpy as np
+
+from helpers import columnar, model_store
+from helpers.review_index import ReviewIndex
+
+KEYS = [("name", None), ("category", ""), ("annual_fee_value", "N/A"), ("associated_airlines", []),
+        ("income_tier", "any"), ("travel_value_score", 5.0), ("no_such_key", "default")]
+
+
+def test_fields_match_the_json_records(tmp_path):
+    data, sha = columnar.load_dataset(model_store.DEFAULT_DATASET_PATH)
+    # A sparse column: only some cards have it
+    data = [dict(card, promo="spring") if i % 3 == 0 else card for i, card in enumerate(data)]
+    columnar.write_dataset(data, str(tmp_path / "cols"), sha)
+    records, loaded_sha = columnar.load_dataset(str(tmp_path / "cols"))
+    assert loaded_sha == sha
+
+    for key, default in KEYS + [("promo", "")]:
+        view = columnar.field(records, key, default)
+        assert isinstance(view, columnar.FieldColumn)
+        assert list(view) == columnar.field(data, key, default), key
+        assert view[-1] == data[-1].get(key, default)
+
+    reviews = columnar.field(records, "user_reviews", [])
+    texts, offsets = reviews.flat()
+    assert list(texts) == [review for card in data for review in card.get("user_reviews", [])]
+    assert columnar.field(records, "promo", "").flat() is None
+
+    embeddings = np.zeros((len(texts), 2))
+    mapped = ReviewIndex(reviews, embeddings, [None] * len(texts))
+    parsed = ReviewIndex(model_store.card_reviews(data), embeddings, [None] * len(texts))
+    np.testing.assert_array_equal(mapped.offsets, parsed.offsets)
+    np.testing.assert_array_equal(mapped.card_ids, parsed.card_ids)
+    assert [mapped.texts[j] for j in range(len(mapped))] == parsed.texts
@@ -0,0 +1,29 @@
+import json
+import math
+
+import pytest
+
+from helpers import model_store
+from helpers.evaluate import DEFAULT_QUERIES_PATH, load_queries, ndcg, recall, reciprocal_rank
+
+
+def test_metrics():
+    relevant = {"a": 2, "b": 1}
+    assert ndcg(["a", "b", "c"], relevant, 10) == pytest.approx(1.0)
+    # b then a: (1 + 3 / log2(3)) against the ideal (3 + 1 / log2(3))
+    assert ndcg(["b", "a"], relevant, 10) == pytest.approx((1 + 3 / math.log2(3)) / (3 + 1 / math.log2(3)))
+    assert ndcg(["c", "d"], relevant, 10) == 0.0
+    assert reciprocal_rank(["c", "b", "a"], relevant, 10) == pytest.approx(0.5)
+    assert reciprocal_rank(["c", "b"], relevant, 1) == 0.0
+    assert recall(["a", "c"], relevant, 10) == 0.5
+    assert recall(["c", "a"], relevant, 1) == 0.0
+
+
+def test_labelled_queries_name_real_cards():
+    with open(model_store.DEFAULT_DATASET_PATH, encoding="utf-8") as f:
+        names = [card["name"] for card in json.load(f)]
+    queries = load_queries(DEFAULT_QUERIES_PATH, names)
+    assert queries and all(labelled["relevant"] for labelled in queries)
+    graded = next(iter(queries[0]["relevant"]))
+    with pytest.raises(ValueError):
+        load_queries(DEFAULT_QUERIES_PATH, [name for name in names if name != graded])
@@ -0,0 +1,45 @@
+import json
+
+from helpers import model_store
+from helpers.keyword_matcher import SCAN_LIMIT, KeywordMatcher
+from helpers.sentiment import SENTIMENT_MATCHER
+
+
+def test_labels_and_keywords():
+    matcher = KeywordMatcher({"fee": ["annual fee", "fee"], "travel": ["miles", "lounge"], "empty": [""]})
+    text = "no annual fee and lounge access"
+    assert matcher.labels_in(text) == {"fee", "travel"}
+    assert matcher.keywords_in(text) == {"annual fee", "fee", "lounge"}
+    assert matcher.labels_in("") == set()
+    # Keywords shared by several labels count for each
+    shared = KeywordMatcher({"a": ["x"], "b": ["x", "y"]})
+    assert shared.labels == {"x": {"a", "b"}, "y": {"b"}}
+    assert shared.labels_in("x") == {"a", "b"}
+
+
+def test_matches_substring_scans_on_the_reviews():
+    with open(model_store.DEFAULT_DATASET_PATH, encoding="utf-8") as f:
+        texts = [review.lower() for card in json.load(f) for review in card.get("user_reviews", [])]
+    for text in texts:
+        expected = {label for keyword, labels in SENTIMENT_MATCHER.labels.items() if keyword in text
+                    for label in labels}
+        assert SENTIMENT_MATCHER.labels_in(text) == expected
+
+
+def scanned(matcher, text):
+    return {keyword for keyword in matcher.labels if keyword in text}
+
+
+def test_large_tables_match_like_substring_scans():
+    with open(model_store.DEFAULT_DATASET_PATH, encoding="utf-8") as f:
+        texts = [review.lower() for card in json.load(f) for review in card.get("user_reviews", [])]
+    words = sorted({word for text in texts for word in text.split()})
+    # Prefixes, overlapping phrases and regex metacharacters, past the scan limit
+    keywords = words[::3] + [word[:4] for word in words[::7]] + ["annual fee", "fee", "fee is", "a.b", "(x)+"]
+    assert len(set(keywords)) >= SCAN_LIMIT
+    matcher = KeywordMatcher({f"label{i % 7}": keywords[i::7] for i in range(7)})
+    assert matcher._regex is not None
+    for text in texts + ["the annual fee is high", "a.b and (x)+", "axb", ""]:
+        found = scanned(matcher, text)
+        assert matcher.keywords_in(text) == found
+        assert matcher.labels_in(text) == {label for keyword in found for label in matcher.labels[keyword]}
@@ -0,0 +1,26 @@
+import numpy as np
+
+from helpers.keyword_matcher import KeywordMatcher
+from helpers.match_features import MatchFeatures
+
+
+class CategoryTable(object):
+    def __init__(self, categories):
+        self.categories = categories
+
+    def has_category(self, predicate):
+        return np.array([any(predicate(label) for label in labels) for labels in self.categories])
+
+
+def test_query_features_keep_query_order():
+    data = [
+        {"offer_details_value": "Earn travel rewards", "rewards_rate_value": "3x on dining"},
+        {"offer_details_value": "No annual fee", "rewards_rate_value": "2% cash back"},
+    ]
+    features = MatchFeatures(data, CategoryTable([["travel"], ["cash back"]]), KeywordMatcher({}))
+    query = features.for_query("Travel rewards with no annual fee travel card")
+    # Repeated words once, at their first position; short and stop words dropped
+    assert [word for word, _ in query.keywords] == ["travel", "rewards", "with", "annual"]
+    assert [cards.tolist() for _, cards in query.keywords] == [
+        [True, False], [True, False], [False, False], [False, True]]
+    assert [word for word, _ in query.categories] == ["travel", "rewards", "travel"]
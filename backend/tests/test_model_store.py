@@ -0,0 +1,56 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from helpers import columnar, model_store, sentiment
+
+
+@pytest.fixture(scope="module")
+def artifacts(tmp_path_factory):
+    data, sha = columnar.load_dataset(model_store.DEFAULT_DATASET_PATH)
+    directory = str(tmp_path_factory.mktemp("artifacts"))
+    models = model_store.fit_models(data, lambda texts: [dict(sentiment.NEUTRAL_SENTIMENT) for _ in texts], 16)
+    model_store.save_models(models, directory, sha, 16)
+    return directory, sha, models
+
+
+def rewrite_manifest(directory, **changes):
+    path = os.path.join(directory, "manifest.json")
+    with open(path) as f:
+        manifest = json.load(f)
+    original = dict(manifest)
+    manifest.update(changes)
+    with open(path, "w") as f:
+        json.dump(manifest, f)
+    return original
+
+
+def test_matching_artifacts_load(artifacts):
+    directory, sha, models = artifacts
+    loaded = model_store.load_models(directory, sha, 16)
+    assert loaded is not None
+    np.testing.assert_allclose(loaded.tfidf_matrix, models.tfidf_matrix)
+    assert model_store.read_manifest(directory)["sklearn_version"] == model_store.sklearn_version()
+
+
+@pytest.mark.parametrize("changes", [
+    {"sklearn_version": "0.0.1"},
+    {"dataset_sha256": "other"},
+    {"n_components": 32},
+])
+def test_stale_artifacts_are_ignored(artifacts, changes):
+    directory, sha, _ = artifacts
+    original = rewrite_manifest(directory, **changes)
+    try:
+        assert model_store.load_models(directory, sha, 16) is None
+    finally:
+        rewrite_manifest(directory, **original)
+
+
+def test_build_refuses_fallback_sentiment(tmp_path, monkeypatch):
+    monkeypatch.setattr(sentiment, "get_sentiment_analyzer", lambda: None)
+    with pytest.raises(RuntimeError):
+        model_store.build(model_store.DEFAULT_DATASET_PATH, str(tmp_path / "artifacts"), 16)
+    assert not os.path.exists(tmp_path / "artifacts")
@@ -0,0 +1,58 @@
+import pytest
+import sqlalchemy as db
+
+from helpers.MySQLDatabaseHandler import MySQLDatabaseHandler
+
+
+@pytest.fixture
+def handler(tmp_path):
+    # A file database, so connections come from a real QueuePool
+    handler = MySQLDatabaseHandler(url=f"sqlite:///{tmp_path / 'test.db'}", pool_size=2, max_overflow=0)
+    handler.query_executor("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    handler.bulk_insert("items", ({"id": i, "name": f"item {i}"} for i in range(25)), batch_size=10)
+    yield handler
+    handler.dispose()
+
+
+def test_query_selector_is_eager(handler):
+    rows = handler.query_selector("SELECT id, name FROM items WHERE id < :n ORDER BY id", {"n": 3})
+    assert [tuple(row) for row in rows] == [(0, "item 0"), (1, "item 1"), (2, "item 2")]
+    # Every row is fetched, so the connection is already back in the pool
+    assert handler.engine.pool.checkedout() == 0
+    assert handler.query_selector(db.select(db.literal(1)))[0][0] == 1
+
+
+def test_query_stream_reads_every_row(handler):
+    with handler.query_stream("SELECT id FROM items ORDER BY id", batch_size=4) as rows:
+        assert handler.engine.pool.checkedout() == 1
+        assert [row[0] for row in rows] == list(range(25))
+    assert handler.engine.pool.checkedout() == 0
+
+
+def test_query_stream_returns_connection_when_stopped_early(handler):
+    with handler.query_stream("SELECT id FROM items ORDER BY id", batch_size=4) as rows:
+        assert next(iter(rows))[0] == 0
+    assert handler.engine.pool.checkedout() == 0
+
+    with pytest.raises(RuntimeError):
+        with handler.query_stream("SELECT id FROM items") as rows:
+            next(iter(rows))
+            raise RuntimeError("caller failed")
+    assert handler.engine.pool.checkedout() == 0
+    # Both pool slots are still usable
+    assert len(handler.query_selector("SELECT id FROM items")) == 25
+
+
+def test_bulk_insert_counts_rows_and_rolls_back(handler):
+    assert handler.bulk_insert("items", []) == 0
+    with pytest.raises(Exception):
+        # The duplicate id fails the transaction, so item 100 is not kept either
+        handler.bulk_insert("items", [{"id": 100, "name": "new"}, {"id": 0, "name": "duplicate"}])
+    assert handler.query_selector("SELECT COUNT(*) FROM items")[0][0] == 25
+
+
+def test_in_memory_database_is_shared(tmp_path):
+    handler = MySQLDatabaseHandler(url="sqlite://")
+    handler.query_executor(["CREATE TABLE t (x INTEGER)", "INSERT INTO t VALUES (1)"])
+    assert handler.query_selector("SELECT x FROM t")[0][0] == 1
+    handler.dispose()
@@ -0,0 +1,71 @@
+from helpers.result_cache import ResultCache
+
+
+class Value(object):
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+def test_size_budget_evicts_least_recently_used():
+    cache = ResultCache(max_entries=10, max_bytes=100)
+    values = {key: Value(40) for key in "abc"}
+    for key, value in values.items():
+        cache.put(key, value)
+    assert cache.get("a") is None and cache.get("b") is values["b"]
+    assert cache.stats()["bytes"] == 80
+    # Larger than the whole budget: never cached
+    cache.put("d", Value(101))
+    assert cache.get("d") is None
+
+
+def test_growth_is_charged_and_evicts():
+    cache = ResultCache(max_entries=10, max_bytes=100)
+    a, b = Value(30), Value(30)
+    cache.put("a", a)
+    cache.put("b", b)
+    cache.grow("a", a, 20)
+    assert cache.stats()["bytes"] == 80
+    cache.get("a")
+    # b is now the least recently used
+    cache.grow("a", a, 40)
+    assert cache.get("b") is None and cache.get("a") is a
+    assert cache.stats()["bytes"] == 90 and cache.stats()["evictions"] == 1
+
+    # Growth of a value that was replaced or removed is not charged
+    cache.grow("b", b, 50)
+    cache.put("a", Value(10))
+    cache.grow("a", a, 50)
+    assert cache.stats()["bytes"] == 10
+    cache.clear()
+    cache.grow("a", a, 5)
+    assert cache.stats()["bytes"] == 0
+
+
+def test_cached_results_are_charged_for_their_payloads():
+    import app
+
+    app.result_cache.clear()
+    ranked = app.rank_cards("travel rewards with lounge access")
+    charged = app.result_cache.stats()["bytes"]
+    assert charged == ranked.nbytes
+    for profile in app.RESPONSE_PROFILES:
+        app.get_recommendations("travel rewards with lounge access", offset=0, limit=20, profile=profile)
+    assert ranked.nbytes > charged
+    assert app.result_cache.stats()["bytes"] == ranked.nbytes
+    # Payloads served again are not charged twice
+    app.get_recommendations("travel rewards with lounge access", offset=0, limit=20)
+    assert app.result_cache.stats()["bytes"] == ranked.nbytes
+    app.result_cache.clear()
+
+
+def test_payloads_count_against_the_budget(monkeypatch):
+    import app
+
+    cache = ResultCache(max_entries=100, max_bytes=10 ** 9)
+    monkeypatch.setattr(app, "result_cache", cache)
+    ranked = app.rank_cards("no annual fee cash back")
+    cache.max_bytes = ranked.nbytes + 1000
+    # Building a page of payloads pushes the entry past the budget
+    app.get_recommendations("no annual fee cash back", offset=0, limit=20, profile="debug")
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+    assert cache.stats()["evictions"] == 1
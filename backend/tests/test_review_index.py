@@ -0,0 +1,41 @@
+import numpy as np
+
+from helpers.retrieval import ExactRetriever
+from helpers.review_index import cosine_scores, normalize_rows
+
+
+def test_batch_scores_match_single_queries():
+    rng = np.random.default_rng(0)
+    cards = normalize_rows(rng.normal(size=(500, 40)))
+    queries = rng.normal(size=(70, 40))
+    batch = cosine_scores(queries, cards)
+    assert batch.shape == (70, 500)
+    for row, query in enumerate(queries):
+        np.testing.assert_allclose(batch[row], cosine_scores(query[None, :], cards)[0], rtol=0, atol=1e-12)
+    # Cosine similarity, whatever the query's length
+    np.testing.assert_allclose(cosine_scores(3 * queries[:5], cards), batch[:5], rtol=0, atol=1e-12)
+    assert np.abs(batch).max() <= 1 + 1e-12
+
+
+def test_zero_query_scores_zero():
+    cards = normalize_rows(np.eye(4))
+    assert not cosine_scores(np.zeros((1, 4)), cards).any()
+
+
+def test_filtered_batch_matches_single_queries():
+    rng = np.random.default_rng(1)
+    desc, review = normalize_rows(rng.normal(size=(300, 20))), normalize_rows(rng.normal(size=(300, 10)))
+    desc_vecs, review_vecs = rng.normal(size=(6, 20)), rng.normal(size=(6, 10))
+    allowed = np.ones((6, 300), dtype=bool)
+    allowed[1, ::2] = False
+    allowed[2, ::2] = False
+    allowed[3] = False
+    retriever = ExactRetriever(desc, review)
+
+    desc_sim, review_sim, candidates = retriever.search(desc_vecs, review_vecs, allowed)
+    np.testing.assert_array_equal(candidates, allowed)
+    for row in range(6):
+        single = retriever.search(desc_vecs[row:row + 1], review_vecs[row:row + 1], allowed[row:row + 1])
+        np.testing.assert_allclose(desc_sim[row], single[0][0], rtol=0, atol=1e-12)
+        np.testing.assert_allclose(review_sim[row], single[1][0], rtol=0, atol=1e-12)
+    assert not desc_sim[~allowed].any() and not review_sim[~allowed].any()
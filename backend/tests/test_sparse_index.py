@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from helpers.sparse_index import KeywordIndex
+
+WORDS = ["travel", "miles", "lounge", "cash", "back", "grocery", "hotel", "fee", "annual", "points",
+         "dining", "gas", "airline", "bonus", "chase", "amex", "student", "business", "secured", "apr"]
+
+
+def random_index(seed, n_cards=300):
+    rng = np.random.default_rng(seed)
+
+    def document():
+        return " ".join(rng.choice(WORDS, size=rng.integers(0, 12), p=np.linspace(2, 1, len(WORDS)) / 30))
+
+    descriptions = [document() for _ in range(n_cards)]
+    reviews = [document() for _ in range(n_cards)]
+    # Identical cards tie exactly, so the tie-break by card id is exercised
+    for i in range(0, n_cards, 7):
+        descriptions[i + 3 if i + 3 < n_cards else i] = descriptions[i]
+        reviews[i + 3 if i + 3 < n_cards else i] = reviews[i]
+    return KeywordIndex([(0.7, descriptions), (0.3, reviews)], stop_words=["apr"]), rng
+
+
+def exhaustive_top_k(index, query, k, allowed=None):
+    scores = index.scores([query])[0]
+    ids = np.flatnonzero(scores > 0)
+    if allowed is not None:
+        ids = ids[allowed[ids]]
+    # Rounded, so sums taken in a different order still tie
+    order = np.lexsort((ids, -np.round(scores[ids], 9)))[:k]
+    return ids[order], scores[ids[order]]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_top_k_matches_exhaustive_scoring(seed):
+    index, rng = random_index(seed)
+    checked = 0
+    for _ in range(60):
+        query = " ".join(rng.choice(WORDS + ["unknown"], size=rng.integers(1, 6)))
+        k = int(rng.choice([1, 3, 10, 50, 1000]))
+        allowed = rng.random(index.size) < 0.6 if rng.random() < 0.5 else None
+
+        expected_ids, expected_scores = exhaustive_top_k(index, query, k, allowed)
+        ids, scores = index.top_k(query, k, allowed)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-12, atol=1e-12, err_msg=query)
+        assert ids.tolist() == expected_ids.tolist(), (query, k)
+        checked += k > len(ids) > 0
+    # k above the number of matching cards comes up
+    assert checked
+
+
+def test_top_k_edge_cases():
+    index = KeywordIndex([(1.0, ["lounge access", "lounge lounge", "cash back", "", "lounge access"])])
+    ids, scores = index.top_k("lounge", 10)
+    # Fewer than k matches, and the two identical cards tie in card id order
+    assert ids.tolist() == [1, 0, 4]
+    assert scores[1] == scores[2]
+    ids, scores = index.top_k("lounge", 1)
+    assert ids.tolist() == [1]
+    assert index.top_k("nothing matches", 5)[0].tolist() == []
+    assert index.top_k("lounge", 5, np.zeros(5, dtype=bool))[0].tolist() == []
+    assert index.top_k("lounge access", 2, np.array([True, False, True, True, True]))[0].tolist() == [0, 4]
+
+
+def test_candidates_narrow_to_top_k():
+    index, rng = random_index(7)
+    queries = ["travel miles lounge", "unknown words only", "cash back grocery"]
+    narrowed, scores = index.candidates(queries, 10)
+    for row, query in enumerate(queries):
+        ids, top_scores = index.top_k(query, 10)
+        if len(ids):
+            assert np.flatnonzero(narrowed[row]).tolist() == sorted(ids.tolist())
+            np.testing.assert_array_equal(scores[row, ids], top_scores)
+        else:
+            # A query without an indexed term keeps every card
+            assert narrowed[row].all() and not scores[row].any()
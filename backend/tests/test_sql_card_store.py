@@ -0,0 +1,142 @@
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from helpers import columnar, model_store
+from helpers.card_store import MemoryCardStore
+from helpers.card_table import CardTable
+from helpers.review_index import ReviewIndex
+from helpers.sql_card_store import RANKING_KEYS, SQLCardStore, SQLReviewList, meta_table
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return columnar.load_dataset(model_store.DEFAULT_DATASET_PATH)
+
+
+@pytest.fixture
+def store(dataset):
+    data, sha = dataset
+    store = SQLCardStore.from_url("sqlite://")
+    store.write([dict(card) for card in data], sha)
+    yield store
+    store.handler.dispose()
+
+
+def snapshot_of(data, sha):
+    """The parts of a CatalogSnapshot the hard filters read"""
+    return SimpleNamespace(card_table=CardTable(data), issuers=[card.get("issuer", "") for card in data],
+                           size=len(data), dataset_sha=sha)
+
+
+def materialized(record):
+    card = dict(record)
+    if "user_reviews" in card:
+        card["user_reviews"] = list(card["user_reviews"])
+    return card
+
+
+def test_load_round_trips_the_catalogue(store, dataset):
+    data, sha = dataset
+    records, loaded_sha = SQLCardStore(store.handler).load()
+    assert loaded_sha == sha
+    assert len(records) == len(data)
+    assert [materialized(record) for record in records] == data
+    assert records[-1] is records[len(data) - 1]
+
+
+def test_only_ranking_keys_are_held_in_memory(store, dataset):
+    data, _ = dataset
+    records, _ = store.load()
+    for fields, card in zip(records.fields, data):
+        assert set(fields) == (set(card) & RANKING_KEYS) | {"user_reviews"}
+        assert isinstance(fields["user_reviews"], SQLReviewList)
+        assert len(fields["user_reviews"]) == len(card["user_reviews"])
+    for key in ["name", "associated_airlines", "image_url", "no_such_key"]:
+        assert columnar.field(records, key, "") == columnar.field(data, key, "")
+
+    # Display fields and review texts are read by card name, and cached
+    store.record.cache_clear()
+    card = records[5]
+    assert card["image_url"] == data[5]["image_url"]
+    assert card.get("no_such_key", "x") == "x"
+    assert store.record.cache_info().misses == 1
+    assert card.get("reward_rate_string_2018") == data[5].get("reward_rate_string_2018")
+    assert store.record.cache_info().misses == 1
+    assert list(card["user_reviews"]) == data[5]["user_reviews"]
+    assert card["user_reviews"][-1] == data[5]["user_reviews"][-1]
+    assert store.reviews.cache_info().misses == 1
+
+
+def test_review_index_reads_texts_from_the_database(store, dataset):
+    data, _ = dataset
+    records, _ = store.load()
+    reviews = columnar.field(records, "user_reviews", [])
+    n = sum(len(card["user_reviews"]) for card in data)
+    index = ReviewIndex(reviews, np.zeros((n, 2)), [None] * n)
+    parsed = ReviewIndex(model_store.card_reviews(data), np.zeros((n, 2)), [None] * n)
+    np.testing.assert_array_equal(index.offsets, parsed.offsets)
+    assert [index.texts[j] for j in range(len(index))] == parsed.texts
+
+
+def test_rewritten_database_is_detected(store, dataset):
+    data, sha = dataset
+    records, _ = store.load()
+    # Another process replaces the catalogue
+    SQLCardStore(store.handler).write([dict(card) for card in data[1:]], "other")
+    with pytest.raises(RuntimeError):
+        records[0]["image_url"]
+
+    # Loading again picks up the new catalogue, and a worker's own write keeps
+    # its records readable (they are read by card name, not id)
+    records, _ = store.load()
+    assert materialized(records[0]) == data[1]
+    edited = list(records)[1:]
+    store.write(edited, sha)
+    assert [materialized(card) for card in edited] == data[2:]
+
+
+LIMITS = {
+    "min_credit_score": [None, 300, 650, 700, 750],
+    "max_annual_fee": [None, 0, 95, 250],
+    "issuer": [None, "Chase", "American Express", "No Such Bank"],
+    "category": [None, "travel", "Cash_Back", "hotel"],
+}
+
+
+def test_pushed_down_filters_match_the_memory_store(store, dataset):
+    data, sha = dataset
+    snapshot = snapshot_of(data, sha)
+    memory = MemoryCardStore(model_store.DEFAULT_DATASET_PATH)
+    filtered = 0
+    for values in itertools.product(*LIMITS.values()):
+        limits = dict(zip(LIMITS, values))
+        expected = memory.candidate_mask(snapshot, **limits)
+        np.testing.assert_array_equal(store.candidate_mask(snapshot, **limits), expected, err_msg=str(limits))
+        np.testing.assert_array_equal(store.candidate_ids(**limits), np.flatnonzero(expected))
+        filtered += 0 < expected.sum() < len(data)
+    # The combinations actually narrow the catalogue, rather than all passing or all failing
+    assert filtered > 50
+
+
+def test_edited_snapshots_are_filtered_in_memory(store, dataset):
+    data, sha = dataset
+    # A snapshot that no longer matches the database, e.g. after runtime edits
+    edited = [dict(card) for card in data[:-1]]
+    snapshot = snapshot_of(edited, None)
+    mask = store.candidate_mask(snapshot, max_annual_fee=0)
+    assert mask.shape == (len(edited),)
+    np.testing.assert_array_equal(mask, snapshot.card_table.annual_fee == 0)
+
+
+def test_missing_meta_row(store, dataset):
+    data, sha = dataset
+    with store.handler.transaction() as conn:
+        conn.execute(meta_table.delete())
+    records, loaded_sha = store.load()
+    assert loaded_sha is None
+    assert len(records) == len(data)
+    # Records stay readable, with nothing to compare the database against
+    assert records[0]["image_url"] == data[0]["image_url"]